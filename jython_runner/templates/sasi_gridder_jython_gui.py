@@ -1,8 +1,9 @@
 from sasi_gridder.sasi_gridder_task import SASIGridderTask
+from sasi_gridder.progress import format_progress
 from javax.swing import (
     JPanel, JScrollPane, JTextArea, JFrame, JFileChooser, JButton, 
     WindowConstants, JLabel, BoxLayout, JTextField, SpringLayout,
-    JProgressBar, SwingConstants
+    JProgressBar, SwingConstants, SwingUtilities
 )
 from javax.swing.filechooser import FileNameExtensionFilter
 from javax.swing.border import EmptyBorder
@@ -114,9 +115,12 @@ class JythonGui(object):
         SpringUtilities.makeCompactGrid(
             self.top_panel, self.stageCounter - 1, 2, 6, 6, 6, 6)
 
-        # Progress bar.
+        # Progress bar, and progress of the current stage.
         self.progressBar = JProgressBar(0, 100)
         self.main_panel.add(self.progressBar)
+        self.progressLabel = JLabel(" ")
+        self.progressLabel.alignmentX = Component.CENTER_ALIGNMENT
+        self.main_panel.add(self.progressLabel)
 
         # Log panel.
         self.log_panel = JPanel()
@@ -148,6 +152,14 @@ class JythonGui(object):
         browseURI(self.instructionsURI)
         return
 
+    def show_progress(self, update):
+        """ Show a task progress update. Updates come from the task's
+        thread, so the widgets are updated on the Swing thread. """
+        def update_widgets():
+            self.progressBar.setValue(int(update.progress))
+            self.progressLabel.setText(format_progress(update))
+        SwingUtilities.invokeLater(update_widgets)
+
     def log_msg(self, msg):
         self.log.append(msg + "\n")
         self.log.setCaretPosition(self.log.getDocument().getLength())
@@ -176,7 +188,6 @@ class JythonGui(object):
         def run_task():
 
             self.progressBar.setValue(0)
-            self.progressBar.setIndeterminate(True)
 
             try:
                 input_dir = self.selected_input_file.path
@@ -208,13 +219,15 @@ class JythonGui(object):
                     logger=self.logger,
                     gear_mappings=gear_mappings,
                     effort_limit=None,
+                    progress_listeners=[self.show_progress],
                 )
                 task.call()
             except Exception as e:
                 self.logger.exception("Could not complete task")
 
-            self.progressBar.setIndeterminate(False)
-            self.progressBar.setValue(100)
+            def finish():
+                self.progressBar.setValue(100)
+            SwingUtilities.invokeLater(finish)
 
         Thread(target=run_task).start()
 
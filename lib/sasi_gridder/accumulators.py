@@ -0,0 +1,170 @@
+"""
+Dense accumulators for gridded effort values.
+"""
+
+from array import array
+from itertools import imap
+from operator import mul
+
+
+class KeyIndex(object):
+    """ Interns hashable keys (effort keys, cell ids...) as dense ints. """
+
+    def __init__(self, keys=()):
+        self.keys = []
+        self.idxs = {}
+        for key in keys:
+            self.intern(key)
+
+    def intern(self, key):
+        idx = self.idxs.get(key)
+        if idx is None:
+            idx = self.idxs[key] = len(self.keys)
+            self.keys.append(key)
+        return idx
+
+    def get(self, key, default=None):
+        return self.idxs.get(key, default)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        return key in self.idxs
+
+class Accumulator(object):
+    """
+    Sums of value attrs per (item, effort key).
+
+    Values are held in one array('d') block per item, in which the value
+    for effort key k and value attr a is at k * num_attrs + a. Blocks
+    are created when an item first gets values, and grow as new effort
+    keys are interned.
+
+    Effort keys are interned in a KeyIndex which can be shared between
+    accumulators, so that their blocks line up.
+    """
+
+    def __init__(self, value_attrs, effort_keys=None, items=None):
+        self.value_attrs = list(value_attrs)
+        self.num_attrs = len(self.value_attrs)
+        if effort_keys is None:
+            effort_keys = KeyIndex()
+        self.effort_keys = effort_keys
+        if items is None:
+            items = KeyIndex()
+        self.items = items
+        self.blocks = [None] * len(self.items)
+
+    @property
+    def block_size(self):
+        return len(self.effort_keys) * self.num_attrs
+
+    def get_item_idx(self, item_id):
+        idx = self.items.intern(item_id)
+        if idx == len(self.blocks):
+            self.blocks.append(None)
+        return idx
+
+    def get_block(self, item_idx, create=True):
+        """
+        Get an item's block, padded to the current number of effort keys.
+        Returns None for items without values if create is False.
+        """
+        block = self.blocks[item_idx]
+        block_size = self.block_size
+        if block is None:
+            if not create:
+                return None
+            block = self.blocks[item_idx] = array('d', [0.0]) * block_size
+        elif len(block) < block_size:
+            block.extend(array('d', [0.0]) * (block_size - len(block)))
+        return block
+
+    def pad(self):
+        """ Pad all existing blocks to the current number of effort keys. """
+        for item_idx in range(len(self.blocks)):
+            if self.blocks[item_idx] is not None:
+                self.get_block(item_idx)
+
+    def add(self, item_id, effort_key, values):
+        """ Add a sequence of values, in value_attrs order. """
+        offset = self.effort_keys.intern(effort_key) * self.num_attrs
+        block = self.get_block(self.get_item_idx(item_id))
+        for a in range(self.num_attrs):
+            block[offset + a] += values[a]
+
+    def add_block(self, item_idx, delta):
+        """ Add a block of values to an item's block. """
+        block = self.get_block(item_idx)
+        for j in range(len(delta)):
+            block[j] += delta[j]
+
+    def merge(self, other):
+        """
+        Add another accumulator's values into this one. The other
+        accumulator's effort keys and items are interned here, so it
+        doesn't need to share key indexes with this one.
+        """
+        num_attrs = self.num_attrs
+        key_offsets = [self.effort_keys.intern(effort_key) * num_attrs
+                       for effort_key in other.effort_keys.keys]
+        for item_id, block in zip(other.items.keys, other.blocks):
+            if block is None:
+                continue
+            target = self.get_block(self.get_item_idx(item_id))
+            for k in range(len(block) / num_attrs):
+                src = k * num_attrs
+                dst = key_offsets[k]
+                for a in range(num_attrs):
+                    target[dst + a] += block[src + a]
+
+    def get_totals(self):
+        """ Get a block of totals across all items. """
+        totals = array('d', [0.0]) * self.block_size
+        for block in self.blocks:
+            if block is None:
+                continue
+            for j in range(len(block)):
+                totals[j] += block[j]
+        return totals
+
+    def scale(self, factors):
+        """ Multiply every block elementwise by a block of factors. """
+        self.pad()
+        for item_idx, block in enumerate(self.blocks):
+            if block is not None:
+                self.blocks[item_idx] = array('d', imap(mul, block, factors))
+
+    def get_keyed_values(self, item_id):
+        """ Get an item's values as a dict of {effort_key: {attr: value}}. """
+        keyed_values = {}
+        item_idx = self.items.get(item_id)
+        if item_idx is None or self.blocks[item_idx] is None:
+            return keyed_values
+        block = self.blocks[item_idx]
+        for k in range(len(block) / self.num_attrs):
+            offset = k * self.num_attrs
+            keyed_values[self.effort_keys.keys[k]] = dict(zip(
+                self.value_attrs, block[offset:offset + self.num_attrs]))
+        return keyed_values
+
+    def iter_values(self, sparse=False):
+        """
+        Iterate over (item_id, effort_key, values) for all items. If
+        sparse, effort keys whose values are all zero are skipped.
+        """
+        num_attrs = self.num_attrs
+        effort_keys = self.effort_keys.keys
+        for item_id, block in zip(self.items.keys, self.blocks):
+            if block is None:
+                continue
+            for k in range(len(block) / num_attrs):
+                offset = k * num_attrs
+                values = block[offset:offset + num_attrs]
+                if sparse and not any(values):
+                    continue
+                yield item_id, effort_keys[k], values
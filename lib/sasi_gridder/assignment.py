@@ -0,0 +1,67 @@
+"""
+Batched assignment of effort positions to the items (e.g. cells) which
+contain them.
+"""
+
+from itertools import izip
+
+
+class PointAssigner(object):
+    """
+    Assigns chunks of positions to the items which contain them.
+
+    Items need 'id', 'prepared' and 'area' attributes, where 'prepared'
+    is a geometry.PreparedShape. Candidate items for a position are taken
+    from an index which provides 'items_for_point', such as a
+    SpatialHash. If the index can also locate items exactly, via
+    'item_for_point' (e.g. a RegularLattice), candidates are not tested
+    against item shapes.
+
+    If items overlap, a position is assigned to the smallest item which
+    contains it, so that results don't depend on the index's ordering.
+    """
+
+    def __init__(self, index, unassigned_id=-1):
+        self.index = index
+        self.unassigned_id = unassigned_id
+        self.locate = getattr(index, 'item_for_point', None)
+
+    def item_for_pos(self, x, y):
+        """ Get the smallest candidate item which contains the point. """
+        if self.locate is not None:
+            return self.locate((x, y))
+        found = None
+        for candidate in self.index.items_for_point((x, y)):
+            if candidate.prepared.contains_point(x, y):
+                if found is None or candidate.area < found.area:
+                    found = candidate
+        return found
+
+    def assign(self, lats, lons):
+        """
+        Get the ids of the items containing each (lat, lon) position,
+        or unassigned_id for positions which are missing or not in any
+        item.
+        """
+        unassigned_id = self.unassigned_id
+        item_for_pos = self.item_for_pos
+        ids = []
+        append = ids.append
+        # Reported positions often repeat in runs, so remember the
+        # last result.
+        last_pos = None
+        last_id = unassigned_id
+        for pos in izip(lats, lons):
+            if pos != last_pos:
+                last_pos = pos
+                lat, lon = pos
+                if lat is None or lon is None:
+                    last_id = unassigned_id
+                else:
+                    item = item_for_pos(lon, lat)
+                    if item is None:
+                        last_id = unassigned_id
+                    else:
+                        last_id = item.id
+            append(last_id)
+        return ids
@@ -0,0 +1,161 @@
+"""
+Batch gridding: many jobs against one grid and one set of stat areas.
+
+Cells, stat areas, their spatial indexes and their overlay are ingested
+once, and shared by every job. Jobs differ in their raw efforts, gear
+mappings and other task options. Each job runs its own first pass and
+distributions, and writes its own output file.
+
+Manifests are JSON files like:
+
+    {
+        "grid_path": "grid/grid.shp",
+        "stat_areas_path": "stat_areas/stat_areas.shp",
+        "defaults": {"workers": 4},
+        "jobs": [
+            {
+                "name": "otter_2010",
+                "raw_efforts_path": ["efforts/2010.csv"],
+                "gear_mappings_file": "mappings/otter.csv",
+                "output_path": "output/otter_2010.csv"
+            }
+        ]
+    }
+
+Job entries, over the defaults, are SASIGridderTask options, except for
+'name', and 'gear_mappings_file', a CSV file of trip_type and gear_code
+columns. Relative paths are relative to the manifest's directory.
+"""
+
+from sasi_gridder.sasi_gridder_task import SASIGridderTask
+import csv
+import json
+import logging
+import os
+
+
+# Manifest and job entries which are paths.
+PATH_KEYS = ['grid_path', 'stat_areas_path', 'raw_efforts_path',
+             'gear_mappings_file', 'output_path', 'state_path',
+             'resume_dir', 'cache_dir']
+
+def read_gear_mappings(path):
+    """ Read trip type to gear code mappings from a CSV file. """
+    gear_mappings = {}
+    with open(path, 'rb') as f:
+        for mapping in csv.DictReader(f):
+            gear_mappings[mapping['trip_type']] = mapping['gear_code']
+    return gear_mappings
+
+def resolve_paths(entries, base_dir):
+    """ Make an entry dict's relative paths relative to base_dir. """
+    entries = dict(entries)
+    for key in PATH_KEYS:
+        value = entries.get(key)
+        if isinstance(value, basestring):
+            entries[key] = os.path.join(base_dir, value)
+        elif isinstance(value, list):
+            entries[key] = [os.path.join(base_dir, path) for path in value]
+    return entries
+
+def load_manifest(path):
+    """ Load a batch manifest, with its paths resolved. """
+    with open(path) as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    manifest = resolve_paths(manifest, base_dir)
+    manifest['defaults'] = resolve_paths(manifest.get('defaults', {}),
+                                         base_dir)
+    manifest['jobs'] = [resolve_paths(job, base_dir)
+                        for job in manifest.get('jobs', [])]
+    for i, job in enumerate(manifest['jobs']):
+        job.setdefault('name', "job_%s" % (i + 1))
+    return manifest
+
+class BatchGridder(object):
+    """
+    Runs gridding jobs against a shared grid and stat areas. defaults
+    are task options for every job, which jobs can override. Options
+    which affect ingest, such as cache_dir or spatial_index, should only
+    be given as defaults.
+    """
+
+    def __init__(self, grid_path, stat_areas_path, logger=None, **defaults):
+        self.grid_path = grid_path
+        self.stat_areas_path = stat_areas_path
+        if logger is None:
+            logger = logging.getLogger('sasi_gridder_batch')
+        self.logger = logger
+        self.defaults = defaults
+        self.geometry = None
+        self.gear_mappings = {}
+        # Shapefile hashes, shared by jobs' tasks for their checkpoint
+        # fingerprints, so the shapefiles are only hashed once.
+        self.shapefile_hashes = {}
+
+    def get_task(self, job):
+        kwargs = dict(self.defaults)
+        kwargs.update(job)
+        kwargs.pop('name', None)
+        mappings_file = kwargs.pop('gear_mappings_file', None)
+        if mappings_file:
+            if mappings_file not in self.gear_mappings:
+                self.gear_mappings[mappings_file] = read_gear_mappings(
+                    mappings_file)
+            kwargs['gear_mappings'] = self.gear_mappings[mappings_file]
+        # The task's default data dict is shared between instances, so
+        # each job gets its own.
+        return SASIGridderTask(grid_path=self.grid_path,
+                               stat_areas_path=self.stat_areas_path,
+                               logger=self.logger, geometry=self.geometry,
+                               shapefile_hashes=self.shapefile_hashes,
+                               data={}, **kwargs)
+
+    def load_geometry(self):
+        """ Ingest the cells and stat areas, and overlay them. """
+        self.logger.info("Loading shared cells and stat_areas...")
+        task = self.get_task({})
+        try:
+            task.stage_ingest()
+            self.geometry = task.get_geometry()
+        finally:
+            task.release_loggers()
+        return self.geometry
+
+    def run_job(self, job):
+        """
+        Run a job, a dict of task options and a name. Returns a dict of
+        the job's name, status ('resolved' or 'failed'), output file,
+        metrics and error message.
+        """
+        if self.geometry is None:
+            self.load_geometry()
+        result = {'name': job['name'], 'status': 'failed',
+                  'output_file': None, 'metrics': None, 'error': None}
+        self.logger.info("Running job '%s'..." % job['name'])
+        task = None
+        try:
+            task = self.get_task(job)
+            task.call()
+            result['status'] = task.status
+            result['output_file'] = task.data.get('output_file')
+            result['metrics'] = task.data.get('metrics')
+        except Exception as e:
+            self.logger.exception("Job '%s' failed" % job['name'])
+            result['error'] = str(e)
+        finally:
+            if task is not None:
+                task.release_loggers()
+        return result
+
+    def run(self, jobs):
+        """ Run jobs in order. A failed job doesn't stop later jobs.
+        Returns the jobs' results. """
+        results = []
+        for job in jobs:
+            results.append(self.run_job(job))
+        num_failed = len([result for result in results
+                          if result['status'] != 'resolved'])
+        self.logger.info("Batch completed: %s jobs, %s failed" % (
+            len(results), num_failed))
+        return results
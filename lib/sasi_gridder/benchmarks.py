@@ -0,0 +1,274 @@
+"""
+Synthetic benchmarks for the gridder.
+
+Benchmark cases generate a regular grid of square cells, a layout of stat
+areas whose edges crack cells, and raw efforts with set fractions of
+clean (positioned), stat-area-only and unassigned efforts. Each case is
+gridded with SASIGridderTask, and the task's per-stage metrics are kept
+as the case's results.
+
+Results can be saved as JSON baselines, and later results compared with
+a baseline to find stages which got slower.
+"""
+
+from sasi_gridder.sasi_gridder_task import SASIGridderTask
+from sasi_data.util import data_generators as dg
+import sasi_data.util.shapefile as shapefile_util
+
+import csv
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+
+# Domain that grids cover, as (x0, y0, x1, y1) in degrees.
+BENCHMARK_DOMAIN = (-75.0, 35.0, -65.0, 45.0)
+
+# Trip types of generated efforts, as in the task's default gear mappings.
+BENCHMARK_TRIP_TYPES = ['hy_drg', 'otter', 'sca-gc', 'sca-la', 'shrimp',
+                        'squid', 'raised', 'trap', 'gillne', 'longli']
+
+class BenchmarkCase(object):
+    """
+    Parameters of a synthetic benchmark. clean_fraction of efforts have
+    positions in the grid domain, stat_area_fraction only have stat
+    areas, and the rest can't be assigned to either.
+    """
+
+    def __init__(self, name, num_cells, num_efforts, num_stat_areas=100,
+                 clean_fraction=.6, stat_area_fraction=.3, num_years=5,
+                 seed=0):
+        self.name = name
+        self.num_cells = num_cells
+        self.num_efforts = num_efforts
+        self.num_stat_areas = num_stat_areas
+        self.clean_fraction = clean_fraction
+        self.stat_area_fraction = stat_area_fraction
+        self.num_years = num_years
+        self.seed = seed
+
+    def get_params(self):
+        return dict(self.__dict__)
+
+    def get_data_key(self):
+        """ Key of the case's generated data, so cases with the same
+        parameters can share it. """
+        return "%s_c%s_e%s_sa%s_f%s_%s_y%s_s%s" % (
+            self.name, self.num_cells, self.num_efforts,
+            self.num_stat_areas, self.clean_fraction,
+            self.stat_area_fraction, self.num_years, self.seed)
+
+# Standard cases, from quick checks up to production scale.
+BENCHMARK_CASES = dict([(case.name, case) for case in [
+    BenchmarkCase('tiny', num_cells=1000, num_efforts=10000),
+    BenchmarkCase('small', num_cells=10000, num_efforts=100000),
+    BenchmarkCase('medium', num_cells=100000, num_efforts=1000000),
+    BenchmarkCase('large', num_cells=1000000, num_efforts=10000000),
+    BenchmarkCase('xlarge', num_cells=1000000, num_efforts=50000000),
+]])
+
+def get_grid_shape(num_cells):
+    """ Get the (cols, rows) of a near-square grid of num_cells cells. """
+    cols = int(math.ceil(math.sqrt(num_cells)))
+    rows = int(math.ceil(num_cells / float(cols)))
+    return cols, rows
+
+def write_shapefile(shpfile, id_field, polygons, crs='EPSG:4326'):
+    """ Write polygons, as (id, (x0, y0, x1, y1)) tuples, to a
+    shapefile. """
+    schema = {
+        'geometry': 'MultiPolygon',
+        'properties': {
+            id_field: 'int'
+        }
+    }
+    w = shapefile_util.get_shapefile_writer(shapefile=shpfile, crs=crs,
+                                            schema=schema)
+    for polygon_id, (x0, y0, x1, y1) in polygons:
+        w.write({
+            'id': polygon_id,
+            'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[dg.generate_polygon_coords(
+                    x0=x0, x1=x1, y0=y0, y1=y1)]]
+            },
+            'properties': {
+                id_field: polygon_id
+            }
+        })
+    w.close()
+    return shpfile
+
+def generate_grid(shpfile, num_cells, domain=BENCHMARK_DOMAIN):
+    """ Generate a grid of square cells covering the domain. """
+    cols, rows = get_grid_shape(num_cells)
+    x0, y0, x1, y1 = domain
+    dx = (x1 - x0) / cols
+    dy = (y1 - y0) / rows
+    def iter_cells():
+        for i in xrange(num_cells):
+            col = i % cols
+            row = i / cols
+            yield (i + 1, (x0 + col * dx, y0 + row * dy,
+                           x0 + (col + 1) * dx, y0 + (row + 1) * dy))
+    return write_shapefile(shpfile, 'ID', iter_cells())
+
+def generate_stat_areas(shpfile, num_stat_areas, num_cells,
+                        domain=BENCHMARK_DOMAIN):
+    """
+    Generate a lattice of stat areas covering the domain. Inner edges are
+    offset by a third of a cell from cell edges, so that stat areas
+    crack the cells along their edges.
+    """
+    sa_cols, sa_rows = get_grid_shape(num_stat_areas)
+    cols, rows = get_grid_shape(num_cells)
+    x0, y0, x1, y1 = domain
+    def get_edges(start, end, num_areas, num_cells):
+        offset = (end - start) / num_cells / 3.0
+        size = (end - start) / num_areas
+        edges = [start + i * size + offset for i in range(num_areas + 1)]
+        edges[0] = start
+        edges[-1] = end
+        return edges
+    xs = get_edges(x0, x1, sa_cols, cols)
+    ys = get_edges(y0, y1, sa_rows, rows)
+    stat_areas = []
+    for i in range(num_stat_areas):
+        col = i % sa_cols
+        row = i / sa_cols
+        stat_areas.append(
+            (i + 1, (xs[col], ys[row], xs[col + 1], ys[row + 1])))
+    return write_shapefile(shpfile, 'SAREA', stat_areas)
+
+def generate_raw_efforts(csv_path, case, domain=BENCHMARK_DOMAIN):
+    """ Generate a case's raw efforts CSV. """
+    rand = random.Random(case.seed)
+    x0, y0, x1, y1 = domain
+    fields = ['nemarea', 'trip_type', 'A', 'hours_fished', 'value',
+              'year', 'lat', 'lon']
+    years = range(2000, 2000 + case.num_years)
+    stat_area_cutoff = case.clean_fraction + case.stat_area_fraction
+    with open(csv_path, 'wb') as f:
+        w = csv.writer(f)
+        w.writerow(fields)
+        for i in xrange(case.num_efforts):
+            kind = rand.random()
+            if kind < case.clean_fraction:
+                nemarea = ''
+                lat = rand.uniform(y0, y1)
+                lon = rand.uniform(x0, x1)
+            elif kind < stat_area_cutoff:
+                nemarea = rand.randint(1, case.num_stat_areas)
+                lat = lon = ''
+            else:
+                nemarea = lat = lon = ''
+            w.writerow([nemarea, rand.choice(BENCHMARK_TRIP_TYPES),
+                        rand.randint(1, 100), rand.random() * 24,
+                        rand.random() * 1000, rand.choice(years), lat, lon])
+    return csv_path
+
+def generate_case_data(case, data_dir):
+    """
+    Generate a case's grid, stat areas and raw efforts in a subdir of
+    data_dir, unless they were generated before. Returns a dict of
+    their paths.
+    """
+    case_dir = os.path.join(data_dir, case.get_data_key())
+    paths = {
+        'grid_path': os.path.join(case_dir, 'grid.shp'),
+        'stat_areas_path': os.path.join(case_dir, 'stat_areas.shp'),
+        'raw_efforts_path': os.path.join(case_dir, 'raw_efforts.csv'),
+    }
+    done_path = os.path.join(case_dir, 'done')
+    if os.path.exists(done_path):
+        return paths
+    if os.path.exists(case_dir):
+        shutil.rmtree(case_dir)
+    os.makedirs(case_dir)
+    generate_grid(paths['grid_path'], case.num_cells)
+    generate_stat_areas(paths['stat_areas_path'], case.num_stat_areas,
+                        case.num_cells)
+    generate_raw_efforts(paths['raw_efforts_path'], case)
+    open(done_path, 'w').close()
+    return paths
+
+def run_benchmark(case, data_dir, logger=None, **task_kwargs):
+    """
+    Grid a case's data, generating it first if needed. task_kwargs are
+    passed on to the task, e.g. workers or tile_size. Returns the
+    case's results.
+    """
+    if logger is None:
+        logger = logging.getLogger('sasi_gridder_benchmarks')
+    start = time.time()
+    paths = generate_case_data(case, data_dir)
+    generate_time = time.time() - start
+
+    output_dir = tempfile.mkdtemp(prefix="gridderBenchmark.")
+    try:
+        kwargs = dict(paths)
+        kwargs.update(task_kwargs)
+        # Cached geometry would hide ingest times.
+        kwargs.setdefault('use_cache', False)
+        task = SASIGridderTask(
+            logger=logger,
+            output_path=os.path.join(output_dir, 'output.csv'),
+            **kwargs)
+        task.call()
+    finally:
+        shutil.rmtree(output_dir)
+
+    return {
+        'case': case.get_params(),
+        'task_options': dict(task_kwargs),
+        'generate_time': generate_time,
+        'metrics': task.data['metrics'],
+        'platform': {
+            'system': platform.system(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+    }
+
+def save_results(path, results):
+    """ Save a list of case results as a JSON baseline. """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare_results(results, baseline, tolerance=.2, min_time=.5):
+    """
+    Compare results with baseline results of the same cases. Returns a
+    list of (case name, stage, baseline wall time, wall time) for stages
+    which took more than tolerance longer than in the baseline. Stages
+    which took less than min_time seconds in both are too noisy to
+    compare, and are skipped.
+    """
+    baseline_stages = {}
+    for result in baseline:
+        for stage_metrics in result['metrics']['stages']:
+            baseline_stages[(result['case']['name'],
+                             stage_metrics['stage'])] = \
+                    stage_metrics['wall_time']
+    regressions = []
+    for result in results:
+        for stage_metrics in result['metrics']['stages']:
+            key = (result['case']['name'], stage_metrics['stage'])
+            if key not in baseline_stages:
+                continue
+            baseline_time = baseline_stages[key]
+            wall_time = stage_metrics['wall_time']
+            if max(baseline_time, wall_time) < min_time:
+                continue
+            if wall_time > baseline_time * (1 + tolerance):
+                regressions.append(key + (baseline_time, wall_time))
+    return regressions
@@ -0,0 +1,99 @@
+"""
+On-disk caches for data derived from input files.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+
+
+# Files which make up a shapefile.
+SHAPEFILE_EXTENSIONS = ['.shp', '.shx', '.dbf', '.prj']
+
+def get_file_hash(path, block_size=2**20):
+    """ Get the SHA1 hex digest of a file's contents. """
+    sha1 = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    finally:
+        f.close()
+    return sha1.hexdigest()
+
+def get_file_signature(path):
+    """ Cheap stand-in for a file's hash: its path, size and mtime. """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+def get_shapefile_hash(shp_path):
+    """ Get a hash of the contents of a shapefile's component files. """
+    base_path = os.path.splitext(shp_path)[0]
+    sha1 = hashlib.sha1()
+    for ext in SHAPEFILE_EXTENSIONS:
+        path = base_path + ext
+        if os.path.exists(path):
+            sha1.update(ext)
+            sha1.update(get_file_hash(path))
+    return sha1.hexdigest()
+
+def get_cache_key(*parts):
+    """ Combine parts (hashes, CRS names, versions...) into one key. """
+    return hashlib.sha1('|'.join([str(part) for part in parts])).hexdigest()
+
+def get_default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), 'sasi_gridder_cache')
+
+class FileCache(object):
+    """
+    Values stored in a directory, by name and key. Values are pickled,
+    unless written with a custom write function.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_default_cache_dir()
+
+    def get_path(self, name, key, ext='pickle'):
+        return os.path.join(self.cache_dir, "%s.%s.%s" % (name, key, ext))
+
+    def load(self, name, key):
+        """ Get a cached value, or None if not cached or unreadable. """
+        path = self.get_path(name, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            f = open(path, 'rb')
+            try:
+                return pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, name, key, value):
+        return self.write(
+            name, key,
+            lambda f: pickle.dump(value, f, pickle.HIGHEST_PROTOCOL))
+
+    def write(self, name, key, write_func, ext='pickle'):
+        """ Write a cache file by calling write_func with an open file. """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self.get_path(name, key, ext=ext)
+        # Write to a temp file first, so that readers never see
+        # partially written values.
+        hndl, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                          prefix=os.path.basename(path))
+        f = os.fdopen(hndl, 'wb')
+        try:
+            write_func(f)
+        finally:
+            f.close()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+        return path
@@ -0,0 +1,168 @@
+"""
+Binary columnar output: gridded rows as typed columns, in one file.
+
+Distinct cell ids and effort keys are stored once, and rows refer to
+them by index. Each value attr is a column of doubles. Files are read
+through a memory map where the platform has one, so opening a file only
+reads its header, and columns are read as they are asked for.
+"""
+
+from array import array
+from sasi_gridder.accumulators import KeyIndex
+from sasi_gridder.output import RowBatch
+import cPickle as pickle
+import struct
+import sys
+
+try:
+    import mmap
+except ImportError:
+    # Not available under Jython.
+    mmap = None
+
+
+COLUMNAR_VERSION = 1
+
+_MAGIC = 'SGCOLS'
+
+# Magic, version, byte order, number of rows, and the length of the
+# pickled metadata.
+_HEADER = struct.Struct('<6sIBII')
+
+_INDEX_TYPE = 'i'
+_VALUE_TYPE = 'd'
+
+def write_columnar(path, key_fields, value_fields, rows):
+    """
+    Write gridded rows to a columnar file. Rows are collected into
+    columns, which are then written in bulk. Returns the number of rows.
+    """
+    num_keys = len(key_fields)
+    cell_ids = KeyIndex()
+    effort_keys = KeyIndex()
+    cell_idxs = array(_INDEX_TYPE)
+    key_idxs = array(_INDEX_TYPE)
+    value_columns = [array(_VALUE_TYPE) for field in value_fields]
+    for row in rows:
+        cell_idxs.append(cell_ids.intern(row[0]))
+        key_idxs.append(effort_keys.intern(tuple(row[1:num_keys + 1])))
+        for column, value in zip(value_columns, row[num_keys + 1:]):
+            column.append(value)
+
+    metadata = pickle.dumps({
+        'key_fields': list(key_fields),
+        'value_fields': list(value_fields),
+        'cell_ids': cell_ids.keys,
+        'effort_keys': effort_keys.keys,
+    }, pickle.HIGHEST_PROTOCOL)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, COLUMNAR_VERSION,
+                             sys.byteorder == 'little', len(cell_idxs),
+                             len(metadata)))
+        f.write(metadata)
+        for section in [cell_idxs, key_idxs] + value_columns:
+            section.tofile(f)
+    return len(cell_idxs)
+
+class ColumnarOutput(object):
+    """
+    Reader for a columnar output file. Raises ValueError if the file is
+    not a columnar file this version can read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            if mmap is not None:
+                self.buffer = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            else:
+                self.buffer = f.read()
+        finally:
+            f.close()
+
+        if len(self.buffer) < _HEADER.size:
+            raise ValueError("'%s' is not a columnar file" % path)
+        (magic, version, little_endian, num_rows,
+         metadata_size) = _HEADER.unpack(self.buffer[:_HEADER.size])
+        if magic != _MAGIC or version != COLUMNAR_VERSION \
+           or bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError("'%s' is not a readable columnar file" % path)
+
+        pos = _HEADER.size
+        metadata = pickle.loads(self.buffer[pos:pos + metadata_size])
+        pos += metadata_size
+        self.num_rows = num_rows
+        self.key_fields = metadata['key_fields']
+        self.value_fields = metadata['value_fields']
+        self.cell_ids = metadata['cell_ids']
+        self.effort_keys = metadata['effort_keys']
+        self.fields = ['cell_id'] + self.key_fields + self.value_fields
+
+        # Section byte offsets, typecodes and item sizes.
+        self.sections = {}
+        index_size = array(_INDEX_TYPE).itemsize
+        value_size = array(_VALUE_TYPE).itemsize
+        for name, typecode, item_size in [
+            ('cell_idxs', _INDEX_TYPE, index_size),
+            ('key_idxs', _INDEX_TYPE, index_size),
+        ] + [(field, _VALUE_TYPE, value_size) for field in self.value_fields]:
+            self.sections[name] = (pos, typecode, item_size)
+            pos += num_rows * item_size
+        if len(self.buffer) != pos:
+            raise ValueError("'%s' is truncated" % path)
+
+    def __len__(self):
+        return self.num_rows
+
+    def read_array(self, section, start=0, end=None):
+        """ Read rows start:end of a section into an array. """
+        pos, typecode, item_size = self.sections[section]
+        if end is None:
+            end = self.num_rows
+        values = array(typecode)
+        values.fromstring(
+            self.buffer[pos + start * item_size:pos + end * item_size])
+        return values
+
+    def get_column(self, field, start=0, end=None):
+        """ Get rows start:end of a field's column, as a list for cell ids
+        and keys, and as an array of doubles for values. """
+        if field in self.value_fields:
+            return self.read_array(field, start, end)
+        if field == 'cell_id':
+            cell_ids = self.cell_ids
+            return [cell_ids[i]
+                    for i in self.read_array('cell_idxs', start, end)]
+        j = self.key_fields.index(field)
+        effort_keys = self.effort_keys
+        return [effort_keys[i][j]
+                for i in self.read_array('key_idxs', start, end)]
+
+    def get_numpy_column(self, field):
+        """ Get a value field's column as a NumPy array which is a view
+        of the file's buffer, without copying. Needs NumPy. """
+        import numpy
+        if field not in self.value_fields:
+            raise ValueError("'%s' is not a value field" % field)
+        pos, typecode, item_size = self.sections[field]
+        return numpy.frombuffer(self.buffer, dtype=numpy.float64,
+                                count=self.num_rows, offset=pos)
+
+    def iter_batches(self, batch_size=10000):
+        """ Iterate over the rows in RowBatches. """
+        for start in xrange(0, self.num_rows, batch_size):
+            end = min(start + batch_size, self.num_rows)
+            yield RowBatch(self.fields, [
+                self.get_column(field, start, end) for field in self.fields])
+
+    def iter_rows(self, batch_size=10000):
+        """ Iterate over the rows, as gridded row tuples. """
+        for batch in self.iter_batches(batch_size):
+            for row in zip(*batch.columns):
+                yield row
+
+    def close(self):
+        if mmap is not None:
+            self.buffer.close()
@@ -0,0 +1,108 @@
+"""
+Redistribution of stat area values to cells.
+
+Values are held in dense blocks: one array per cell or stat area, in
+which the value for effort key k and value attr a is at index
+k * num_attrs + a.
+
+Stat areas are distributed in fixed-size chunks of matrix rows, and the
+chunks' deltas are summed in chunk order. Chunks can be computed in
+parallel, and the sums are the same however they were computed.
+"""
+
+from array import array
+from itertools import izip
+
+
+# Number of stat areas per chunk.
+DISTRIBUTION_CHUNK_SIZE = 50
+
+def get_row_chunks(num_rows, chunk_size=DISTRIBUTION_CHUNK_SIZE):
+    """ Split matrix rows into (start, end) chunks. """
+    return [(start, min(start + chunk_size, num_rows))
+            for start in xrange(0, num_rows, chunk_size)]
+
+def get_stat_area_deltas(matrix, sa_blocks, cell_blocks, block_size,
+                         rows=None, ccell_totals=None):
+    """
+    Get the values to add to cells by distributing each stat area's
+    values across its cracked cells. A cracked cell gets a share of the
+    stat area's value in proportion to its own value (the parent cell's
+    value times pct_area) relative to the total over all the stat
+    area's cracked cells.
+
+    sa_blocks holds one block (or None) per matrix row, and cell_blocks
+    one block (or None, for cells without values) per matrix column.
+    Cell blocks are only read, so every stat area sees the same cell
+    values. If rows is given, as a (start, end) chunk, only those rows
+    are distributed.
+
+    If cell_blocks only holds some of the stat areas' cracked cells (as
+    when gridding by tiles), ccell_totals holds each row's totals over
+    all of its cracked cells, from get_ccell_totals.
+
+    Returns a dict of cell index -> delta block.
+    """
+    deltas = {}
+    empty_block = array('d', [0.0]) * block_size
+    if rows is None:
+        rows = (0, len(sa_blocks))
+    for row in xrange(*rows):
+        sa_block = sa_blocks[row]
+        if sa_block is None:
+            continue
+        # Don't distribute empty values.
+        # This also avoids division by zero errors.
+        active = [j for j, sa_value in enumerate(sa_block) if sa_value]
+        if not active:
+            continue
+
+        cell_idxs, weights = matrix.get_row(row)
+        row_blocks = [cell_blocks[c] or empty_block for c in cell_idxs]
+        for j in active:
+            ccell_values = [w * block[j] for w, block in izip(weights,
+                                                             row_blocks)]
+            if ccell_totals is None:
+                ccell_total = sum(ccell_values)
+            else:
+                ccell_total = ccell_totals[row][j]
+            if not ccell_total:
+                continue
+            sa_value = sa_block[j]
+            for c, ccell_value in izip(cell_idxs, ccell_values):
+                if not ccell_value:
+                    continue
+                delta = deltas.get(c)
+                if delta is None:
+                    delta = deltas[c] = array('d', [0.0]) * block_size
+                delta[j] += sa_value * (ccell_value/ccell_total)
+    return deltas
+
+def get_ccell_totals(matrix, cell_blocks, block_size):
+    """
+    Get a block per matrix row of the totals of the row's cracked cell
+    values (parent cell values times pct_area).
+    """
+    ccell_totals = []
+    for row in xrange(len(matrix)):
+        row_totals = array('d', [0.0]) * block_size
+        cell_idxs, weights = matrix.get_row(row)
+        for c, w in izip(cell_idxs, weights):
+            block = cell_blocks[c]
+            if block is None:
+                continue
+            for j in xrange(block_size):
+                row_totals[j] += w * block[j]
+        ccell_totals.append(row_totals)
+    return ccell_totals
+
+def add_deltas(deltas, more_deltas):
+    """ Add a dict of delta blocks into another, in place. """
+    for c, more_delta in more_deltas.iteritems():
+        delta = deltas.get(c)
+        if delta is None:
+            deltas[c] = more_delta
+            continue
+        for j in xrange(len(delta)):
+            delta[j] += more_delta[j]
+    return deltas
@@ -0,0 +1,196 @@
+"""
+Chunked, columnar reader for raw effort CSV files.
+"""
+
+from array import array
+from itertools import ifilter, islice
+import csv
+
+
+NAN = float('nan')
+
+# Raw effort CSV columns, and the effort attrs they are read into.
+RAW_EFFORT_COLUMNS = [
+    ('nemarea', 'stat_area_id'),
+    ('trip_type', 'gear_id'),
+    ('A', 'a'),
+    ('hours_fished', 'hours_fished'),
+    ('value', 'value'),
+    ('year', 'time'),
+    ('lat', 'lat'),
+    ('lon', 'lon'),
+]
+
+def get_shards(path, num_shards):
+    """
+    Split a CSV file into byte ranges, after its header line, which start
+    and end on line boundaries. Assumes fields don't contain newlines,
+    which holds for raw effort files.
+    """
+    f = open(path, 'rb')
+    try:
+        f.readline()
+        data_start = f.tell()
+        f.seek(0, 2)
+        data_end = f.tell()
+        boundaries = [data_start]
+        for i in range(1, num_shards):
+            pos = data_start + (data_end - data_start) * i / num_shards
+            if pos <= boundaries[-1]:
+                continue
+            # Move to the start of the next line, or stay at pos if it is
+            # already the start of a line.
+            f.seek(pos - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundaries[-1] < boundary < data_end:
+                boundaries.append(boundary)
+        boundaries.append(data_end)
+    finally:
+        f.close()
+    return zip(boundaries[:-1], boundaries[1:])
+
+def iter_lines(f, end):
+    """ Iterate over lines of a file until byte offset end. """
+    while f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        yield line
+
+def to_float(value):
+    """ Convert a raw effort field to a float, with '.' or '' as NaN. """
+    if value == '.' or value == '' or value is None:
+        return NAN
+    return float(value)
+
+def parse_float_column(values):
+    """
+    Convert a column of raw effort fields to an array of floats.
+    Raw effort columns repeat a few distinct values (years, stat areas,
+    rounded positions), so each distinct value is only parsed once.
+    """
+    parsed = dict([(value, to_float(value)) for value in set(values)])
+    return array('d', map(parsed.__getitem__, values))
+
+class EffortChunk(object):
+    """
+    A chunk of raw efforts, as columns named by effort attr.
+
+    Numeric columns are arrays of floats, with NaN for missing values.
+    The gear_id column is a list of gear ids, with None for trip types
+    which have no gear mapping.
+    """
+
+    def __init__(self, size, columns):
+        self.size = size
+        self.columns = columns
+        self.__dict__.update(columns)
+
+    def __len__(self):
+        return self.size
+
+    def take(self, idxs):
+        """ Get a chunk of the efforts at the given row indices. """
+        columns = {}
+        for attr, column in self.columns.items():
+            values = [column[i] for i in idxs]
+            if isinstance(column, array):
+                values = array(column.typecode, values)
+            columns[attr] = values
+        return EffortChunk(len(idxs), columns)
+
+    def get_effort_keys(self, key_attrs=['gear_id', 'time']):
+        """ Get a list of effort key tuples. Missing values are None. """
+        key_columns = []
+        for attr in key_attrs:
+            column = self.columns[attr]
+            if isinstance(column, array):
+                column = [v if v == v else None for v in column]
+            key_columns.append(column)
+        return zip(*key_columns)
+
+    def get_value_rows(self, value_attrs):
+        """ Get a list of value tuples. Missing values are 0. """
+        value_columns = []
+        for attr in value_attrs:
+            value_columns.append(
+                [v if v == v else 0.0 for v in self.columns[attr]])
+        return zip(*value_columns)
+
+class RawEffortReader(object):
+    """
+    Reads a raw effort CSV file in chunks of columns, without building
+    an object per effort.
+
+    If byte_range is given, as a (start, end) pair from get_shards, only
+    the lines in that range are read.
+
+    position is the byte offset in the file that reading has got to, for
+    progress reporting.
+    """
+
+    def __init__(self, path, gear_mappings={}, chunk_size=10000, limit=None,
+                 byte_range=None):
+        self.path = path
+        self.gear_mappings = gear_mappings
+        self.chunk_size = chunk_size
+        self.limit = limit
+        self.byte_range = byte_range
+        self.position = 0
+
+    def __iter__(self):
+        f = open(self.path, 'rb')
+        try:
+            header = csv.reader([f.readline()]).next()
+            if self.byte_range:
+                start, end = self.byte_range
+                f.seek(start)
+                reader = csv.reader(iter_lines(f, end))
+            else:
+                reader = csv.reader(f)
+            for chunk in self.iter_chunks(reader, header):
+                self.position = f.tell()
+                yield chunk
+        finally:
+            f.close()
+
+    def iter_chunks(self, rows, header):
+        """ Iterate over chunks of rows from a CSV row iterator. """
+        col_idxs = {}
+        for i, name in enumerate(header):
+            col_idxs[name.strip()] = i
+        # Skip blank lines, such as a trailing empty line, so they
+        # don't count as efforts.
+        rows = ifilter(None, rows)
+        remaining = self.limit
+        while remaining is None or remaining > 0:
+            chunk_size = self.chunk_size
+            if remaining is not None:
+                chunk_size = min(chunk_size, remaining)
+                remaining -= chunk_size
+            chunk_rows = list(islice(rows, chunk_size))
+            if not chunk_rows:
+                break
+            yield self.get_chunk(chunk_rows, header, col_idxs)
+
+    def get_chunk(self, rows, header, col_idxs):
+        # Pad short rows, so rows can be transposed into columns.
+        num_fields = len(header)
+        for i, row in enumerate(rows):
+            if len(row) < num_fields:
+                rows[i] = row + [''] * (num_fields - len(row))
+        raw_columns = zip(*rows)
+
+        columns = {}
+        for source, target in RAW_EFFORT_COLUMNS:
+            idx = col_idxs.get(source)
+            if idx is None:
+                raw_column = [''] * len(rows)
+            else:
+                raw_column = raw_columns[idx]
+            if target == 'gear_id':
+                columns[target] = map(self.gear_mappings.get, raw_column)
+            else:
+                columns[target] = parse_float_column(raw_column)
+        return EffortChunk(len(rows), columns)
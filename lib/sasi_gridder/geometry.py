@@ -0,0 +1,274 @@
+"""
+Low-level geometry helpers for the gridder's lookup paths.
+
+Like sasi_data.util.gis, these work on JTS geometries when running under
+Jython, and on shapely geometries otherwise.
+"""
+
+from array import array
+import platform
+
+
+# Point positions relative to a ring.
+OUTSIDE = 0
+INSIDE = 1
+BOUNDARY = 2
+
+if platform.system() == 'Java':
+    from com.vividsolutions.jts.geom import (GeometryFactory, Coordinate,
+                                             Envelope)
+    from com.vividsolutions.jts.geom.prep import PreparedGeometryFactory
+    from com.vividsolutions.jts.geom import LinearRing, Polygon
+    import jarray
+
+    _geometry_factory = GeometryFactory()
+    _prepared_geometry_factory = PreparedGeometryFactory()
+
+    def make_point(x, y):
+        return _geometry_factory.createPoint(Coordinate(x, y))
+
+    def make_rect(rect):
+        minx, miny, maxx, maxy = rect
+        return _geometry_factory.toGeometry(Envelope(minx, maxx, miny, maxy))
+
+    def prepare(shape):
+        """ Get a prepared geometry with 'intersects' and 'contains'. """
+        return _prepared_geometry_factory.create(shape)
+
+    def get_polygons(shape):
+        """ List of the polygons in a polygon or multipolygon shape. """
+        polygons = []
+        for i in range(shape.getNumGeometries()):
+            part = shape.getGeometryN(i)
+            if part.getGeometryType() == 'Polygon':
+                polygons.append(part)
+        return polygons
+
+    def get_ring_coords(polygon):
+        """ List of coordinate lists for a polygon's rings, exterior
+        ring first. """
+        rings = [polygon.getExteriorRing()]
+        for i in range(polygon.getNumInteriorRing()):
+            rings.append(polygon.getInteriorRingN(i))
+        return [[(c.x, c.y) for c in ring.getCoordinates()] for ring in rings]
+
+    def _make_ring(xs, ys):
+        coords = [Coordinate(xs[i], ys[i]) for i in xrange(len(xs))]
+        return _geometry_factory.createLinearRing(
+            jarray.array(coords, Coordinate))
+
+    def make_shape(polygons):
+        """ Make a polygon or multipolygon shape from a list of polygons,
+        each a list of (xs, ys) rings, exterior ring first. """
+        jts_polygons = []
+        for rings in polygons:
+            holes = [_make_ring(xs, ys) for xs, ys in rings[1:]]
+            jts_polygons.append(_geometry_factory.createPolygon(
+                _make_ring(*rings[0]), jarray.array(holes, LinearRing)))
+        if len(jts_polygons) == 1:
+            return jts_polygons[0]
+        return _geometry_factory.createMultiPolygon(
+            jarray.array(jts_polygons, Polygon))
+
+else:
+    from shapely.geometry import Point, Polygon, MultiPolygon, box
+    from shapely.prepared import prep
+
+    def make_point(x, y):
+        return Point(x, y)
+
+    def make_rect(rect):
+        return box(*rect)
+
+    def prepare(shape):
+        """ Get a prepared geometry with 'intersects' and 'contains'. """
+        return prep(shape)
+
+    def get_polygons(shape):
+        """ List of the polygons in a polygon or multipolygon shape. """
+        if shape.geom_type == 'Polygon':
+            return [shape]
+        return [part for part in getattr(shape, 'geoms', [])
+                if part.geom_type == 'Polygon']
+
+    def get_ring_coords(polygon):
+        """ List of coordinate lists for a polygon's rings, exterior
+        ring first. """
+        rings = [polygon.exterior] + list(polygon.interiors)
+        return [list(ring.coords) for ring in rings]
+
+    def make_shape(polygons):
+        """ Make a polygon or multipolygon shape from a list of polygons,
+        each a list of (xs, ys) rings, exterior ring first. """
+        shapely_polygons = []
+        for rings in polygons:
+            shapely_polygons.append(Polygon(
+                zip(*rings[0]), [zip(xs, ys) for xs, ys in rings[1:]]))
+        if len(shapely_polygons) == 1:
+            return shapely_polygons[0]
+        return MultiPolygon(shapely_polygons)
+
+def point_in_ring(x, y, xs, ys):
+    """
+    Crossing-number test of a point against a ring given as
+    coordinate arrays. Returns INSIDE, OUTSIDE or BOUNDARY.
+    """
+    inside = False
+    j = len(xs) - 1
+    for i in xrange(len(xs)):
+        xi = xs[i]
+        yi = ys[i]
+        xj = xs[j]
+        yj = ys[j]
+        if xi == x and yi == y:
+            return BOUNDARY
+        if (yi > y) != (yj > y):
+            x_cross = xi + (y - yi) * (xj - xi) / (yj - yi)
+            if x == x_cross:
+                return BOUNDARY
+            if x < x_cross:
+                inside = not inside
+        elif yi == y and yj == y and (xi <= x <= xj or xj <= x <= xi):
+            return BOUNDARY
+        j = i
+    if inside:
+        return INSIDE
+    return OUTSIDE
+
+class PolygonRings(object):
+    """
+    Flat-array form of a (multi)polygon's rings, for point-in-polygon
+    tests which don't need to build point geometries.
+
+    If polygons is given, as a list of (xs, ys) ring lists, the rings are
+    taken from it rather than from the shape.
+    """
+    def __init__(self, shape, polygons=None):
+        if polygons is None:
+            polygons = []
+            for polygon in get_polygons(shape):
+                polygons.append([
+                    (array('d', [c[0] for c in coords]),
+                     array('d', [c[1] for c in coords]))
+                    for coords in get_ring_coords(polygon)])
+        self.polygons = []
+        self.num_vertices = 0
+        xmin = ymin = float('inf')
+        xmax = ymax = float('-inf')
+        for polygon_rings in polygons:
+            rings = []
+            for xs, ys in polygon_rings:
+                rings.append((xs, ys))
+                self.num_vertices += len(xs)
+                if len(xs):
+                    xmin = min(xmin, min(xs))
+                    xmax = max(xmax, max(xs))
+                    ymin = min(ymin, min(ys))
+                    ymax = max(ymax, max(ys))
+            self.polygons.append(rings)
+        self.mbr = (xmin, ymin, xmax, ymax)
+
+    def contains_point(self, x, y):
+        """ True if the point is inside the shape or on its boundary. """
+        if x < self.mbr[0] or x > self.mbr[2] or \
+           y < self.mbr[1] or y > self.mbr[3]:
+            return False
+        for rings in self.polygons:
+            if not rings:
+                continue
+            if point_in_ring(x, y, *rings[0]) == OUTSIDE:
+                continue
+            for hole in rings[1:]:
+                if point_in_ring(x, y, *hole) == INSIDE:
+                    break
+            else:
+                return True
+        return False
+
+class PreparedShape(object):
+    """
+    A shape prepared once for repeated 'contains point' and
+    'intersects' queries.
+
+    Shapes with few vertices (such as grid cells) answer point queries
+    from their ring arrays, which avoids building point geometries.
+    Larger shapes (such as stat areas) use the geometry library's
+    prepared geometries.
+
+    polygons can be given as for PolygonRings, if the shape's rings are
+    already available as arrays. The shape can then be left out, and is
+    only built from the rings if it is used.
+    """
+    def __init__(self, shape=None, max_ring_vertices=64, polygons=None):
+        self._shape = shape
+        self._polygons = polygons
+        rings = PolygonRings(shape, polygons=polygons)
+        self.mbr = rings.mbr
+        if rings.num_vertices <= max_ring_vertices:
+            self.rings = rings
+        else:
+            self.rings = None
+        self._prepared = None
+
+    @property
+    def shape(self):
+        if self._shape is None:
+            self._shape = make_shape(self.get_polygons())
+        return self._shape
+
+    @property
+    def prepared(self):
+        # Shapes only get a prepared geometry if they are used for shape
+        # queries, or for point queries which their rings don't answer.
+        if self._prepared is None:
+            self._prepared = prepare(self.shape)
+        return self._prepared
+
+    def get_polygons(self):
+        """ Get the shape's polygons, as lists of (xs, ys) rings. """
+        if self.rings is not None:
+            return self.rings.polygons
+        if self._polygons is None:
+            self._polygons = PolygonRings(self._shape).polygons
+        return self._polygons
+
+    def mbr_disjoint(self, rect):
+        mbr = self.mbr
+        return rect[0] > mbr[2] or rect[2] < mbr[0] \
+                or rect[1] > mbr[3] or rect[3] < mbr[1]
+
+    def contains_point(self, x, y):
+        """ True if the point is inside the shape or on its boundary. """
+        if self.mbr_disjoint((x, y, x, y)):
+            return False
+        if self.rings is not None:
+            return self.rings.contains_point(x, y)
+        return self.prepared.intersects(make_point(x, y))
+
+    def intersects_rect(self, rect):
+        if self.mbr_disjoint(rect):
+            return False
+        return self.prepared.intersects(make_rect(rect))
+
+    def intersects_shape(self, shape, mbr=None):
+        if mbr is not None and self.mbr_disjoint(mbr):
+            return False
+        return self.prepared.intersects(shape)
+
+    def contains_shape(self, shape, mbr=None):
+        if mbr is not None:
+            if mbr[0] < self.mbr[0] or mbr[2] > self.mbr[2] \
+               or mbr[1] < self.mbr[1] or mbr[3] > self.mbr[3]:
+                return False
+        return self.prepared.contains(shape)
+
+    def classify_shape(self, shape, mbr=None):
+        """
+        Classify a shape as INSIDE this shape, OUTSIDE it, or crossing
+        its BOUNDARY.
+        """
+        if not self.intersects_shape(shape, mbr=mbr):
+            return OUTSIDE
+        if self.contains_shape(shape, mbr=mbr):
+            return INSIDE
+        return BOUNDARY
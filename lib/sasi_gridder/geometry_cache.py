@@ -0,0 +1,204 @@
+"""
+Binary cache of ingested shapefile features: ids, areas, mbrs and ring
+coordinates in flat arrays.
+
+Cache files are read through a memory map where the platform has one, so
+opening a cache only reads its header and offset tables. Coordinates are
+read as features are asked for, and features' shapes are only built when
+they are used.
+"""
+
+from array import array
+from sasi_gridder.geometry import PolygonRings, PreparedShape
+import cPickle as pickle
+import struct
+import sys
+
+try:
+    import mmap
+except ImportError:
+    # Not available under Jython.
+    mmap = None
+
+
+GEOMETRY_CACHE_VERSION = 1
+
+_MAGIC = 'SGGEOM'
+
+# Magic, version, byte order, number of features, polygons, rings and
+# coordinates, and the length of the pickled ids.
+_HEADER = struct.Struct('<6sIBIIIII')
+
+# Typecodes for offsets and values. 'i' is 4 bytes on all our platforms,
+# unlike 'l'.
+_OFFSET_TYPE = 'i'
+_VALUE_TYPE = 'd'
+
+def write_geometry_cache(f, features):
+    """
+    Write features to an open file. features is a sequence of
+    (id, polygons, area, mbr) tuples, where polygons is a list of
+    polygons, each a list of (xs, ys) rings, exterior ring first.
+    """
+    ids = []
+    areas = array(_VALUE_TYPE)
+    mbrs = array(_VALUE_TYPE)
+    feature_polygons = array(_OFFSET_TYPE, [0])
+    polygon_rings = array(_OFFSET_TYPE, [0])
+    ring_coords = array(_OFFSET_TYPE, [0])
+    xs = array(_VALUE_TYPE)
+    ys = array(_VALUE_TYPE)
+    for feature_id, polygons, area, mbr in features:
+        ids.append(feature_id)
+        areas.append(area)
+        mbrs.extend(mbr)
+        for rings in polygons:
+            for ring_xs, ring_ys in rings:
+                xs.extend(ring_xs)
+                ys.extend(ring_ys)
+                ring_coords.append(len(xs))
+            polygon_rings.append(len(ring_coords) - 1)
+        feature_polygons.append(len(polygon_rings) - 1)
+
+    pickled_ids = pickle.dumps(ids, pickle.HIGHEST_PROTOCOL)
+    f.write(_HEADER.pack(
+        _MAGIC, GEOMETRY_CACHE_VERSION, sys.byteorder == 'little',
+        len(ids), len(polygon_rings) - 1, len(ring_coords) - 1, len(xs),
+        len(pickled_ids)))
+    f.write(pickled_ids)
+    for section in [areas, mbrs, feature_polygons, polygon_rings,
+                    ring_coords, xs, ys]:
+        section.tofile(f)
+
+class GeometryCache(object):
+    """
+    Reader for a geometry cache file. Raises ValueError if the file
+    is not a cache file this version can read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            if mmap is not None:
+                self.buffer = mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            else:
+                self.buffer = f.read()
+        finally:
+            f.close()
+
+        if len(self.buffer) < _HEADER.size:
+            raise ValueError("'%s' is not a geometry cache" % path)
+        (magic, version, little_endian, num_features, num_polygons,
+         num_rings, num_coords, ids_size) = _HEADER.unpack(
+             self.buffer[:_HEADER.size])
+        if magic != _MAGIC or version != GEOMETRY_CACHE_VERSION \
+           or bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError("'%s' is not a readable geometry cache" % path)
+
+        pos = _HEADER.size
+        self.ids = pickle.loads(self.buffer[pos:pos + ids_size])
+        pos += ids_size
+
+        # Section byte offsets, item counts and item sizes.
+        self.sections = {}
+        value_size = array(_VALUE_TYPE).itemsize
+        offset_size = array(_OFFSET_TYPE).itemsize
+        for name, count, item_size in [
+            ('areas', num_features, value_size),
+            ('mbrs', 4 * num_features, value_size),
+            ('feature_polygons', num_features + 1, offset_size),
+            ('polygon_rings', num_polygons + 1, offset_size),
+            ('ring_coords', num_rings + 1, offset_size),
+            ('xs', num_coords, value_size),
+            ('ys', num_coords, value_size),
+        ]:
+            self.sections[name] = (pos, count, item_size)
+            pos += count * item_size
+        if len(self.buffer) != pos:
+            raise ValueError("'%s' is truncated" % path)
+
+        self.areas = self.read_array('areas', _VALUE_TYPE)
+        self.mbrs = self.read_array('mbrs', _VALUE_TYPE)
+        self.feature_polygons = self.read_array('feature_polygons',
+                                                _OFFSET_TYPE)
+        self.polygon_rings = self.read_array('polygon_rings', _OFFSET_TYPE)
+        self.ring_coords = self.read_array('ring_coords', _OFFSET_TYPE)
+
+    def read_array(self, section, typecode, start=0, end=None):
+        """ Read items start:end of a section into an array. """
+        pos, count, item_size = self.sections[section]
+        if end is None:
+            end = count
+        values = array(typecode)
+        values.fromstring(
+            self.buffer[pos + start * item_size:pos + end * item_size])
+        return values
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_mbr(self, i):
+        return tuple(self.mbrs[4 * i:4 * i + 4])
+
+    def get_num_vertices(self, i):
+        """ Get the number of ring vertices of a feature. """
+        first_ring = self.polygon_rings[self.feature_polygons[i]]
+        end_ring = self.polygon_rings[self.feature_polygons[i + 1]]
+        return self.ring_coords[end_ring] - self.ring_coords[first_ring]
+
+    def get_polygons(self, i):
+        """ Get a feature's polygons, as lists of (xs, ys) rings. """
+        polygons = []
+        for p in xrange(self.feature_polygons[i],
+                        self.feature_polygons[i + 1]):
+            rings = []
+            for r in xrange(self.polygon_rings[p], self.polygon_rings[p + 1]):
+                start = self.ring_coords[r]
+                end = self.ring_coords[r + 1]
+                rings.append((self.read_array('xs', _VALUE_TYPE, start, end),
+                              self.read_array('ys', _VALUE_TYPE, start, end)))
+            polygons.append(rings)
+        return polygons
+
+    def iter_features(self):
+        """
+        Iterate over (id, prepared, area, mbr) tuples, where prepared is
+        a CachedShape. The cache must stay open while features are used.
+        """
+        for i in xrange(len(self.ids)):
+            yield (self.ids[i], CachedShape(self, i), self.areas[i],
+                   self.get_mbr(i))
+
+    def close(self):
+        if mmap is not None:
+            self.buffer.close()
+
+class CachedShape(PreparedShape):
+    """
+    PreparedShape for feature i of a geometry cache. The feature's rings
+    are read from the cache, and its shape built, when they are first
+    used, so that loading a cache doesn't build geometries.
+    """
+
+    def __init__(self, cache, i, max_ring_vertices=64):
+        self.cache = cache
+        self.i = i
+        self.mbr = cache.get_mbr(i)
+        self.has_rings = cache.get_num_vertices(i) <= max_ring_vertices
+        self._rings = None
+        self._shape = None
+        self._prepared = None
+
+    @property
+    def rings(self):
+        if self._rings is None and self.has_rings:
+            self._rings = PolygonRings(
+                None, polygons=self.cache.get_polygons(self.i))
+        return self._rings
+
+    def get_polygons(self):
+        if self.has_rings:
+            return self.rings.polygons
+        return self.cache.get_polygons(self.i)
@@ -0,0 +1,162 @@
+"""
+Arithmetic index for grids whose cells form a regular, axis-aligned
+rectangular lattice.
+"""
+
+from itertools import izip
+import math
+
+
+def is_rectangle(polygons, mbr, x_tolerance=0, y_tolerance=0):
+    """ True if polygons, as lists of (xs, ys) rings, are a single
+    polygon which fills its mbr. """
+    if len(polygons) != 1:
+        return False
+    rings = polygons[0]
+    if len(rings) != 1:
+        return False
+    minx, miny, maxx, maxy = mbr
+    corners = set()
+    xs, ys = rings[0]
+    for x, y in izip(xs, ys):
+        on_minx = abs(x - minx) <= x_tolerance
+        on_maxx = abs(x - maxx) <= x_tolerance
+        on_miny = abs(y - miny) <= y_tolerance
+        on_maxy = abs(y - maxy) <= y_tolerance
+        on_x = on_minx or on_maxx
+        on_y = on_miny or on_maxy
+        # Every vertex must lie on the mbr's boundary...
+        if not (on_x or on_y):
+            return False
+        if on_x and on_y:
+            corners.add((on_minx, on_miny))
+    # ...and every corner of the mbr must be a vertex.
+    return len(corners) == 4
+
+class RegularLattice(object):
+    """
+    Maps positions straight to cells by arithmetic on the lattice's
+    origin and cell size.
+
+    Has the same lookup methods as a SpatialHash, so it can be used in
+    place of one.
+    """
+
+    def __init__(self, x0, y0, dx, dy, num_cols, num_rows, slots,
+                 tolerance=1e-6):
+        self.x0 = x0
+        self.y0 = y0
+        self.dx = dx
+        self.dy = dy
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        # Cells keyed by row * num_cols + col. Lattices may have holes.
+        self.slots = slots
+        self.tolerance = tolerance
+
+    @classmethod
+    def from_cells(clz, cells, tolerance=1e-6):
+        """
+        Build a lattice from cells with 'prepared' (a PreparedShape) and
+        'mbr' attributes. Cells' shapes aren't built.
+        Returns None if the cells are not a regular lattice to within
+        tolerance, given as a fraction of the cell size.
+        """
+        cells = list(cells)
+        if not cells:
+            return None
+
+        minx, miny, maxx, maxy = cells[0].mbr
+        dx = maxx - minx
+        dy = maxy - miny
+        if dx <= 0 or dy <= 0:
+            return None
+        x_tolerance = tolerance * dx
+        y_tolerance = tolerance * dy
+        x0 = min([cell.mbr[0] for cell in cells])
+        y0 = min([cell.mbr[1] for cell in cells])
+
+        positions = {}
+        num_cols = 0
+        num_rows = 0
+        for cell in cells:
+            minx, miny, maxx, maxy = cell.mbr
+            if abs((maxx - minx) - dx) > x_tolerance \
+               or abs((maxy - miny) - dy) > y_tolerance:
+                return None
+
+            fcol = (minx - x0) / dx
+            frow = (miny - y0) / dy
+            col = int(round(fcol))
+            row = int(round(frow))
+            if abs(fcol - col) > tolerance or abs(frow - row) > tolerance:
+                return None
+
+            if (col, row) in positions:
+                return None
+            if not is_rectangle(cell.prepared.get_polygons(), cell.mbr,
+                                x_tolerance, y_tolerance):
+                return None
+
+            positions[(col, row)] = cell
+            num_cols = max(num_cols, col + 1)
+            num_rows = max(num_rows, row + 1)
+
+        slots = {}
+        for (col, row), cell in positions.items():
+            slots[row * num_cols + col] = cell
+
+        return clz(x0, y0, dx, dy, num_cols, num_rows, slots,
+                   tolerance=tolerance)
+
+    def get_indices(self, value, origin, size, count):
+        """
+        Get the lattice indices along one axis whose cells contain
+        value. Values on a shared edge are in both cells.
+        """
+        fidx = (value - origin) / size
+        idx = int(math.floor(fidx))
+        indices = [idx]
+        if fidx - idx <= self.tolerance:
+            indices.append(idx - 1)
+        elif idx + 1 - fidx <= self.tolerance:
+            indices.append(idx + 1)
+        return [i for i in indices if 0 <= i < count]
+
+    def item_for_point(self, pnt):
+        """ Get the cell which contains the point, or None. """
+        x, y = pnt
+        slots = self.slots
+        cols = self.get_indices(x, self.x0, self.dx, self.num_cols)
+        if not cols:
+            return None
+        for row in self.get_indices(y, self.y0, self.dy, self.num_rows):
+            for col in cols:
+                cell = slots.get(row * self.num_cols + col)
+                if cell is not None:
+                    return cell
+        return None
+
+    def items_for_point(self, pnt):
+        cell = self.item_for_point(pnt)
+        if cell is None:
+            return []
+        return [cell]
+
+    def items_for_rect(self, rect):
+        """ Get the cells which intersect the rect. """
+        minx, miny, maxx, maxy = rect
+        col_min = max(0, int(math.floor((minx - self.x0) / self.dx)))
+        col_max = min(self.num_cols - 1,
+                      int(math.floor((maxx - self.x0) / self.dx)))
+        row_min = max(0, int(math.floor((miny - self.y0) / self.dy)))
+        row_max = min(self.num_rows - 1,
+                      int(math.floor((maxy - self.y0) / self.dy)))
+        items = []
+        slots = self.slots
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                cell = slots.get(row * self.num_cols + col)
+                if cell is not None:
+                    items.append(cell)
+        return items
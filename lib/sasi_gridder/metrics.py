@@ -0,0 +1,135 @@
+"""
+Per-stage run metrics: wall time, CPU time, rows per second and peak
+memory use.
+
+CPU time and peak memory come from resource.getrusage, and include
+forked worker processes. Under Jython, where there is no resource
+module, they come from the JVM's management beans instead: CPU time of
+the current thread, and the peak heap use of its memory pools.
+"""
+
+from contextlib import contextmanager
+import json
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_cpu_time():
+    """ Get CPU time used so far, in seconds, or None if unknown. """
+    if resource is not None:
+        total = 0.0
+        for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+            usage = resource.getrusage(who)
+            total += usage.ru_utime + usage.ru_stime
+        return total
+    if platform.system() == 'Java':
+        from java.lang.management import ManagementFactory
+        return ManagementFactory.getThreadMXBean() \
+                .getCurrentThreadCpuTime() / 1e9
+    return None
+
+def get_peak_rss():
+    """ Get peak memory use so far, in KB, or None if unknown. """
+    if resource is not None:
+        peak = max([resource.getrusage(who).ru_maxrss for who in [
+            resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]])
+        # ru_maxrss is in bytes on OS X, and KB elsewhere.
+        if sys.platform == 'darwin':
+            peak /= 1024
+        return peak
+    if platform.system() == 'Java':
+        from java.lang.management import ManagementFactory
+        return sum([pool.getPeakUsage().getUsed()
+                    for pool in ManagementFactory.getMemoryPoolMXBeans()
+                    if pool.getPeakUsage() is not None]) / 1024
+    return None
+
+class RunMetrics(object):
+    """
+    Metrics for each measured stage of a run, in the order the stages
+    finished.
+
+    Stages can be measured inside other stages, as when gridding runs
+    while the output stage reads rows. An enclosing stage's times then
+    leave out the times of the stages measured inside it.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.stages = []
+        # [wall, cpu] times of stages measured inside each open stage.
+        self._nested_times = []
+
+    @contextmanager
+    def measure(self, stage):
+        """
+        Measure a stage run in a with block. The block gets the stage's
+        metrics dict, and can set its 'rows' to the number of rows (cells,
+        efforts...) the stage processed.
+        """
+        metrics = {'stage': stage, 'rows': None}
+        nested_times = [0.0, 0.0]
+        self._nested_times.append(nested_times)
+        start_wall = time.time()
+        start_cpu = get_cpu_time()
+        try:
+            yield metrics
+        finally:
+            wall_time = time.time() - start_wall
+            cpu_time = None
+            if start_cpu is not None:
+                cpu_time = get_cpu_time() - start_cpu
+            self._nested_times.pop()
+            if self._nested_times:
+                self._nested_times[-1][0] += wall_time
+                self._nested_times[-1][1] += cpu_time or 0.0
+            metrics['wall_time'] = wall_time - nested_times[0]
+            if cpu_time is not None:
+                cpu_time -= nested_times[1]
+            metrics['cpu_time'] = cpu_time
+            metrics['rows_per_sec'] = None
+            if metrics['rows'] is not None and metrics['wall_time'] > 0:
+                metrics['rows_per_sec'] = \
+                        metrics['rows'] / metrics['wall_time']
+            metrics['peak_rss_kb'] = get_peak_rss()
+            self.stages.append(metrics)
+            if self.logger:
+                self.logger.info(format_stage_metrics(metrics))
+
+    def get_stage(self, stage):
+        """ Get the metrics of the last run of a stage, or None. """
+        for metrics in reversed(self.stages):
+            if metrics['stage'] == stage:
+                return metrics
+        return None
+
+    def to_dict(self):
+        return {
+            'stages': [dict(metrics) for metrics in self.stages],
+            'wall_time': sum([metrics['wall_time']
+                              for metrics in self.stages]),
+            'peak_rss_kb': get_peak_rss(),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+def format_stage_metrics(metrics):
+    """ Format a stage's metrics as a one-line summary for logs. """
+    parts = ["%.2fs wall" % metrics['wall_time']]
+    if metrics['cpu_time'] is not None:
+        parts.append("%.2fs cpu" % metrics['cpu_time'])
+    if metrics['rows'] is not None:
+        parts.append("%s rows" % metrics['rows'])
+    if metrics['rows_per_sec'] is not None:
+        parts.append("%.0f rows/s" % metrics['rows_per_sec'])
+    if metrics['peak_rss_kb'] is not None:
+        parts.append("peak RSS %s KB" % metrics['peak_rss_kb'])
+    return "Stage '%s': %s" % (metrics['stage'], ", ".join(parts))
@@ -1,11 +1,15 @@
 class Cell(object):
-    def __init__(self, keyed_values={}, **kwargs):
+    def __init__(self, keyed_values={}, prepared=None, **kwargs):
         self.keyed_values = keyed_values
+        # geometry.PreparedShape for the cell's shape.
+        self.prepared = prepared
         self.__dict__.update(kwargs)
 
 class StatArea(object):
-    def __init__(self, keyed_values={}, **kwargs):
+    def __init__(self, keyed_values={}, prepared=None, **kwargs):
         self.keyed_values = keyed_values
+        # geometry.PreparedShape for the stat area's shape.
+        self.prepared = prepared
         self.__dict__.update(kwargs)
 
 class Effort(object):
@@ -17,8 +21,3 @@ class Effort(object):
 
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
-
-class CrackedCell(object):
-    def __init__(self, keyed_values={}, **kwargs):
-        self.keyed_values = keyed_values
-        self.__dict__.update(kwargs)
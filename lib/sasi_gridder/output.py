@@ -0,0 +1,63 @@
+"""
+Gridded rows, and the writers which consume them.
+
+A gridded row is a tuple of a cell id, the effort key attrs' values and
+the value attrs' values, in the order of the task's output fields.
+"""
+
+from itertools import islice
+import csv
+
+
+# Output file formats.
+OUTPUT_FORMATS = ['csv', 'columnar']
+
+def iter_value_rows(values, dense=False):
+    """
+    Yield gridded rows from an accumulator of cell values. Rows whose
+    values are all zero are skipped, unless dense is True.
+    """
+    for cell_id, effort_key, cell_values in values.iter_values(
+        sparse=not dense):
+        yield (cell_id,) + tuple(effort_key) + tuple(cell_values)
+
+class RowBatch(object):
+    """ A batch of gridded rows, as a list of columns per output field. """
+
+    def __init__(self, fields, columns):
+        self.fields = fields
+        self.columns = columns
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(self.columns[0])
+
+    def get_column(self, field):
+        return self.columns[self.fields.index(field)]
+
+    def to_records(self):
+        """ Get the batch as a NumPy record array. Needs NumPy, which is
+        not a dependency of the gridder. """
+        import numpy
+        return numpy.rec.fromarrays(self.columns, names=self.fields)
+
+def iter_batches(rows, fields, batch_size=10000):
+    """ Group gridded rows into RowBatches of up to batch_size rows. """
+    rows = iter(rows)
+    while True:
+        batch_rows = list(islice(rows, batch_size))
+        if not batch_rows:
+            break
+        yield RowBatch(fields, [list(column) for column in zip(*batch_rows)])
+
+def write_csv(path, fields, rows):
+    """ Write gridded rows to a CSV file. Returns the number of rows. """
+    row_counter = 0
+    with open(path, "w") as f:
+        w = csv.writer(f)
+        w.writerow(fields)
+        for row in rows:
+            w.writerow(row)
+            row_counter += 1
+    return row_counter
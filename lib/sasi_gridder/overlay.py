@@ -0,0 +1,97 @@
+"""
+Overlay of grid cells with stat areas.
+
+The overlay maps each stat area id to a list of
+(cell_id, intersection_area, pct_area) entries for the cells which
+intersect the stat area, where pct_area is the fraction of the cell's
+area inside the stat area.
+"""
+
+from sasi_gridder.geometry import OUTSIDE, INSIDE, BOUNDARY
+import sasi_data.util.gis as gis_util
+from array import array
+
+
+# Bump when the overlay's contents change, to invalidate cached overlays.
+OVERLAY_VERSION = 2
+
+def get_overlay_entries(stat_area, cell_index, counts=None):
+    """
+    Get overlay entries for one stat area.
+
+    Cells entirely inside the stat area get a pct_area of 1 without being
+    clipped, so only cells on the stat area's boundary are clipped. If
+    counts is given, it is a dict in which the number of cells found
+    inside and on the boundary are counted.
+    """
+    entries = []
+    for icell in cell_index.items_for_rect(stat_area.mbr):
+        position = stat_area.prepared.classify_shape(icell.prepared.shape,
+                                                     mbr=icell.mbr)
+        if position == OUTSIDE:
+            continue
+        if counts is not None:
+            counts[position] = counts.get(position, 0) + 1
+        if position == INSIDE:
+            entries.append((icell.id, icell.area, 1.0))
+            continue
+        intersection = gis_util.get_intersection(stat_area.prepared.shape,
+                                                 icell.prepared.shape)
+        if not intersection:
+            continue
+        intersection_area = gis_util.get_shape_area(intersection)
+        pct_area = intersection_area/icell.area
+        entries.append((icell.id, intersection_area, pct_area))
+    return entries
+
+def compute_overlay(stat_areas, cell_index, logger=None, progress=None):
+    """ Overlay stat areas on cells. If progress is given, as a
+    ProgressReporter, stat areas done are reported to it. """
+    overlay = {}
+    counts = {}
+    if progress:
+        progress.set_total(len(stat_areas), unit='stat_areas')
+    for stat_area in stat_areas:
+        overlay[stat_area.id] = get_overlay_entries(stat_area, cell_index,
+                                                    counts=counts)
+        if progress:
+            progress.add()
+    if logger:
+        logger.info("%s cells inside stat_areas, %s on boundaries" % (
+            counts.get(INSIDE, 0), counts.get(BOUNDARY, 0)))
+    return overlay
+
+class OverlapMatrix(object):
+    """
+    Sparse stat area x cell matrix of overlap weights (pct_area), in
+    compressed row form. Row i is for stat area sa_ids[i], and its
+    entries are cell_idxs[row_ptrs[i]:row_ptrs[i+1]] and the matching
+    weights.
+    """
+
+    def __init__(self, overlay, sa_ids, cell_idxs_by_id):
+        """
+        cell_idxs_by_id maps cell ids to the cells' positions in the
+        arrays the matrix will be applied to.
+        """
+        self.sa_ids = list(sa_ids)
+        self.row_ptrs = array('l', [0])
+        self.cell_idxs = array('l')
+        self.weights = array('d')
+        for sa_id in self.sa_ids:
+            for cell_id, intersection_area, pct_area in overlay.get(sa_id, []):
+                self.cell_idxs.append(cell_idxs_by_id[cell_id])
+                self.weights.append(pct_area)
+            self.row_ptrs.append(len(self.cell_idxs))
+
+    def __len__(self):
+        return len(self.sa_ids)
+
+    @property
+    def nnz(self):
+        return len(self.cell_idxs)
+
+    def get_row(self, i):
+        start = self.row_ptrs[i]
+        end = self.row_ptrs[i + 1]
+        return self.cell_idxs[start:end], self.weights[start:end]
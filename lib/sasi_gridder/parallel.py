@@ -0,0 +1,90 @@
+"""
+Helpers for running work in pools of worker processes or threads.
+"""
+
+import Queue
+import os
+import sys
+import threading
+
+try:
+    import multiprocessing
+except ImportError:
+    # Not available under Jython.
+    multiprocessing = None
+
+
+# Ways of running workers. 'auto' uses processes where they can be
+# forked, and threads otherwise. Under Jython, threads run in parallel.
+WORKER_MODES = ['auto', 'process', 'thread']
+
+def can_fork_workers():
+    """
+    True if work can be run in forked worker processes. Workers get
+    read-only state (e.g. cell indexes) by inheriting it when forked.
+    """
+    return multiprocessing is not None and hasattr(os, 'fork')
+
+def map_in_processes(fn, items, workers):
+    """
+    Map fn over items in a pool of forked worker processes. Results are
+    in the order of items. fn must be a module-level function, and its
+    results must be picklable.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1 or not can_fork_workers():
+        return map(fn, items)
+    pool = multiprocessing.Pool(min(workers, len(items)))
+    try:
+        return pool.map(fn, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def map_in_threads(fn, items, workers):
+    """
+    Map fn over items in a pool of threads. Results are in the order of
+    items. If fn raises, the first error is re-raised.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return map(fn, items)
+    results = [None] * len(items)
+    errors = []
+    queue = Queue.Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+
+    def work():
+        while not errors:
+            try:
+                i, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[i] = fn(item)
+            except:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=work)
+               for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return results
+
+def map_in_workers(fn, items, workers, mode='auto'):
+    """ Map fn over items with processes or threads, per mode. """
+    if mode == 'auto':
+        if can_fork_workers():
+            mode = 'process'
+        else:
+            mode = 'thread'
+    if mode == 'process':
+        return map_in_processes(fn, items, workers)
+    elif mode == 'thread':
+        return map_in_threads(fn, items, workers)
+    raise ValueError("Unknown worker mode '%s'" % mode)
@@ -0,0 +1,56 @@
+"""
+Memo cache for the results of effort position lookups.
+"""
+
+from collections import OrderedDict
+
+
+class PositionCache(object):
+    """
+    Bounded LRU cache of lookup results, keyed on (lat, lon) positions.
+
+    If precision is given, positions are rounded to that many decimal
+    places, so that all positions which round to the same key share one
+    result.
+    """
+
+    def __init__(self, max_size=100000, precision=None):
+        self.max_size = max_size
+        self.precision = precision
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, lat, lon):
+        if self.precision is None:
+            return (lat, lon)
+        return (round(lat, self.precision), round(lon, self.precision))
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # Re-insert, to mark as most recently used.
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            hit_rate = float(self.hits) / lookups
+        else:
+            hit_rate = 0.0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.entries),
+            'hit_rate': hit_rate,
+        }
@@ -0,0 +1,93 @@
+"""
+Opt-in profiling of gridder runs.
+
+'cprofile' profiles with cProfile, and writes pstats output. 'sample'
+samples the calling thread's stack at intervals from another thread, and
+writes collapsed stacks, one 'frame;frame;... count' line per distinct
+stack, root frame first, as read by flamegraph tools.
+"""
+
+from collections import defaultdict
+import os
+import sys
+import threading
+import time
+
+try:
+    import cProfile
+except ImportError:
+    # Not available under Jython.
+    import profile as cProfile
+
+
+PROFILERS = ['cprofile', 'sample']
+
+class StackSampler(object):
+    """ Samples a thread's stacks every interval seconds. """
+
+    def __init__(self, thread_id, interval=.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = defaultdict(int)
+        self.num_samples = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    def run(self):
+        while self._running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[get_stack(frame)] += 1
+                self.num_samples += 1
+            time.sleep(self.interval)
+
+    def write_collapsed(self, f):
+        for stack, count in sorted(self.counts.items()):
+            f.write("%s %s\n" % (';'.join(stack), count))
+
+def get_stack(frame):
+    """ Get a frame's stack as a tuple of frame labels, root first. """
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append("%s (%s:%s)" % (code.co_name,
+                                     os.path.basename(code.co_filename),
+                                     code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+def profile_call(fn, profiler, out_path, *args, **kwargs):
+    """
+    Call fn(*args, **kwargs) under a profiler from PROFILERS, write the
+    profile to out_path, and return fn's result. The profile is written
+    even if fn raises.
+    """
+    if profiler == 'cprofile':
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(fn, *args, **kwargs)
+        finally:
+            prof.dump_stats(out_path)
+    elif profiler == 'sample':
+        sampler = StackSampler(threading.current_thread().ident)
+        sampler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+            with open(out_path, 'w') as f:
+                sampler.write_collapsed(f)
+    else:
+        raise ValueError("Unknown profiler '%s', expected one of %s" % (
+            profiler, PROFILERS))
@@ -0,0 +1,156 @@
+"""
+Structured, time-throttled progress reporting.
+
+Stages report how much of their work is done as they go, and listeners
+get ProgressUpdates at most once every min_interval seconds. An update
+which isn't sent costs a clock read and a comparison, so stages can
+report from their loops. Updates carry numbers, not messages; listeners
+format them if they need to.
+
+Overall progress, from 0 to 100, is spread over the stages by weight,
+and is interpolated within a stage when the stage knows its total.
+"""
+
+import time
+
+
+# Stages, in order, with their shares of overall progress.
+PROGRESS_STAGES = [
+    ('ingest', 10),
+    ('first_pass', 50),
+    ('stat_area_distribution', 20),
+    ('unassigned_distribution', 5),
+    ('output', 15),
+]
+
+class ProgressUpdate(object):
+    """
+    Progress of a stage: done of total units (total is None if unknown),
+    rate in units per second, eta in seconds (None if unknown), and the
+    overall progress, from 0 to 100.
+    """
+
+    def __init__(self, stage, done, total, unit, rate, eta, progress):
+        self.stage = stage
+        self.done = done
+        self.total = total
+        self.unit = unit
+        self.rate = rate
+        self.eta = eta
+        self.progress = progress
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return "%dh%02dm" % (seconds / 3600, (seconds % 3600) / 60)
+    if seconds >= 60:
+        return "%dm%02ds" % (seconds / 60, seconds % 60)
+    return "%ds" % seconds
+
+def format_progress(update):
+    """ Format an update as a one-line message. """
+    if update.total:
+        msg = "%s: %s of %s %s (%.1f%%)" % (
+            update.stage, update.done, update.total, update.unit,
+            100.0 * update.done / update.total)
+    else:
+        msg = "%s: %s %s" % (update.stage, update.done, update.unit)
+    if update.rate:
+        msg += ", %.0f %s/s" % (update.rate, update.unit)
+    if update.eta is not None:
+        msg += ", ETA %s" % format_duration(update.eta)
+    return "%s [%.0f%% overall]" % (msg, update.progress)
+
+class ProgressReporter(object):
+    """
+    Tracks the current stage's progress, and sends updates to listeners,
+    which are callables taking a ProgressUpdate. Updates are sent when a
+    stage starts and finishes, and at most every min_interval seconds in
+    between.
+    """
+
+    def __init__(self, stages=PROGRESS_STAGES, min_interval=.5,
+                 listeners=None):
+        self.min_interval = min_interval
+        self.listeners = list(listeners or [])
+        # Overall progress at the start of each stage, and stage weights.
+        self.stage_bases = {}
+        self.stage_weights = {}
+        total_weight = float(sum([weight for stage, weight in stages]))
+        base = 0.0
+        for stage, weight in stages:
+            self.stage_bases[stage] = base
+            self.stage_weights[stage] = 100.0 * weight / total_weight
+            base += self.stage_weights[stage]
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.unit = 'items'
+        self.stage_start = time.time()
+        self.last_sent = 0.0
+        # Overall progress doesn't go backwards, when a stage's total
+        # changes or a stage runs again.
+        self.max_progress = 0.0
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start_stage(self, stage, total=None, unit='items'):
+        self.stage = stage
+        self.set_total(total, unit)
+        self.send(self.stage_start)
+
+    def set_total(self, total, unit='items'):
+        """ Set the current stage's total, restarting its count and
+        rate. """
+        self.stage_start = time.time()
+        self.done = 0
+        self.total = total
+        self.unit = unit
+
+    def update(self, done):
+        """ Set how many units of the current stage are done. """
+        self.done = done
+        now = time.time()
+        if now - self.last_sent >= self.min_interval:
+            self.send(now)
+
+    def add(self, count=1):
+        self.update(self.done + count)
+
+    def finish_stage(self):
+        if self.total:
+            self.done = self.total
+        self.send(time.time(), finished=True)
+
+    def get_progress(self, finished=False):
+        """ Get overall progress, from 0 to 100. """
+        base = self.stage_bases.get(self.stage, self.max_progress)
+        weight = self.stage_weights.get(self.stage, 0.0)
+        if finished:
+            fraction = 1.0
+        elif self.total:
+            fraction = min(float(self.done) / self.total, 1.0)
+        else:
+            fraction = 0.0
+        self.max_progress = max(self.max_progress, base + weight * fraction)
+        return self.max_progress
+
+    def send(self, now, finished=False):
+        self.last_sent = now
+        if not self.listeners:
+            return
+        elapsed = now - self.stage_start
+        rate = None
+        eta = None
+        if elapsed > 0 and self.done:
+            rate = self.done / elapsed
+            if self.total and not finished:
+                eta = max(self.total - self.done, 0) / rate
+        update = ProgressUpdate(self.stage, self.done, self.total, self.unit,
+                                rate, eta, self.get_progress(finished))
+        for listener in self.listeners:
+            listener(update)
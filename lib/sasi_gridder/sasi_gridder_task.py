@@ -3,13 +3,35 @@ Task for gridding SASI Efforts.
 """
 
 from sasi_gridder import models as models
+from sasi_gridder.accumulators import Accumulator, KeyIndex
+from sasi_gridder.assignment import PointAssigner
+from sasi_gridder.caching import (FileCache, get_cache_key, get_file_hash,
+                                  get_file_signature, get_shapefile_hash)
+from sasi_gridder.geometry import PreparedShape
+from sasi_gridder.geometry_cache import (GeometryCache, write_geometry_cache,
+                                         GEOMETRY_CACHE_VERSION)
+from sasi_gridder.lattice import RegularLattice
+from sasi_gridder.metrics import RunMetrics
+from sasi_gridder.parallel import (can_fork_workers, map_in_processes,
+                                   map_in_workers)
+from sasi_gridder.overlay import (compute_overlay, OverlapMatrix,
+                                  OVERLAY_VERSION)
+from sasi_gridder.distribution import (add_deltas, get_row_chunks,
+                                       get_stat_area_deltas)
+from sasi_gridder.effort_reader import RawEffortReader, get_shards
+from sasi_gridder.columnar import write_columnar
+from sasi_gridder.output import iter_batches, iter_value_rows, write_csv
+from sasi_gridder.position_cache import PositionCache
+from sasi_gridder.progress import ProgressReporter
+from sasi_gridder.spatial_index import build_spatial_index
+from sasi_gridder.tiling import TiledGridder
+from sasi_gridder.state import (GridderState, load_state, save_state,
+                                GRIDDER_STATE_VERSION)
 from sasi_data.ingestors.ingestor import Ingestor
 from sasi_data.ingestors.processor import Processor
-from sasi_data.ingestors.csv_reader import CSVReader
 from sasi_data.ingestors.shapefile_reader import ShapefileReader
 from sasi_data.ingestors.dict_writer import DictWriter 
 from sasi_data.ingestors.mapper import ClassMapper
-from sasi_data.util.spatial_hash import SpatialHash
 import sasi_data.util.gis as gis_util
 import task_manager
 
@@ -18,24 +40,46 @@ import os
 import shutil
 import zipfile
 import logging
-import csv
-from time import time
+from itertools import izip, imap
+from array import array
 import inspect
 
 def ln_(msg=""):
     return "%s (%s)" % (msg, inspect.currentframe().f_back.f_lineno)
 
-class Timer(object):
-    def __init__(self):
-        self.then = 0
-        self.now = 0
-    def diff(self):
-        return
-        self.then = self.now
-        self.now = time()
-        return self.now - self.then
 
-timer = Timer()
+# Gridding stages, in order. The output stage is whatever consumes the
+# task's gridded rows, such as call()'s output file writer.
+STAGES = ['ingest', 'first_pass', 'stat_area_distribution',
+          'unassigned_distribution', 'output']
+GRIDDING_STAGES = STAGES[:-1]
+
+# Stages which save values to a checkpoint in the build dir when they
+# complete. Ingested geometry is kept in the geometry and overlay caches
+# instead.
+CHECKPOINT_STAGES = ['first_pass', 'stat_area_distribution',
+                     'unassigned_distribution']
+
+CHECKPOINT_FILE = 'checkpoint.pickle'
+
+# Task attrs set by ingest which don't depend on raw efforts or gear
+# mappings, and can be shared by tasks with the same grid and stat areas.
+GEOMETRY_ATTRS = ['cells', 'cell_index', 'cell_assigner', 'stat_areas',
+                  'sa_index', 'overlay']
+
+# Task whose work is being run by workers. Forked workers inherit it.
+_worker_task = None
+
+def _set_worker_task(task):
+    global _worker_task
+    _worker_task = task
+
+def _first_pass_shard(shard):
+    path, byte_range = shard
+    return _worker_task.get_shard_values(path, byte_range)
+
+def _get_stat_area_chunk_deltas(rows):
+    return _worker_task.get_stat_area_chunk_deltas(rows)
 
 class LoggerLogHandler(logging.Handler):
     """ Custom log handler that logs messages to another
@@ -59,61 +103,312 @@ class SASIGridderTask(task_manager.Task):
         self.key_attrs = ['gear_id', 'time']
 
         # Define trip type to gear code mappings.
-        self.trip_type_gear_mappings = kwargs.get('gear_mappings', {
-            'hy_drg': 'GC30',
-            'otter': 'GC10',
-            'sca-gc': 'GC21',
-            'sca-la': 'GC20',
-            'shrimp': 'GC11',
-            'squid': 'GC12',
-            'raised': 'GC13',
-            'trap': 'GC60',
-            'gillne': 'GC50',
-            'longli': 'GC40',
-        })
+        self.trip_type_gear_mappings = kwargs.get('gear_mappings')
+        if self.trip_type_gear_mappings is None:
+            self.trip_type_gear_mappings = {
+                'hy_drg': 'GC30',
+                'otter': 'GC10',
+                'sca-gc': 'GC21',
+                'sca-la': 'GC20',
+                'shrimp': 'GC11',
+                'squid': 'GC12',
+                'raised': 'GC13',
+                'trap': 'GC60',
+                'gillne': 'GC50',
+                'longli': 'GC40',
+            }
 
         for kwarg in ['raw_efforts_path', 'grid_path', 'stat_areas_path',
                       'output_path', 'effort_limit']:
             setattr(self, kwarg, kwargs.get(kwarg))
 
-        if not self.output_path:
-            os_hndl, self.output_path = tempfile.mkstemp(
-                prefix="gridded_efforts.", suffix='.csv')
+        # Raw efforts can be one file, or a list of files.
+        if isinstance(self.raw_efforts_path, basestring):
+            self.raw_efforts_paths = [self.raw_efforts_path]
+        else:
+            self.raw_efforts_paths = list(self.raw_efforts_path or [])
+
+        # File to save first-pass values in. If the file exists, values
+        # saved by an earlier run are used, and only raw efforts files
+        # which that run didn't read are read.
+        self.state_path = kwargs.get('state_path')
+
+        # Build dir of an earlier run to resume from, after the last stage
+        # which it saved a checkpoint for. Set use_checkpoints to False to
+        # not save checkpoints.
+        self.resume_dir = kwargs.get('resume_dir')
+        self.use_checkpoints = kwargs.get('use_checkpoints', True)
+
+        # Size of tiles to grid by, in degrees, to bound memory use on
+        # large grids. Tiles should be much larger than cells. Tiled runs
+        # don't save checkpoints or first-pass state, so tile_size can't
+        # be used with state_path or resume_dir.
+        self.tile_size = kwargs.get('tile_size')
+        if self.tile_size and (self.state_path or self.resume_dir):
+            raise ValueError(
+                "tile_size can't be used with state_path or resume_dir")
+
+        # Output file format, one of output.OUTPUT_FORMATS.
+        self.output_format = kwargs.get('output_format', 'csv')
+
+        # Rows whose values are all zero are left out of the output,
+        # unless dense_output is True.
+        self.dense_output = kwargs.get('dense_output', False)
+
+        # Write per-stage metrics as JSON next to the output file, as
+        # well as to data['metrics'].
+        self.write_metrics = kwargs.get('write_metrics', False)
+
+        # Ingested geometry from another task's get_geometry(), with the
+        # same grid, stat areas and settings, to use instead of ingesting
+        # them again. Tiled runs read cells by tile, and don't use it.
+        self.geometry = kwargs.get('geometry')
+
+        self.c_values = None
+        self.position_cache = None
+
+        # Hashes of the input shapefiles, by path. Shapefiles are hashed
+        # once per task, as they can be large. Tasks with the same inputs
+        # can share one dict, to hash them once between them.
+        self.shapefile_hashes = kwargs.get('shapefile_hashes')
+        if self.shapefile_hashes is None:
+            self.shapefile_hashes = {}
+
+        # Build dir of the current run, while it is kept, and whether
+        # gridding failed in it.
+        self.build_dir = None
+        self.gridding_failed = False
+
+        # Number of efforts to assign to cells at a time.
+        self.effort_chunk_size = kwargs.get('effort_chunk_size', 10000)
+
+        # Spatial index backend for cells and stat areas, one of
+        # spatial_index.SPATIAL_INDEX_BACKENDS.
+        self.spatial_index = kwargs.get('spatial_index', 'strtree')
+
+        # Maximum number of effort positions to memoize lookups for, and
+        # optional number of decimal places to round positions to for
+        # the memo's keys. A size of 0 disables the memo.
+        self.position_cache_size = kwargs.get('position_cache_size', 100000)
+        self.position_precision = kwargs.get('position_precision')
+
+        # Number of worker processes for the first pass.
+        self.workers = kwargs.get('workers') or 1
+
+        # Number of workers for distributing stat area values, and
+        # whether they are processes or threads, one of
+        # parallel.WORKER_MODES.
+        self.distribution_workers = kwargs.get('distribution_workers') or \
+                self.workers
+        self.worker_mode = kwargs.get('worker_mode', 'auto')
+
+        # CRS that input shapes are reprojected to.
+        self.target_crs = 'EPSG:4326'
+
+        # Cache for data derived from the input shapefiles, such as the
+        # cell x stat area overlay. Set use_cache to False to disable.
+        if kwargs.get('use_cache', True):
+            self.cache = FileCache(cache_dir=kwargs.get('cache_dir'))
+        else:
+            self.cache = None
+
+        # Names of the loggers the task creates, for release_loggers().
+        self.logger_names = set()
 
         self.message_logger = logging.getLogger("Task%s_msglogger" % id(self))
+        self.logger_names.add(self.message_logger.name)
         main_log_handler = LoggerLogHandler(self.logger)
         main_log_handler.setFormatter(
             logging.Formatter('%(message)s'))
         self.message_logger.addHandler(main_log_handler)
         self.message_logger.setLevel(self.logger.level)
 
+        self.metrics = RunMetrics(logger=self.message_logger)
+
+        # Progress is sent to listeners, callables which take a
+        # progress.ProgressUpdate, at most every progress_interval
+        # seconds. The task's progress follows it.
+        self.progress_reporter = ProgressReporter(
+            min_interval=kwargs.get('progress_interval', .5),
+            listeners=kwargs.get('progress_listeners'))
+        self.progress_reporter.add_listener(self.set_progress)
+
     def call(self):
         self.progress = 1
         self.message_logger.info("Starting...")
 
-        # Create build dir.
-        build_dir = tempfile.mkdtemp(prefix="gridderWork.")
+        if not self.output_path:
+            suffix = {'csv': '.csv', 'columnar': '.cols'}[self.output_format]
+            os_hndl, self.output_path = tempfile.mkstemp(
+                prefix="gridded_efforts.", suffix=suffix)
+
+        # Gridding stages are measured separately, as they run while
+        # the output stage reads rows.
+        with self.metrics.measure('output') as stage_metrics:
+            try:
+                stage_metrics['rows'] = self.write_output(self.iter_rows())
+            except:
+                # Gridding failures are logged by iter_rows().
+                if self.build_dir and not self.gridding_failed:
+                    self.message_logger.info(
+                        "Writing output failed, work files kept in '%s'" % (
+                            self.build_dir))
+                raise
+        self.data['metrics'] = self.metrics.to_dict()
+        if self.write_metrics:
+            metrics_path = self.output_path + '.metrics.json'
+            self.metrics.write_json(metrics_path)
+            self.data['metrics_file'] = metrics_path
+
+        if self.position_cache:
+            cache_stats = self.position_cache.get_stats()
+            self.data['position_cache'] = cache_stats
+            self.message_logger.info(
+                "Position cache: %s hits, %s misses (%.1f%% hit rate)" % (
+                    cache_stats['hits'], cache_stats['misses'],
+                    100.0 * cache_stats['hit_rate']))
+
+        self.progress = 100
+        self.message_logger.info("Gridding completed, output file is:'%s'" % (
+            self.output_path))
+        self.data['output_file'] = self.output_path
+        self.status = 'resolved'
 
-        # Read in data.
+    def set_progress(self, update):
+        self.progress = max(self.progress, int(update.progress))
+
+    def iter_rows(self):
+        """
+        Grid efforts, and yield the gridded rows: tuples of cell id, key
+        attr values and value attr values, as named by
+        get_output_fields().
+
+        call() writes these rows to the output file. Library users can
+        consume them directly, without an output file.
+        """
+        # Create build dir, or pick up from the last completed stage in
+        # the build dir of an earlier run.
+        # Tiled runs don't save checkpoints.
+        if self.resume_dir:
+            build_dir = self.resume_dir
+            completed_stage = self.load_checkpoint(build_dir)
+        else:
+            build_dir = tempfile.mkdtemp(prefix="gridderWork.")
+            completed_stage = None
+        if completed_stage:
+            self.message_logger.info(
+                "Resuming after stage '%s' from '%s'" % (
+                    completed_stage, build_dir))
+            completed_stages = STAGES[:STAGES.index(completed_stage) + 1]
+        else:
+            completed_stages = []
+
+        self.build_dir = build_dir
+        self.gridding_failed = False
+
+        self.gridding_logger = self.get_logger_logger('gridding', "Gridding.",
+                                                      self.logger)
+        try:
+            if self.tile_size:
+                rows = self.run_tiled(build_dir)
+            else:
+                for stage in GRIDDING_STAGES:
+                    # Ingest always runs, as ingested geometry isn't
+                    # checkpointed.
+                    if stage in completed_stages and stage != 'ingest':
+                        continue
+                    self.progress_reporter.start_stage(stage)
+                    with self.metrics.measure(stage) as stage_metrics:
+                        stage_metrics['rows'] = \
+                                getattr(self, 'stage_' + stage)()
+                    self.progress_reporter.finish_stage()
+                    if self.use_checkpoints and stage in CHECKPOINT_STAGES:
+                        self.save_checkpoint(build_dir, stage)
+                rows = iter_value_rows(self.c_values,
+                                       dense=self.dense_output)
+            self.progress_reporter.start_stage('output')
+            for row in rows:
+                yield row
+            self.progress_reporter.finish_stage()
+        except GeneratorExit:
+            # The consumer stopped early, or failed while writing rows.
+            # Keep the build dir, so the run can be resumed.
+            raise
+        except:
+            # Keep the build dir, so the run can be resumed.
+            self.gridding_failed = True
+            self.message_logger.info(
+                "Gridding failed, work files kept in '%s'" % build_dir)
+            raise
+
+        # Only remove the build dir once all rows have been consumed.
+        shutil.rmtree(build_dir)
+        self.build_dir = None
+
+    def iter_batches(self, batch_size=10000):
+        """ Grid efforts, and yield the gridded rows in RowBatches. """
+        return iter_batches(self.iter_rows(), self.get_output_fields(),
+                            batch_size=batch_size)
+
+    def run_tiled(self, build_dir):
+        """
+        Grid tile by tile, with cells and efforts spilled to the build
+        dir, so that only one tile's cells are in memory at a time.
+        """
+        base_msg = "Gridding by tiles..."
+        tiles_logger = self.get_logger_logger('tiles', base_msg, self.logger)
+        self.message_logger.info(base_msg)
+        gridder = TiledGridder(self, os.path.join(build_dir, 'tiles'),
+                               tiles_logger)
+        self.progress_reporter.start_stage('ingest')
+        with self.metrics.measure('ingest') as stage_metrics:
+            self.ingest_stat_areas(parent_logger=tiles_logger)
+            self.cells = {}
+            self.init_values()
+            stage_metrics['rows'] = gridder.spill_cells() + \
+                    len(self.stat_areas)
+        self.progress_reporter.finish_stage()
+        gridder.run()
+        return gridder.iter_rows()
+
+    def stage_ingest(self):
+        """ Read in cells and stat areas, and overlay them. """
         base_msg = "Ingesting..."
         ingest_logger = self.get_logger_logger('ingest', base_msg,
                                                self.logger)
         self.message_logger.info(base_msg)
 
-        # Read in cells.
-        self.ingest_cells(parent_logger=ingest_logger, limit=None)
+        if self.geometry:
+            for attr in GEOMETRY_ATTRS:
+                setattr(self, attr, self.geometry[attr])
+            ingest_logger.info("using %s shared cells and %s stat_areas" % (
+                len(self.cells), len(self.stat_areas)))
+        else:
+            # Read in cells.
+            self.ingest_cells(parent_logger=ingest_logger, limit=None)
+
+            # Read in stat_areas.
+            self.ingest_stat_areas(parent_logger=ingest_logger)
+
+            # Overlay cells with stat_areas.
+            self.overlay = self.get_overlay(parent_logger=ingest_logger)
 
-        # Read in stat_areas.
-        self.ingest_stat_areas(parent_logger=ingest_logger)
+        # Values may have been loaded from a checkpoint.
+        if self.c_values is None:
+            self.init_values()
 
+        return len(self.cells) + len(self.stat_areas)
+
+    def get_geometry(self):
+        """ Get the ingested geometry, to share with other tasks. """
+        return dict([(attr, getattr(self, attr)) for attr in GEOMETRY_ATTRS])
+
+    def stage_first_pass(self):
         #
         #  Main part of the gridding task.
         #   
 
-        base_msg = "Gridding."
-        gridding_logger = self.get_logger_logger('gridding', base_msg,
-                                                  self.logger)
-        self.message_logger.info(base_msg)
+        self.message_logger.info("Gridding.")
 
         #
         # 0. Terms used here:
@@ -139,105 +434,55 @@ class SASIGridderTask(task_manager.Task):
         # from clean efforts.
         #
 
-
-        # Do the first pass on efforts
-        # as we read them in.
-        
-
         base_msg = "Assigning raw efforts to cells/stat_areas ... "
         fp_logger = self.get_logger_logger('first_pass', base_msg,
-                                              gridding_logger)
+                                           self.gridding_logger)
         fp_logger.info(base_msg)
 
-        unassigned = {}
-
-        logging_interval = 1e4
-
-        # Define functions to handle raw effort columns
-        def trip_type_to_gear_id(trip_type):
-            return self.trip_type_gear_mappings.get(trip_type)
-
-        def float_w_empty_dot(value):
-            if value == '.' or value == '':
-                return None
-            elif value is not None:
-                return float(value)
-
-        # Define function to execute after each raw effort is mapped to an
-        # effort column. This is the first pass described above.
-        def first_pass(data=None, **kwargs):
-            #effort = data
-
-            #if (effort_counter % 1e3) == 0:
-            #    print ["%s: %.3e" % (k, v) for k,v in c_.items()]
-
-            # If effort has lat and lon...
-            if data.lat is not None and data.lon is not None:
-                # Can effort can be assigned to cell?
-                cell = self.get_cell_for_pos(data.lat, data.lon)
-                if cell:
-                    self.add_effort_to_cell(cell, data)
-                    return
-
-                # Otherwise can effort can be assigned to statarea?
-                stat_area = self.get_stat_area_for_pos(
-                    data.lat, data.lon)
-                if stat_area:
-                    self.add_effort_to_stat_area(stat_area, data)
-                    return
-
-                # Otherwise add to unassigned.
-                else:
-                    self.add_effort_to_unassigned(unassigned, data)
-                    return
-
-            # Otherwise if effort has a stat area...
-            elif data.stat_area_id is not None:
-                stat_area = self.stat_areas.get(data.stat_area_id)
-                if not stat_area:
-                    self.add_effort_to_unassigned(unassigned, data)
-                    return
-                else:
-                    self.add_effort_to_stat_area(stat_area, data)
-                    return
-
-            # Otherwise add to unassigned list.
+        self.init_position_cache()
+
+        # Start from saved first-pass values if we have a state file, and
+        # only read the raw effort files which it doesn't include yet.
+        use_state = self.state_path and not self.effort_limit
+        if use_state:
+            raw_efforts_paths = self.load_state(logger=fp_logger)
+        else:
+            raw_efforts_paths = self.raw_efforts_paths
+
+        # Read raw efforts in chunks of columns, and do the first pass
+        # on each chunk as we read it in. With multiple workers, raw
+        # efforts files are split into shards which are read in parallel.
+        # Progress is reported in bytes of raw efforts read.
+        progress = self.progress_reporter
+        file_sizes = [os.path.getsize(path) for path in raw_efforts_paths]
+        progress.set_total(sum(file_sizes), unit='bytes')
+        effort_counter = 0
+        bytes_done = 0
+        for path, file_size in izip(raw_efforts_paths, file_sizes):
+            if self.effort_limit:
+                limit = self.effort_limit - effort_counter
+                if limit <= 0:
+                    break
+                effort_counter += self.run_first_pass(
+                    self.get_effort_reader(path, limit=limit),
+                    progress=progress, bytes_done=bytes_done)
+            elif self.workers > 1 and can_fork_workers():
+                effort_counter += self.run_sharded_first_pass(
+                    path, logger=fp_logger)
             else:
-                self.add_effort_to_unassigned(unassigned, data)
-                return
+                effort_counter += self.run_first_pass(
+                    self.get_effort_reader(path), progress=progress,
+                    bytes_done=bytes_done)
+            bytes_done += file_size
+            progress.update(bytes_done)
+        fp_logger.info("%s efforts total" % effort_counter)
 
-        # Create and run effort ingestor.
-        ingestor = Ingestor(
-            reader=CSVReader(csv_file=self.raw_efforts_path),
-            processors=[
-                ClassMapper(
-                    clazz=models.Effort,
-                    mappings=[
-                        {'source': 'trip_type', 'target': 'gear_id', 
-                         'processor': trip_type_to_gear_id},
-                        {'source': 'year', 'target': 'time',
-                         'processor': float_w_empty_dot},
-                        {'source': 'nemarea', 'target': 'stat_area_id',
-                         'processor': float_w_empty_dot},
-                        {'source': 'A', 'target': 'a',
-                         'processor': float_w_empty_dot},
-                        {'source': 'value', 'target': 'value',
-                         'processor': float_w_empty_dot},
-                        {'source': 'hours_fished', 'target': 'hours_fished',
-                         'processor': float_w_empty_dot},
-                        {'source': 'lat', 'target': 'lat', 
-                         'processor': float_w_empty_dot},
-                        {'source': 'lon', 'target': 'lon',
-                         'processor': float_w_empty_dot}
-                    ],
-                ),
-                first_pass,
-            ],
-            logger=fp_logger,
-            get_count=True,
-            limit=self.effort_limit,
-        ).ingest() 
+        if use_state:
+            self.save_state(logger=fp_logger)
 
+        return effort_counter
+
+    def stage_stat_area_distribution(self):
         # 
         # 2. For each effort assigned to a stat area,
         # distribute values across cracked cells in that stat area.
@@ -250,65 +495,56 @@ class SASIGridderTask(task_manager.Task):
         # We distribute the effort proportionally to the cracked cells,
         # so that 'C1' gets 33 additional effort points, and 'C2' gets 66 additional effort points.
         #
+        # Each stat area's values are distributed in proportion to the cells'
+        # values from the first pass, so the result doesn't depend on the
+        # order in which stat areas are processed.
+        #
 
         base_msg = "Distributing stat_area values to cells ... "
         sa_logger = self.get_logger_logger('stat_areas', base_msg,
-                                              gridding_logger)
+                                           self.gridding_logger)
         sa_logger.info(base_msg)
 
-        num_stat_areas = len(self.stat_areas)
-        logging_interval = 1
-        sa_counter = 0
-        for stat_area in self.stat_areas.values():
-            sa_counter += 1
-            if (sa_counter % logging_interval) == 0:
-                sa_logger.info("stat_area %s of %s (%.1f%%)" % (
-                    sa_counter, num_stat_areas, 
-                    100.0 * sa_counter/num_stat_areas))
-
-            # Get stat area values.
-            sa_keyed_values = self.sa_values.setdefault(stat_area.id, {})
-
-            # Get list of cracked cells.
-            cracked_cells = self.get_cracked_cells_for_stat_area(stat_area)
-
-            # Calculate totals for values across cracked cells.
-            ccell_totals = {}
-            for ccell in cracked_cells:
-                for effort_key, ccell_values in ccell.keyed_values.items():
-                    ccell_totals_values = ccell_totals.setdefault(
-                        effort_key,
-                        self.new_values_dict()
-                    )
-                    for attr, ccell_value in ccell_values.items():
-                        ccell_totals_values[attr] += ccell_value
-
-            # Distribute the stat area's values across the cracked
-            # cells, in proportion to the cracked cell's values as a
-            # percentage of the stat area's cracked cell totals.
-            for ccell in cracked_cells:
-                pcell_keyed_values = self.c_values[ccell.parent_cell.id]
-                for effort_key, sa_values in sa_keyed_values.items():
-                    ccell_totals_values = ccell_totals.get(effort_key)
-                    ccell_values = ccell.keyed_values.get(effort_key)
-                    pcell_values = pcell_keyed_values.setdefault(
-                        effort_key, self.new_values_dict())
-                    if not ccell_totals_values or not ccell_values:
-                        continue
-                    for attr, sa_value in sa_values.items():
-                        # Don't add anything for empty values.
-                        # This also avoids division by zero errors.
-                        if not sa_value:
-                            continue
-                        ccell_value = ccell_values.get(attr, 0.0)
-                        ccell_totals_value = ccell_totals_values.get(attr, 0.0)
-                        if not ccell_value or not ccell_totals_value:
-                            continue
-                        pct_value = ccell_value/ccell_totals_value
-                        # Add proportional value to cracked cell's parent 
-                        # cell.
-                        pcell_values[attr] += sa_value * pct_value
-
+        # Build the sparse stat_area x cell matrix of overlap weights.
+        # Matrix rows and columns follow the value accumulators' items.
+        overlap_matrix = OverlapMatrix(self.overlay, self.sa_values.items.keys,
+                                       self.c_values.items.idxs)
+        sa_logger.info("%s stat_areas, %s cracked cells" % (
+            len(overlap_matrix), overlap_matrix.nnz))
+
+        # Distribute the stat areas' values across their cracked cells,
+        # and add the distributed values to the cracked cells' parent
+        # cells. Stat areas are distributed in chunks, which can be run
+        # by workers. Chunks' deltas are summed in chunk order, so the
+        # result doesn't depend on the number of workers.
+        self.c_values.pad()
+        self.sa_values.pad()
+        self.overlap_matrix = overlap_matrix
+        chunks = get_row_chunks(len(overlap_matrix))
+        self.progress_reporter.set_total(len(chunks), unit='chunks')
+        if self.distribution_workers > 1:
+            sa_logger.info("distributing %s chunks with %s workers" % (
+                len(chunks), self.distribution_workers))
+            _set_worker_task(self)
+            try:
+                chunk_deltas = map_in_workers(
+                    _get_stat_area_chunk_deltas, chunks,
+                    self.distribution_workers, mode=self.worker_mode)
+            finally:
+                _set_worker_task(None)
+        else:
+            chunk_deltas = imap(self.get_stat_area_chunk_deltas, chunks)
+        deltas = {}
+        for chunk_delta in chunk_deltas:
+            add_deltas(deltas, chunk_delta)
+            self.progress_reporter.add()
+        for c, delta in deltas.items():
+            self.c_values.add_block(c, delta)
+        self.overlap_matrix = None
+
+        return len(overlap_matrix)
+
+    def stage_unassigned_distribution(self):
         #
         # 3. For efforts which could not be assigned to a cell or a stat area
         # ('super-dirty' efforts), distribute the efforts across all cells,
@@ -330,43 +566,19 @@ class SASIGridderTask(task_manager.Task):
         # 'C2' has 166 + 55 = 221 effort points.
         base_msg = "Distributing unassigned values to cells ... "
         unassigned_logger = self.get_logger_logger('unassigned', base_msg,
-                                              gridding_logger)
+                                                   self.gridding_logger)
         unassigned_logger.info(base_msg)
 
         # Calculate totals across all cells.
-        totals = {}
-        num_cells = len(self.cells)
-        for cell in self.cells.values():
-            cell_keyed_values = self.c_values[cell.id]
-            for effort_key, cell_values in cell_keyed_values.items():
-                totals_values = totals.setdefault(
-                    effort_key, 
-                    self.new_values_dict()
-                )
-                for attr, cell_value in cell_values.items():
-                    totals_values[attr] += cell_value
+        self.c_values.pad()
+        totals = self.c_values.get_totals()
 
         # Distribute unassigned efforts across all cells,
         # in proportion to the cell's values as a percentage of the total.
-        logging_interval = 1e3
-        cell_counter = 0
-        for cell in self.cells.values():
-            cell_counter += 1
-            if (cell_counter % logging_interval) == 0:
-                unassigned_logger.info("cell %s of %s (%.1f%%)" % (
-                    cell_counter, num_cells, 100.0 * cell_counter/num_cells))
-
-            cell_keyed_values = self.c_values[cell.id]
-            for effort_key, unassigned_values in unassigned.items():
-                cell_values = cell_keyed_values.get(effort_key)
-                if not cell_values:
-                    continue
-                for attr, unassigned_value in unassigned_values.items():
-                    if not unassigned_value:
-                        continue
-                    cell_value = cell_values.get(attr, 0.0)
-                    pct_value = cell_value/unassigned_value
-                    cell_values[attr] += unassigned_value * pct_value
+        self.c_values.scale(self.get_unassigned_factors(
+            totals, logger=unassigned_logger))
+
+        return len(self.c_values.items)
 
         # Done with gridding. At this point the effort has been distributed. 
 
@@ -375,35 +587,84 @@ class SASIGridderTask(task_manager.Task):
         # not used by any effort assigned to a cell or a stat_area, then 
         # no cell will have a non-zero pct_value for that effort_key.
 
-        #
-        # Output gridded efforts.
-        #
-        with open(self.output_path, "w") as f:
-            w = csv.writer(f)
-            fields = ['cell_id'] + self.key_attrs + self.value_attrs
-            w.writerow(fields)
-
-            for cell in self.cells.values():
-                cell_keyed_values = self.c_values[cell.id]
-                for keys, values in cell_keyed_values.items():
-                    row_dict = {
-                        'cell_id': cell.id
-                    }
-                    for i in range(len(self.key_attrs)):
-                        row_dict[self.key_attrs[i]] = keys[i]
-                    row_dict.update(values)
-                    w.writerow([row_dict[f] for f in fields])
-
-        shutil.rmtree(build_dir)
-
-        self.progress = 100
-        self.message_logger.info("Gridding completed, output file is:'%s'" % (
-            self.output_path))
-        self.data['output_file'] = self.output_path
-        self.status = 'resolved'
+    def get_unassigned_factors(self, totals, logger=None):
+        """
+        Get factors to scale cells' values by, to distribute unassigned
+        values in proportion to cells' shares of the all-cell totals:
+        cell += unassigned * cell/total, or cell *= 1 + unassigned/total.
+        The factors are computed once per effort key and value attr, and
+        applied to every cell's block.
+        """
+        unassigned_block = self.unassigned.get_block(
+            self.unassigned.get_item_idx(None))
+        factors = array('d', [1.0]) * len(totals)
+        undistributed_counter = 0
+        for j, unassigned_value in enumerate(unassigned_block):
+            if not unassigned_value:
+                continue
+            if not totals[j]:
+                undistributed_counter += 1
+                continue
+            factors[j] += unassigned_value/totals[j]
+        if undistributed_counter and logger:
+            logger.info(
+                "%s unassigned values had no cell values to follow" % (
+                    undistributed_counter))
+        return factors
+
+    def get_output_fields(self):
+        return ['cell_id'] + self.key_attrs + self.value_attrs
+
+    def write_output(self, rows):
+        """ Output gridded efforts, in the output format. Returns the
+        number of rows. """
+        if self.output_format == 'columnar':
+            return write_columnar(self.output_path, self.key_attrs,
+                                  self.value_attrs, rows)
+        return write_csv(self.output_path, self.get_output_fields(), rows)
+
+    def save_checkpoint(self, build_dir, stage):
+        """ Save values after a completed stage to the build dir. """
+        state = GridderState(self.get_checkpoint_fingerprint(), {},
+                             self.c_values, self.sa_values, self.unassigned,
+                             stage=stage)
+        save_state(os.path.join(build_dir, CHECKPOINT_FILE), state)
+
+    def load_checkpoint(self, build_dir):
+        """
+        Load values from the checkpoint in a build dir. Returns the stage
+        the checkpoint was saved after, or None if there is no checkpoint
+        for the current inputs.
+        """
+        path = os.path.join(build_dir, CHECKPOINT_FILE)
+        state = load_state(path)
+        if state is None:
+            self.message_logger.info("No checkpoint in '%s'" % build_dir)
+            return None
+        if not state.can_extend(self.get_checkpoint_fingerprint(), []):
+            self.message_logger.info(
+                "Checkpoint in '%s' doesn't match inputs, starting over" % (
+                    build_dir))
+            return None
+        self.effort_keys = state.c_values.effort_keys
+        self.c_values = state.c_values
+        self.sa_values = state.sa_values
+        self.unassigned = state.unassigned
+        return state.stage
+
+    def get_checkpoint_fingerprint(self):
+        """ Fingerprint of the inputs and settings for checkpoints. Raw
+        efforts files are identified by their sizes and modification
+        times, rather than hashed. """
+        return get_cache_key(
+            self.get_state_fingerprint(),
+            [get_file_signature(path) for path in self.raw_efforts_paths],
+            self.effort_limit
+        )
 
     def get_logger_logger(self, name=None, base_msg=None, parent_logger=None):
         logger = logging.getLogger("%s_%s" % (id(self), name))
+        self.logger_names.add(logger.name)
         formatter = logging.Formatter(base_msg + ' %(message)s.')
         log_handler = LoggerLogHandler(parent_logger)
         log_handler.setFormatter(formatter)
@@ -411,146 +672,437 @@ class SASIGridderTask(task_manager.Task):
         logger.setLevel(self.message_logger.level)
         return logger
 
+    def release_loggers(self):
+        """
+        Remove the loggers the task created from the logging module, so
+        that long-lived processes which run many tasks don't accumulate
+        them. Logger names include the task's id, which a later task can
+        reuse, so a later task could otherwise inherit the handlers.
+        The task shouldn't log after this.
+        """
+        logging._acquireLock()
+        try:
+            for name in self.logger_names:
+                logger = logging.Logger.manager.loggerDict.pop(name, None)
+                if isinstance(logger, logging.Logger):
+                    for handler in list(logger.handlers):
+                        logger.removeHandler(handler)
+        finally:
+            logging._releaseLock()
+        self.logger_names = set()
+
     def get_cell_for_pos(self, lat, lon):
         """
         Get cell which contains given point, via
-        spatial hash.
+        the cell index.
         """
-        pos_wkt = 'POINT(%s %s)' % (lon, lat)
-        pnt_shp = gis_util.wkt_to_shape(pos_wkt)
-        candidates = self.cell_spatial_hash.items_for_point((lon,lat))
-        for c in candidates:
-            if gis_util.get_intersection(c.shape, pnt_shp):
-                return c
-        return None
+        return self.cell_assigner.item_for_pos(lon, lat)
+
+    def get_effort_reader(self, path, byte_range=None, limit=None):
+        return RawEffortReader(
+            path,
+            gear_mappings=self.trip_type_gear_mappings,
+            chunk_size=self.effort_chunk_size,
+            limit=limit,
+            byte_range=byte_range,
+        )
+
+    def init_position_cache(self):
+        if self.position_cache_size:
+            self.position_cache = PositionCache(
+                max_size=self.position_cache_size,
+                precision=self.position_precision)
+        else:
+            self.position_cache = None
+
+    def run_first_pass(self, reader, progress=None, bytes_done=0):
+        """
+        Run the first pass on each chunk from a reader. If progress is
+        given, as a ProgressReporter, the bytes read are reported to it,
+        after bytes_done bytes of earlier files.
+        """
+        effort_counter = 0
+        for chunk in reader:
+            self.first_pass(chunk)
+            effort_counter += len(chunk)
+            if progress:
+                progress.update(bytes_done + reader.position)
+        return effort_counter
+
+    def run_sharded_first_pass(self, path, logger=None):
+        """
+        Run the first pass on shards of a raw efforts file in a pool of
+        worker processes, and merge the workers' values. Workers inherit
+        the task's cells, stat areas and indexes when forked.
+        """
+        shards = [(path, byte_range)
+                  for byte_range in get_shards(path, self.workers)]
+        if logger:
+            logger.info("reading %s shards with %s workers" % (
+                len(shards), self.workers))
+        _set_worker_task(self)
+        try:
+            results = map_in_processes(_first_pass_shard, shards, self.workers)
+        finally:
+            _set_worker_task(None)
+
+        # Merge in shard order, so results don't depend on scheduling.
+        effort_counter = 0
+        for result in results:
+            self.c_values.merge(result['c_values'])
+            self.sa_values.merge(result['sa_values'])
+            self.unassigned.merge(result['unassigned'])
+            if self.position_cache and result['position_cache']:
+                hits, misses = result['position_cache']
+                self.position_cache.hits += hits
+                self.position_cache.misses += misses
+            effort_counter += result['count']
+        return effort_counter
+
+    def get_stat_area_chunk_deltas(self, rows):
+        """ Get cell deltas for a chunk of overlap matrix rows. """
+        return get_stat_area_deltas(self.overlap_matrix,
+                                    self.sa_values.blocks,
+                                    self.c_values.blocks,
+                                    self.c_values.block_size, rows=rows)
+
+    def get_shard_values(self, path, byte_range):
+        """
+        Run the first pass on one shard of a raw efforts file, into
+        fresh value accumulators. Called in shard worker processes.
+        """
+        self.init_values()
+        self.init_position_cache()
+        count = self.run_first_pass(
+            self.get_effort_reader(path, byte_range=byte_range))
+        if self.position_cache:
+            cache_counts = (self.position_cache.hits,
+                            self.position_cache.misses)
+        else:
+            cache_counts = None
+        return {
+            'c_values': self.c_values,
+            'sa_values': self.sa_values,
+            'unassigned': self.unassigned,
+            'position_cache': cache_counts,
+            'count': count,
+        }
+
+    def first_pass(self, chunk):
+        """
+        Assign a chunk of raw efforts to cells, stat areas, or unassigned
+        values, as described in call().
+        """
+        # Look up the chunk's positions in one batch.
+        assignments = self.get_assignments_for_positions(chunk.lat, chunk.lon)
+
+        effort_keys = chunk.get_effort_keys(self.key_attrs)
+        value_rows = chunk.get_value_rows(self.value_attrs)
+        for (cell, stat_area), lat, lon, stat_area_id, effort_key, values in \
+                izip(assignments, chunk.lat, chunk.lon, chunk.stat_area_id,
+                     effort_keys, value_rows):
+            # Can effort be assigned to cell?
+            if cell:
+                self.add_effort_to_cell(cell, effort_key, values)
+
+            # If effort has lat and lon (i.e. they're not NaN)...
+            elif lat == lat and lon == lon:
+                # Can effort can be assigned to statarea?
+                if stat_area:
+                    self.add_effort_to_stat_area(stat_area, effort_key, values)
+
+                # Otherwise add to unassigned.
+                else:
+                    self.add_effort_to_unassigned(effort_key, values)
+
+            # Otherwise if effort has a stat area...
+            elif stat_area_id == stat_area_id:
+                stat_area = self.stat_areas.get(stat_area_id)
+                if not stat_area:
+                    self.add_effort_to_unassigned(effort_key, values)
+                else:
+                    self.add_effort_to_stat_area(stat_area, effort_key, values)
+
+            # Otherwise add to unassigned list.
+            else:
+                self.add_effort_to_unassigned(effort_key, values)
+
+    def get_assignments_for_positions(self, lats, lons):
+        """
+        Get (cell, stat_area) assignments for lists of positions.
+        The stat area is only looked up for positions which are not in
+        any cell. Unassigned or missing (None or NaN) positions get
+        (None, None).
+        Results are memoized in the position cache.
+        """
+        cache = self.position_cache
+        assignments = [(None, None)] * len(lats)
+        miss_idxs = []
+        miss_lats = []
+        miss_lons = []
+        for i, (lat, lon) in enumerate(izip(lats, lons)):
+            if lat is None or lon is None or lat != lat or lon != lon:
+                continue
+            if cache:
+                cached = cache.get(cache.get_key(lat, lon))
+                if cached is not None:
+                    assignments[i] = cached
+                    continue
+            miss_idxs.append(i)
+            miss_lats.append(lat)
+            miss_lons.append(lon)
+
+        cell_ids = self.cell_assigner.assign(miss_lats, miss_lons)
+        for i, lat, lon, cell_id in izip(miss_idxs, miss_lats, miss_lons,
+                                         cell_ids):
+            if cell_id != self.cell_assigner.unassigned_id:
+                assignment = (self.cells[cell_id], None)
+            else:
+                assignment = (None, self.get_stat_area_for_pos(lat, lon))
+            assignments[i] = assignment
+            if cache:
+                cache.set(cache.get_key(lat, lon), assignment)
+        return assignments
 
     def get_stat_area_for_pos(self, lat, lon):
-        pos_wkt = 'POINT(%s %s)' % (lon, lat)
-        pnt_shp = gis_util.wkt_to_shape(pos_wkt)
-        candidates = self.sa_spatial_hash.items_for_point((lon,lat))
+        candidates = self.sa_index.items_for_point((lon,lat))
         for c in candidates:
-            if gis_util.get_intersection(c.shape, pnt_shp):
+            if c.prepared.contains_point(lon, lat):
                 return c
         return None
 
-    def new_values_dict(self):
-        return dict(zip(self.value_attrs, [0.0] * len(self.value_attrs)))
-
-    def update_values_dict(self, values_dict, effort):
-        for k in values_dict.keys():
-            effort_value = getattr(effort, k, 0.0)
-            if effort_value is None:
-                effort_value = 0.0
-            values_dict[k] += effort_value
-
-    def add_effort_to_keyed_values_dict(self, kvd, effort):
-        values = kvd.setdefault(
-            self.get_effort_key(effort), 
-            self.new_values_dict()
+    def init_values(self):
+        """
+        Initialize value accumulators for cells, stat areas and unassigned
+        efforts. The accumulators share one index of effort keys.
+        """
+        self.effort_keys = KeyIndex()
+        self.c_values = Accumulator(self.value_attrs, self.effort_keys,
+                                    items=KeyIndex(self.cells.keys()))
+        self.sa_values = Accumulator(self.value_attrs, self.effort_keys,
+                                     items=KeyIndex(self.stat_areas.keys()))
+        self.unassigned = Accumulator(self.value_attrs, self.effort_keys)
+
+    def get_state_fingerprint(self):
+        """ Fingerprint of the inputs and settings first-pass values
+        depend on, other than the raw efforts. """
+        return get_cache_key(
+            self.get_shapefile_hash(self.grid_path),
+            self.get_shapefile_hash(self.stat_areas_path),
+            self.target_crs,
+            sorted(self.trip_type_gear_mappings.items()),
+            self.key_attrs,
+            self.value_attrs,
+            GRIDDER_STATE_VERSION
         )
-        self.update_values_dict(values, effort)
 
-    def add_effort_to_cell(self, cell, effort):
-        cell_keyed_values = self.c_values[cell.id]
-        self.add_effort_to_keyed_values_dict(cell_keyed_values, effort)
+    def get_shapefile_hash(self, shp_path):
+        """ Get a shapefile's hash, computed once per task, or once
+        per shared shapefile_hashes dict. """
+        if shp_path not in self.shapefile_hashes:
+            self.shapefile_hashes[shp_path] = get_shapefile_hash(shp_path)
+        return self.shapefile_hashes[shp_path]
 
-    def add_effort_to_stat_area(self, stat_area, effort):
-        sa_keyed_values = self.sa_values.setdefault(stat_area.id, {})
-        self.add_effort_to_keyed_values_dict(sa_keyed_values, effort)
-
-    def add_effort_to_unassigned(self, unassigned, effort):
-        self.add_effort_to_keyed_values_dict(unassigned, effort)
+    def load_state(self, logger):
+        """
+        Load first-pass values from the state file, if it can be extended
+        to the current inputs. Returns the raw efforts paths which haven't
+        been read into the values yet.
+        """
+        self.state_fingerprint = self.get_state_fingerprint()
+        self.effort_files = {}
+        effort_hashes = [get_file_hash(path)
+                         for path in self.raw_efforts_paths]
+
+        state = load_state(self.state_path)
+        if state is None:
+            logger.info("no saved state in '%s'" % self.state_path)
+        elif not state.can_extend(self.state_fingerprint, effort_hashes):
+            logger.info("saved state in '%s' doesn't match inputs, "
+                        "starting over" % self.state_path)
+        else:
+            self.effort_keys = state.c_values.effort_keys
+            self.c_values = state.c_values
+            self.sa_values = state.sa_values
+            self.unassigned = state.unassigned
+            self.effort_files.update(state.effort_files)
+            logger.info("loaded saved state for %s effort files" % (
+                len(state.effort_files)))
+
+        new_paths = []
+        for path, effort_hash in zip(self.raw_efforts_paths, effort_hashes):
+            if effort_hash not in self.effort_files:
+                self.effort_files[effort_hash] = path
+                new_paths.append(path)
+        return new_paths
+
+    def save_state(self, logger):
+        """ Save first-pass values to the state file. """
+        state = GridderState(self.state_fingerprint, self.effort_files,
+                             self.c_values, self.sa_values, self.unassigned)
+        save_state(self.state_path, state)
+        self.data['state_path'] = self.state_path
+        logger.info("saved state to '%s'" % self.state_path)
+
+    def add_effort_to_cell(self, cell, effort_key, values):
+        self.c_values.add(cell.id, effort_key, values)
+
+    def add_effort_to_stat_area(self, stat_area, effort_key, values):
+        self.sa_values.add(stat_area.id, effort_key, values)
+
+    def add_effort_to_unassigned(self, effort_key, values):
+        self.unassigned.add(None, effort_key, values)
 
     def get_effort_key(self, effort):
         """  Key for grouping values by effort types. """
         return tuple([getattr(effort, attr, None) for attr in self.key_attrs])
 
     def ingest_cells(self, parent_logger=None, limit=None):
-        self.cells = {}
-        self.cell_spatial_hash = SpatialHash(cell_size=.1)
-        self.c_values = {}
         logger = self.get_logger_logger(
             name='cell_ingest', 
             base_msg='Ingesting cells...',
             parent_logger=parent_logger
         )
 
-        Ingestor(
-            reader=ShapefileReader(shp_file=self.grid_path,
-                                   reproject_to='EPSG:4326'),
-            processors=[
-                ClassMapper(
-                    clazz=models.Cell,
-                    mappings=[{'source': 'ID', 'target': 'id'},
-                              {'source': '__shape', 'target': 'shape'},],
-                ),
-                DictWriter(dict_=self.cells, key_func=lambda c: c.id),
-            ],
-            logger=logger,
-            limit=limit
-        ).ingest()
+        self.cells = self.ingest_features(
+            'cells', self.grid_path, models.Cell, 'ID', logger, limit=limit)
+        self.index_cells(logger=logger)
 
-        # Calculate cell areas and add cells to spatial hash,
-        # and initialize c_values.
-        for cell in self.cells.values():
-            cell.area = gis_util.get_shape_area(cell.shape)
-            cell.mbr = gis_util.get_shape_mbr(cell.shape)
-            self.cell_spatial_hash.add_rect(cell.mbr, cell)
-            self.c_values[cell.id] = {}
+    def index_cells(self, logger=None):
+        # Index cells. Regular lattice grids can be indexed arithmetically,
+        # other grids go in a spatial index.
+        self.cell_index = RegularLattice.from_cells(self.cells.values())
+        if self.cell_index:
+            if logger:
+                logger.info("grid is a regular lattice")
+        else:
+            self.cell_index = build_spatial_index(
+                self.cells.values(), backend=self.spatial_index)
+
+        self.cell_assigner = PointAssigner(self.cell_index)
 
     def ingest_stat_areas(self, parent_logger=None, limit=None):
-        self.stat_areas = {}
-        self.sa_spatial_hash = SpatialHash(cell_size=.1)
-        self.sa_values = {}
         logger = self.get_logger_logger(
             name='stat_area_ingest', 
             base_msg='Ingesting stat_areas...',
             parent_logger=parent_logger
         )
 
+        self.stat_areas = self.ingest_features(
+            'stat_areas', self.stat_areas_path, models.StatArea, 'SAREA',
+            logger, limit=limit)
+        self.sa_index = build_spatial_index(
+            self.stat_areas.values(), backend=self.spatial_index)
+
+    def ingest_features(self, kind, shp_path, clazz, id_field, logger,
+                        limit=None):
+        """
+        Ingest features from a shapefile into a dict of clazz instances
+        with id, shape, area, mbr and prepared attrs, keyed by id.
+
+        Features are cached in a binary geometry cache, by the contents of
+        the shapefile and the CRS they are reprojected to, so that later
+        runs can skip reading and reprojecting the shapefile.
+        """
+        if self.cache and not limit:
+            cache_key = get_cache_key(self.get_shapefile_hash(shp_path),
+                                      self.target_crs, GEOMETRY_CACHE_VERSION)
+            cache_path = self.cache.get_path(kind, cache_key, ext='geom')
+            features = self.load_cached_features(cache_path, clazz)
+            if features is not None:
+                logger.info("loaded %s cached %s" % (len(features), kind))
+                return features
+
+        features = {}
+        self.read_features(features, shp_path, clazz, id_field, logger,
+                           limit=limit)
+
+        # Calculate areas, and prepare shapes for lookups.
+        for feature in features.values():
+            feature.area = gis_util.get_shape_area(feature.shape)
+            feature.mbr = gis_util.get_shape_mbr(feature.shape)
+            feature.prepared = PreparedShape(feature.shape)
+
+        if self.cache and not limit:
+            def get_cache_features():
+                for feature in features.values():
+                    yield (feature.id, feature.prepared.get_polygons(),
+                           feature.area, feature.mbr)
+            path = self.cache.write(
+                kind, cache_key,
+                lambda f: write_geometry_cache(f, get_cache_features()),
+                ext='geom')
+            logger.info("cached %s in '%s'" % (kind, path))
+        return features
+
+    def read_features(self, features, shp_path, clazz, id_field, logger,
+                      limit=None):
+        """
+        Read features from a shapefile into a mapping, as clazz instances
+        with id and shape attrs, keyed by id.
+        """
         Ingestor(
-            reader=ShapefileReader(shp_file=self.stat_areas_path,
-                                   reproject_to='EPSG:4326'),
+            reader=ShapefileReader(shp_file=shp_path,
+                                   reproject_to=self.target_crs),
             processors=[
                 ClassMapper(
-                    clazz=models.StatArea,
-                    mappings=[{'source': 'SAREA', 'target': 'id'},
+                    clazz=clazz,
+                    mappings=[{'source': id_field, 'target': 'id'},
                               {'source': '__shape', 'target': 'shape'},],
                 ),
-                DictWriter(dict_=self.stat_areas, key_func=lambda sa: sa.id),
+                DictWriter(dict_=features, key_func=lambda f: f.id),
             ],
             logger=logger,
             limit=limit
         ).ingest()
 
-        # Add to spatial hash.
-        for stat_area in self.stat_areas.values():
-            stat_area.mbr = gis_util.get_shape_mbr(stat_area.shape)
-            self.sa_spatial_hash.add_rect(stat_area.mbr, stat_area)
-
-    def get_cracked_cells_for_stat_area(self, stat_area):
-        cracked_cells = []
-        candidates = self.cell_spatial_hash.items_for_rect(stat_area.mbr)
-        for icell in candidates:
-            intersection = gis_util.get_intersection(stat_area.shape, icell.shape)
-            if not intersection:
-                continue
+    def load_cached_features(self, cache_path, clazz):
+        """
+        Load features from a geometry cache, or None if not cached.
+        Features' rings are read from the cache, and their shapes built,
+        when they are first used, so the cache is left open.
+        """
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            geometry_cache = GeometryCache(cache_path)
+        except (IOError, ValueError):
+            return None
+        features = {}
+        for feature_id, prepared, area, mbr in geometry_cache.iter_features():
+            features[feature_id] = clazz(id=feature_id, area=area, mbr=mbr,
+                                         prepared=prepared)
+        return features
+
+    def get_overlay(self, parent_logger=None):
+        """
+        Get the overlay of cells with stat areas. Overlays are cached by
+        the contents of the grid and stat area shapefiles, and the CRS
+        they are reprojected to.
+        """
+        logger = self.get_logger_logger(
+            name='overlay', 
+            base_msg='Overlaying cells with stat_areas...',
+            parent_logger=parent_logger
+        )
 
-            intersection_area = gis_util.get_shape_area(intersection)
-            pct_area = intersection_area/icell.area
-
-            # Set cracked cell values in proportion to percentage
-            # of parent cell's area.
-            ccell_keyed_values = {}
-            icell_keyed_values = self.c_values[icell.id]
-            for effort_key, icell_values in icell_keyed_values.items():
-                ccell_values = ccell_keyed_values.setdefault(effort_key, {})
-                for attr, value in icell_values.items():
-                    ccell_values[attr] = pct_area * value
-
-            cracked_cells.append(models.CrackedCell(
-                parent_cell=icell,
-                area=intersection_area,
-                keyed_values=ccell_keyed_values,
-            ))
-        return cracked_cells
+        if self.cache:
+            cache_key = get_cache_key(
+                self.get_shapefile_hash(self.grid_path),
+                self.get_shapefile_hash(self.stat_areas_path),
+                self.target_crs,
+                OVERLAY_VERSION
+            )
+            overlay = self.cache.load('overlay', cache_key)
+            if overlay is not None:
+                logger.info("loaded cached overlay")
+                return overlay
+
+        overlay = compute_overlay(self.stat_areas.values(), self.cell_index,
+                                  logger=logger,
+                                  progress=self.progress_reporter)
+
+        if self.cache:
+            path = self.cache.save('overlay', cache_key, overlay)
+            logger.info("cached overlay in '%s'" % path)
+        return overlay
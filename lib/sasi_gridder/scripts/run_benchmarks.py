@@ -0,0 +1,78 @@
+from sasi_gridder.benchmarks import (BENCHMARK_CASES, BenchmarkCase,
+                                     compare_results, load_results,
+                                     run_benchmark, save_results)
+from sasi_gridder.metrics import format_stage_metrics
+import logging
+import argparse
+import sys
+
+
+argparser = argparse.ArgumentParser(
+    description='run synthetic gridder benchmarks')
+argparser.add_argument('cases', nargs='*', default=['tiny', 'small'],
+                       help='benchmark cases, from %s' % (
+                           ', '.join(sorted(BENCHMARK_CASES.keys()))))
+argparser.add_argument('-d', '--data-dir', required=True, help=(
+    'directory for generated data, which is reused by later runs'))
+argparser.add_argument('-o', '--output', help='save results as JSON')
+argparser.add_argument('-b', '--baseline', help=(
+    'baseline results to compare with; exits with status 1 on regressions'))
+argparser.add_argument('--tolerance', type=float, default=.2, help=(
+    'fraction a stage can be slower than its baseline'))
+argparser.add_argument('--num-cells', type=int,
+                       help='override the cases\' number of cells')
+argparser.add_argument('--num-efforts', type=int,
+                       help='override the cases\' number of efforts')
+argparser.add_argument('--clean-fraction', type=float,
+                       help='override the cases\' fraction of clean efforts')
+argparser.add_argument('--stat-area-fraction', type=float, help=(
+    'override the cases\' fraction of stat-area-only efforts'))
+argparser.add_argument('-w', '--workers', type=int, default=1,
+                       help='number of worker processes')
+argparser.add_argument('--tile-size', type=float,
+                       help='grid by tiles of this size in degrees')
+argparser.add_argument('-v', '--verbose', action='store_true',
+                       help='log gridding progress')
+
+args = argparser.parse_args()
+
+logger = logging.getLogger('run_benchmarks')
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+task_logger = logging.getLogger('run_benchmarks.task')
+task_logger.propagate = args.verbose
+task_logger.addHandler(logging.NullHandler())
+task_logger.setLevel(logging.INFO)
+
+task_kwargs = {'workers': args.workers}
+if args.tile_size:
+    task_kwargs['tile_size'] = args.tile_size
+
+results = []
+for name in args.cases:
+    case_params = BENCHMARK_CASES[name].get_params()
+    for param in ['num_cells', 'num_efforts', 'clean_fraction',
+                  'stat_area_fraction']:
+        if getattr(args, param) is not None:
+            case_params[param] = getattr(args, param)
+    case = BenchmarkCase(**case_params)
+    logger.info("Running '%s'..." % name)
+    result = run_benchmark(case, args.data_dir, logger=task_logger,
+                           **task_kwargs)
+    for stage_metrics in result['metrics']['stages']:
+        logger.info(format_stage_metrics(stage_metrics))
+    results.append(result)
+
+if args.output:
+    save_results(args.output, results)
+    logger.info("Results saved to '%s'" % args.output)
+
+if args.baseline:
+    regressions = compare_results(results, load_results(args.baseline),
+                                  tolerance=args.tolerance)
+    for name, stage, baseline_time, wall_time in regressions:
+        logger.info("Regression in '%s' %s: %.2fs, baseline %.2fs" % (
+            name, stage, wall_time, baseline_time))
+    if regressions:
+        sys.exit(1)
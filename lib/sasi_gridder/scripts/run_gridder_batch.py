@@ -0,0 +1,40 @@
+from sasi_gridder.batch import BatchGridder, load_manifest
+from sasi_gridder.progress import format_progress
+import logging
+import argparse
+import json
+import sys
+
+
+argparser = argparse.ArgumentParser(
+    description='run gridding jobs against a shared grid and stat areas')
+argparser.add_argument('manifest', help='batch manifest JSON file')
+argparser.add_argument('-r', '--results', help=(
+    'write job results (status, output file, metrics) as JSON'))
+argparser.add_argument('--progress-interval', type=float, default=5.0,
+                       help='seconds between progress messages')
+
+args = argparser.parse_args()
+
+logger = logging.getLogger('run_gridder_batch')
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+def log_progress(update):
+    logger.info(format_progress(update))
+
+manifest = load_manifest(args.manifest)
+defaults = dict(manifest['defaults'])
+defaults.setdefault('progress_interval', args.progress_interval)
+defaults.setdefault('progress_listeners', [log_progress])
+
+batch = BatchGridder(manifest['grid_path'], manifest['stat_areas_path'],
+                     logger=logger, **defaults)
+results = batch.run(manifest['jobs'])
+
+if args.results:
+    with open(args.results, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+if [result for result in results if result['status'] != 'resolved']:
+    sys.exit(1)
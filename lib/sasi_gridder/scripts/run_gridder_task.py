@@ -1,4 +1,9 @@
 from sasi_gridder.sasi_gridder_task import SASIGridderTask
+from sasi_gridder.spatial_index import SPATIAL_INDEX_BACKENDS
+from sasi_gridder.parallel import WORKER_MODES
+from sasi_gridder.output import OUTPUT_FORMATS
+from sasi_gridder.profiling import PROFILERS, profile_call
+from sasi_gridder.progress import format_progress
 import logging
 import argparse
 import platform
@@ -8,15 +13,56 @@ import csv
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument('-g', '--grid', help='grid shapefile', required=True)
-argparser.add_argument('-e', '--raw-efforts', help='raw efforts csv',
-                       required=True)
+argparser.add_argument('-e', '--raw-efforts', help='raw efforts csv(s)',
+                       nargs='+', required=True)
 argparser.add_argument('-s', '--stat-areas', help='stat areas shapefile',
                        required=True)
 argparser.add_argument('-o', '--output-path', help='output path')
+argparser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                       default='csv', help='output file format')
+argparser.add_argument('--dense', action='store_true', help=(
+    'output rows whose values are all zero'))
 argparser.add_argument('-l', '--effort-limit', help='output path', type=int)
 argparser.add_argument('-m', '--mappings-file', help='mappings file')
+argparser.add_argument('--spatial-index', help='spatial index backend',
+                       choices=SPATIAL_INDEX_BACKENDS, default='strtree')
+argparser.add_argument('--position-cache-size', type=int, default=100000,
+                       help='number of effort positions to memoize, 0 to disable')
+argparser.add_argument('--position-precision', type=int,
+                       help='decimal places to round positions to for memoizing')
+argparser.add_argument('-w', '--workers', type=int, default=1,
+                       help='number of worker processes for reading efforts')
+argparser.add_argument('--distribution-workers', type=int, help=(
+    'number of workers for distributing stat area values, '
+    'defaults to --workers'))
+argparser.add_argument('--worker-mode', choices=WORKER_MODES, default='auto',
+                       help='run distribution workers as processes or threads')
+argparser.add_argument('--tile-size', type=float, help=(
+    'grid by tiles of this size in degrees, to limit memory use'))
+argparser.add_argument('--state', help=(
+    'state file for incremental gridding; only raw efforts files not '
+    'already in the state are read'))
+argparser.add_argument('--resume', metavar='DIR', help=(
+    'work dir of a failed run to resume, after its last completed stage'))
+argparser.add_argument('--no-checkpoints', action='store_true',
+                       help="don't save checkpoints after each stage")
+argparser.add_argument('--metrics', action='store_true', help=(
+    'write per-stage metrics as JSON next to the output file'))
+argparser.add_argument('--progress-interval', type=float, default=5.0,
+                       help='seconds between progress messages')
+argparser.add_argument('--profile', choices=PROFILERS, help=(
+    'profile the run with cProfile (pstats output) or by sampling stacks '
+    '(collapsed stacks output, for flamegraph tools)'))
+argparser.add_argument('--profile-out', help=(
+    'profile output path, defaults to sasi_gridder.pstats or '
+    'sasi_gridder.collapsed'))
+argparser.add_argument('--cache-dir', help='directory for cached data')
+argparser.add_argument('--no-cache', help="don't use cached data",
+                       action='store_true')
 
 args = argparser.parse_args()
+if args.tile_size and (args.state or args.resume):
+    argparser.error("--tile-size can't be used with --state or --resume")
 
 logger = logging.getLogger('run_gridder_task')
 logger.setLevel(logging.INFO)
@@ -31,13 +77,41 @@ if args.mappings_file:
 else:
     gear_mappings = None
 
+def log_progress(update):
+    logger.info(format_progress(update))
+
 task = SASIGridderTask(
     grid_path=args.grid,
     raw_efforts_path=args.raw_efforts,
     stat_areas_path=args.stat_areas,
     output_path=args.output_path,
+    output_format=args.format,
+    dense_output=args.dense,
     logger=logger,
     effort_limit=args.effort_limit,
     gear_mappings=gear_mappings,
+    spatial_index=args.spatial_index,
+    position_cache_size=args.position_cache_size,
+    position_precision=args.position_precision,
+    cache_dir=args.cache_dir,
+    use_cache=not args.no_cache,
+    workers=args.workers,
+    distribution_workers=args.distribution_workers,
+    worker_mode=args.worker_mode,
+    state_path=args.state,
+    tile_size=args.tile_size,
+    resume_dir=args.resume,
+    use_checkpoints=not args.no_checkpoints,
+    write_metrics=args.metrics,
+    progress_interval=args.progress_interval,
+    progress_listeners=[log_progress],
 )
-task.call()
+if args.profile:
+    profile_out = args.profile_out or {
+        'cprofile': 'sasi_gridder.pstats',
+        'sample': 'sasi_gridder.collapsed',
+    }[args.profile]
+    profile_call(task.call, args.profile, profile_out)
+    logger.info("Profile written to '%s'" % profile_out)
+else:
+    task.call()
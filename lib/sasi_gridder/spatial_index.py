@@ -0,0 +1,97 @@
+"""
+Spatial indexes for finding candidate cells and stat areas.
+
+Indexes provide 'items_for_point' and 'items_for_rect', as
+sasi_data's SpatialHash does. Rects are (minx, miny, maxx, maxy) tuples,
+as returned by gis_util.get_shape_mbr.
+"""
+
+from sasi_data.util.spatial_hash import SpatialHash
+import math
+
+
+class STRTree(object):
+    """
+    R-tree bulk loaded with the Sort-Tile-Recursive algorithm.
+
+    Unlike a SpatialHash the tree adapts to the size of its items, so
+    large stat areas and small cells both give short candidate lists.
+    Query results are in the order the items were given.
+    """
+
+    def __init__(self, entries, node_capacity=10):
+        """ entries is a sequence of (rect, item) pairs. """
+        self.node_capacity = node_capacity
+        nodes = [(tuple(rect), (order, item))
+                 for order, (rect, item) in enumerate(entries)]
+        self.size = len(nodes)
+        self.root = None
+        self.height = 0
+        while nodes:
+            nodes = self.pack(nodes)
+            self.height += 1
+            if len(nodes) == 1:
+                self.root = nodes[0]
+                break
+
+    def pack(self, entries):
+        """ Group entries into parent nodes, tiling by x then y. """
+        capacity = self.node_capacity
+        num_nodes = int(math.ceil(len(entries) / float(capacity)))
+        num_slices = int(math.ceil(math.sqrt(num_nodes)))
+        slice_size = num_slices * capacity
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            slice_ = sorted(entries[i:i + slice_size],
+                            key=lambda e: e[0][1] + e[0][3])
+            for j in range(0, len(slice_), capacity):
+                children = slice_[j:j + capacity]
+                rect = (
+                    min([c[0][0] for c in children]),
+                    min([c[0][1] for c in children]),
+                    max([c[0][2] for c in children]),
+                    max([c[0][3] for c in children]),
+                )
+                nodes.append((rect, children))
+        return nodes
+
+    def items_for_rect(self, rect):
+        if self.root is None:
+            return []
+        minx, miny, maxx, maxy = rect
+        found = []
+        stack = [(self.root, self.height)]
+        while stack:
+            node, depth = stack.pop()
+            for child in node[1]:
+                crect = child[0]
+                if crect[0] > maxx or crect[2] < minx \
+                   or crect[1] > maxy or crect[3] < miny:
+                    continue
+                if depth == 1:
+                    found.append(child[1])
+                else:
+                    stack.append((child, depth - 1))
+        found.sort()
+        return [item for order, item in found]
+
+    def items_for_point(self, pnt):
+        x, y = pnt
+        return self.items_for_rect((x, y, x, y))
+
+# Names of available spatial index backends.
+SPATIAL_INDEX_BACKENDS = ['strtree', 'hash']
+
+def build_spatial_index(items, backend='strtree', node_capacity=10,
+                        cell_size=.1):
+    """ Build a spatial index of items, which need an 'mbr' attribute. """
+    if backend == 'strtree':
+        return STRTree([(item.mbr, item) for item in items],
+                       node_capacity=node_capacity)
+    elif backend == 'hash':
+        index = SpatialHash(cell_size=cell_size)
+        for item in items:
+            index.add_rect(item.mbr, item)
+        return index
+    raise ValueError("Unknown spatial index backend '%s'" % backend)
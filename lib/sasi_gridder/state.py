@@ -0,0 +1,81 @@
+"""
+Saved first-pass state, for incremental gridding.
+"""
+
+import cPickle as pickle
+import os
+import tempfile
+
+
+GRIDDER_STATE_VERSION = 1
+
+class GridderState(object):
+    """
+    Value accumulators after a gridding stage, with fingerprints of the
+    inputs they were built from.
+
+    fingerprint identifies the grid, stat areas and settings the values
+    depend on. effort_files maps the content hashes of the raw effort
+    files which have been read to their paths. stage is the last
+    completed gridding stage, for states saved as checkpoints.
+    """
+
+    def __init__(self, fingerprint, effort_files, c_values, sa_values,
+                 unassigned, stage='first_pass'):
+        self.version = GRIDDER_STATE_VERSION
+        self.stage = stage
+        self.fingerprint = fingerprint
+        self.effort_files = effort_files
+        self.c_values = c_values
+        self.sa_values = sa_values
+        self.unassigned = unassigned
+
+    def can_extend(self, fingerprint, effort_hashes):
+        """
+        True if the state can be extended to the given inputs: it has the
+        same fingerprint, and every effort file it has read is still one
+        of the inputs.
+        """
+        if self.version != GRIDDER_STATE_VERSION:
+            return False
+        if self.fingerprint != fingerprint:
+            return False
+        effort_hashes = set(effort_hashes)
+        for effort_hash in self.effort_files:
+            if effort_hash not in effort_hashes:
+                return False
+        return True
+
+def save_state(path, state):
+    # Write to a temp file first, so that an interrupted save doesn't
+    # clobber an existing state file.
+    state_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    hndl, tmp_path = tempfile.mkstemp(dir=state_dir,
+                                      prefix=os.path.basename(path))
+    f = os.fdopen(hndl, 'wb')
+    try:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+def load_state(path):
+    """ Load a saved state, or None if there is no readable state. """
+    if not os.path.exists(path):
+        return None
+    try:
+        f = open(path, 'rb')
+        try:
+            state = pickle.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, AttributeError, ImportError,
+            pickle.UnpicklingError):
+        return None
+    if not isinstance(state, GridderState):
+        return None
+    return state
@@ -0,0 +1,68 @@
+from sasi_gridder.accumulators import Accumulator, KeyIndex
+import unittest
+
+
+class AccumulatorTestCase(unittest.TestCase):
+
+    def test_key_index(self):
+        keys = KeyIndex(['a', 'b'])
+        self.assertEquals(keys.intern('b'), 1)
+        self.assertEquals(keys.intern('c'), 2)
+        self.assertEquals(keys.get('d'), None)
+        self.assertEquals(list(keys), ['a', 'b', 'c'])
+
+    def test_accumulate(self):
+        effort_keys = KeyIndex()
+        acc = Accumulator(['a', 'value'], effort_keys, items=KeyIndex([1, 2]))
+        acc.add(1, ('GC10', 1.0), [1.0, 2.0])
+        acc.add(1, ('GC10', 1.0), [1.0, 0.0])
+        acc.add(2, ('GC20', 1.0), [5.0, 0.0])
+        self.assertEquals(acc.get_keyed_values(1), {
+            ('GC10', 1.0): {'a': 2.0, 'value': 2.0}})
+        self.assertEquals(acc.get_keyed_values(2), {
+            ('GC10', 1.0): {'a': 0.0, 'value': 0.0},
+            ('GC20', 1.0): {'a': 5.0, 'value': 0.0}})
+        self.assertEquals(list(acc.get_totals()), [2.0, 2.0, 5.0, 0.0])
+
+    def test_shared_effort_keys(self):
+        effort_keys = KeyIndex()
+        acc1 = Accumulator(['a'], effort_keys)
+        acc2 = Accumulator(['a'], effort_keys)
+        acc1.add('x', 'k1', [1.0])
+        acc2.add('y', 'k2', [2.0])
+        acc1.pad()
+        self.assertEquals(list(acc1.blocks[0]), [1.0, 0.0])
+        self.assertEquals(acc2.get_keyed_values('y')['k2'], {'a': 2.0})
+
+    def test_merge(self):
+        acc1 = Accumulator(['a'])
+        acc2 = Accumulator(['a'])
+        acc1.add('x', 'k1', [1.0])
+        acc2.add('y', 'k2', [2.0])
+        acc2.add('x', 'k1', [3.0])
+        acc1.merge(acc2)
+        self.assertEquals(acc1.get_keyed_values('x'),
+                          {'k1': {'a': 4.0}, 'k2': {'a': 0.0}})
+        self.assertEquals(acc1.get_keyed_values('y')['k2'], {'a': 2.0})
+
+    def test_scale(self):
+        acc = Accumulator(['a', 'value'])
+        acc.add('x', 'k1', [1.0, 2.0])
+        acc.add('y', 'k2', [3.0, 4.0])
+        acc.scale([2.0, 1.0, .5, 0.0])
+        self.assertEquals(list(acc.blocks[0]), [2.0, 2.0, 0.0, 0.0])
+        self.assertEquals(list(acc.blocks[1]), [0.0, 0.0, 1.5, 0.0])
+
+    def test_sparse_iter_values(self):
+        acc = Accumulator(['a', 'value'])
+        acc.add('x', 'k1', [1.0, 0.0])
+        acc.add('y', 'k2', [0.0, 0.0])
+        acc.pad()
+        self.assertEquals(len(list(acc.iter_values())), 4)
+        self.assertEquals(
+            [(item_id, key, list(values))
+             for item_id, key, values in acc.iter_values(sparse=True)],
+            [('x', 'k1', [1.0, 0.0])])
+
+if __name__ == '__main__':
+    unittest.main()
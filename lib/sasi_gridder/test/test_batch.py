@@ -0,0 +1,146 @@
+from sasi_gridder import sasi_gridder_task
+from sasi_gridder.batch import BatchGridder, load_manifest
+from sasi_gridder.benchmarks import BenchmarkCase, generate_case_data
+from sasi_gridder.sasi_gridder_task import SASIGridderTask
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class BatchGridderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sgBatchTest.")
+        case = BenchmarkCase('batch', num_cells=25, num_efforts=300,
+                             num_stat_areas=4)
+        self.paths = generate_case_data(case, self.tmp_dir)
+        self.mappings_path = os.path.join(self.tmp_dir, 'mappings.csv')
+        with open(self.mappings_path, 'wb') as f:
+            w = csv.writer(f)
+            w.writerow(['trip_type', 'gear_code'])
+            w.writerow(['otter', 'GC10'])
+            w.writerow(['trap', 'GC60'])
+        self.logger = logging.getLogger('test_batch')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_output(self, path):
+        with open(path) as f:
+            return sorted(csv.reader(f))
+
+    def test_load_manifest(self):
+        manifest_path = os.path.join(self.tmp_dir, 'manifest.json')
+        with open(manifest_path, 'w') as f:
+            json.dump({
+                'grid_path': 'grid.shp',
+                'stat_areas_path': 'stat_areas.shp',
+                'defaults': {'use_cache': False},
+                'jobs': [{'raw_efforts_path': ['a.csv', 'b.csv']}],
+            }, f)
+        manifest = load_manifest(manifest_path)
+        self.assertEquals(manifest['grid_path'],
+                          os.path.join(self.tmp_dir, 'grid.shp'))
+        self.assertEquals(manifest['jobs'], [{
+            'name': 'job_1',
+            'raw_efforts_path': [os.path.join(self.tmp_dir, 'a.csv'),
+                                 os.path.join(self.tmp_dir, 'b.csv')],
+        }])
+
+    def test_batch_matches_single_runs(self):
+        jobs = [
+            {'name': 'default_mappings'},
+            {'name': 'mappings_file',
+             'gear_mappings_file': self.mappings_path},
+            {'name': 'limit', 'effort_limit': 100},
+        ]
+        for job in jobs:
+            job['raw_efforts_path'] = self.paths['raw_efforts_path']
+            job['output_path'] = os.path.join(
+                self.tmp_dir, job['name'] + '.batch.csv')
+        batch = BatchGridder(self.paths['grid_path'],
+                             self.paths['stat_areas_path'],
+                             logger=self.logger, use_cache=False)
+        results = batch.run(jobs)
+        self.assertEquals([result['status'] for result in results],
+                          ['resolved'] * len(jobs))
+        task = batch.get_task(jobs[0])
+        task.stage_ingest()
+        self.assertTrue(task.cells is batch.geometry['cells'])
+        self.assertTrue(task.overlay is batch.geometry['overlay'])
+        task.release_loggers()
+
+        for job, result in zip(jobs, results):
+            kwargs = dict(job)
+            kwargs.pop('name')
+            mappings_file = kwargs.pop('gear_mappings_file', None)
+            if mappings_file:
+                kwargs['gear_mappings'] = {'otter': 'GC10', 'trap': 'GC60'}
+            kwargs['output_path'] = os.path.join(
+                self.tmp_dir, job['name'] + '.single.csv')
+            task = SASIGridderTask(
+                grid_path=self.paths['grid_path'],
+                stat_areas_path=self.paths['stat_areas_path'],
+                logger=self.logger, use_cache=False, data={}, **kwargs)
+            task.call()
+            self.assertEquals(self.read_output(result['output_file']),
+                              self.read_output(kwargs['output_path']))
+
+    def test_shapefiles_hashed_once(self):
+        hashed_paths = []
+        get_shapefile_hash = sasi_gridder_task.get_shapefile_hash
+        def counting_get_shapefile_hash(shp_path):
+            hashed_paths.append(shp_path)
+            return get_shapefile_hash(shp_path)
+        sasi_gridder_task.get_shapefile_hash = counting_get_shapefile_hash
+        try:
+            batch = BatchGridder(self.paths['grid_path'],
+                                 self.paths['stat_areas_path'],
+                                 logger=self.logger,
+                                 cache_dir=os.path.join(self.tmp_dir,
+                                                        'cache'))
+            results = batch.run([
+                {'name': 'job_%s' % i,
+                 'raw_efforts_path': self.paths['raw_efforts_path'],
+                 'output_path': os.path.join(self.tmp_dir, 'h%s.csv' % i)}
+                for i in range(3)])
+        finally:
+            sasi_gridder_task.get_shapefile_hash = get_shapefile_hash
+        self.assertEquals([result['status'] for result in results],
+                          ['resolved'] * 3)
+        self.assertEquals(sorted(hashed_paths),
+                          sorted([self.paths['grid_path'],
+                                  self.paths['stat_areas_path']]))
+
+    def test_failed_job(self):
+        batch = BatchGridder(self.paths['grid_path'],
+                             self.paths['stat_areas_path'],
+                             logger=self.logger, use_cache=False)
+        results = batch.run([
+            {'name': 'missing',
+             'raw_efforts_path': os.path.join(self.tmp_dir, 'missing.csv')},
+            {'name': 'ok', 'raw_efforts_path': self.paths['raw_efforts_path'],
+             'output_path': os.path.join(self.tmp_dir, 'ok.csv')},
+        ])
+        self.assertEquals([result['status'] for result in results],
+                          ['failed', 'resolved'])
+        self.assertTrue(results[0]['error'])
+
+    def test_release_loggers(self):
+        batch = BatchGridder(self.paths['grid_path'],
+                             self.paths['stat_areas_path'],
+                             logger=self.logger, use_cache=False)
+        batch.load_geometry()
+        num_loggers = len(logging.Logger.manager.loggerDict)
+        batch.run([{'name': 'job',
+                    'raw_efforts_path': self.paths['raw_efforts_path'],
+                    'output_path': os.path.join(self.tmp_dir, 'job.csv')}])
+        self.assertEquals(len(logging.Logger.manager.loggerDict),
+                          num_loggers)
+
+if __name__ == '__main__':
+    unittest.main()
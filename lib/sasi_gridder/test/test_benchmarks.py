@@ -0,0 +1,44 @@
+from sasi_gridder.benchmarks import (BenchmarkCase, compare_results,
+                                     get_grid_shape, run_benchmark)
+import logging
+import shutil
+import tempfile
+import unittest
+
+
+class BenchmarksTestCase(unittest.TestCase):
+
+    def test_grid_shape(self):
+        self.assertEquals(get_grid_shape(100), (10, 10))
+        self.assertEquals(get_grid_shape(90), (10, 9))
+
+    def test_compare_results(self):
+        def get_result(first_pass_time, output_time):
+            return {'case': {'name': 'tiny'}, 'metrics': {'stages': [
+                {'stage': 'first_pass', 'wall_time': first_pass_time},
+                {'stage': 'output', 'wall_time': output_time},
+            ]}}
+        baseline = [get_result(10.0, .1)]
+        self.assertEquals(compare_results([get_result(11.0, .3)], baseline),
+                          [])
+        self.assertEquals(compare_results([get_result(13.0, .1)], baseline),
+                          [('tiny', 'first_pass', 10.0, 13.0)])
+
+    def test_run_benchmark(self):
+        data_dir = tempfile.mkdtemp(prefix="sgBenchmarkTest.")
+        try:
+            case = BenchmarkCase('test', num_cells=25, num_efforts=200,
+                                 num_stat_areas=4)
+            logger = logging.getLogger('test_run_benchmark')
+            result = run_benchmark(case, data_dir, logger=logger)
+            stages = [stage_metrics['stage']
+                      for stage_metrics in result['metrics']['stages']]
+            self.assertEquals(stages, [
+                'ingest', 'first_pass', 'stat_area_distribution',
+                'unassigned_distribution', 'output'])
+            self.assertEquals(result['metrics']['stages'][1]['rows'], 200)
+        finally:
+            shutil.rmtree(data_dir)
+
+if __name__ == '__main__':
+    unittest.main()
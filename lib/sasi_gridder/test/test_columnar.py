@@ -0,0 +1,59 @@
+from sasi_gridder.columnar import ColumnarOutput, write_columnar
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class ColumnarTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'output.cols')
+        self.rows = [
+            (1, 'GC10', 2001, 1.0, 2.0),
+            (1, 'GC20', 2001, 3.0, 4.0),
+            (7, 'GC10', 2001, 5.0, 6.0),
+            (7, 'GC10', 2002, 7.0, 8.0),
+            (9, 'GC20', 2002, 9.0, 10.0),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        num_rows = write_columnar(self.path, ['gear_id', 'time'],
+                                  ['a', 'value'], iter(self.rows))
+        self.assertEquals(num_rows, len(self.rows))
+        output = ColumnarOutput(self.path)
+        try:
+            self.assertEquals(len(output), len(self.rows))
+            self.assertEquals(output.fields,
+                              ['cell_id', 'gear_id', 'time', 'a', 'value'])
+            self.assertEquals(list(output.iter_rows(batch_size=2)),
+                              self.rows)
+            self.assertEquals(output.get_column('gear_id', 1, 3),
+                              ['GC20', 'GC10'])
+            self.assertEquals(list(output.get_column('value', 3)),
+                              [8.0, 10.0])
+            self.assertEquals(
+                [len(batch) for batch in output.iter_batches(2)], [2, 2, 1])
+        finally:
+            output.close()
+
+    def test_empty(self):
+        write_columnar(self.path, ['gear_id'], ['a'], [])
+        output = ColumnarOutput(self.path)
+        try:
+            self.assertEquals(len(output), 0)
+            self.assertEquals(list(output.iter_rows()), [])
+        finally:
+            output.close()
+
+    def test_not_columnar(self):
+        with open(self.path, 'wb') as f:
+            f.write('cell_id,gear_id\n1,GC10\n')
+        self.assertRaises(ValueError, ColumnarOutput, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+from sasi_gridder.distribution import (add_deltas, get_row_chunks,
+                                       get_stat_area_deltas)
+from sasi_gridder.overlay import OverlapMatrix
+from sasi_gridder.parallel import map_in_threads
+from array import array
+import random
+import unittest
+
+
+class DistributionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.num_cells = 40
+        self.block_size = 3
+        overlay = {}
+        for sa_id in range(120):
+            cell_ids = rand.sample(range(self.num_cells), 5)
+            overlay[sa_id] = [(c, None, rand.random()) for c in cell_ids]
+        self.matrix = OverlapMatrix(overlay, range(120),
+                                    dict([(c, c) for c in
+                                          range(self.num_cells)]))
+        self.sa_blocks = [array('d', [rand.random() for j in range(3)])
+                          for sa_id in range(120)]
+        self.cell_blocks = [array('d', [rand.random() for j in range(3)])
+                            for c in range(self.num_cells)]
+        # Cells without values.
+        self.cell_blocks[0] = None
+
+    def get_chunk_deltas(self, rows):
+        return get_stat_area_deltas(self.matrix, self.sa_blocks,
+                                    self.cell_blocks, self.block_size,
+                                    rows=rows)
+
+    def sum_deltas(self, chunk_deltas):
+        deltas = {}
+        for chunk_delta in chunk_deltas:
+            add_deltas(deltas, chunk_delta)
+        return dict([(c, list(delta)) for c, delta in deltas.items()])
+
+    def test_chunks_conserve_values(self):
+        chunks = get_row_chunks(len(self.matrix), chunk_size=50)
+        self.assertEquals(chunks, [(0, 50), (50, 100), (100, 120)])
+        deltas = self.sum_deltas(map(self.get_chunk_deltas, chunks))
+        self.assertTrue(0 not in deltas)
+        distributed = sum([sum(delta) for delta in deltas.values()])
+        total = sum([sum(block) for block in self.sa_blocks])
+        self.assertAlmostEquals(distributed, total)
+
+    def test_threads_match_serial(self):
+        chunks = get_row_chunks(len(self.matrix), chunk_size=7)
+        serial = self.sum_deltas(map(self.get_chunk_deltas, chunks))
+        threaded = self.sum_deltas(
+            map_in_threads(self.get_chunk_deltas, chunks, 4))
+        self.assertEquals(serial, threaded)
+
+if __name__ == '__main__':
+    unittest.main()
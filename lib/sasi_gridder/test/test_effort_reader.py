@@ -0,0 +1,69 @@
+from sasi_gridder.effort_reader import RawEffortReader, get_shards
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class RawEffortReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sgReaderTest.")
+        self.csv_path = os.path.join(self.tmp_dir, 'raw_efforts.csv')
+        f = open(self.csv_path, 'w')
+        f.write("nemarea,trip_type,A,hours_fished,value,year,lat,lon\n")
+        f.write("1,otter,1.5,.,,2001,41.5,-70.25\n")
+        f.write(".,squid,2,3,4,2001,.,.\n")
+        f.write("2,unknown,,,,2002,42,-69\n")
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_chunks(self):
+        reader = RawEffortReader(
+            self.csv_path,
+            gear_mappings={'otter': 'GC10', 'squid': 'GC12'},
+            chunk_size=2
+        )
+        chunks = list(reader)
+        self.assertEquals([len(c) for c in chunks], [2, 1])
+
+        chunk = chunks[0]
+        self.assertEquals(chunk.gear_id, ['GC10', 'GC12'])
+        self.assertEquals(list(chunk.lat[:1]), [41.5])
+        self.assertTrue(chunk.lat[1] != chunk.lat[1])
+        self.assertEquals(chunk.get_effort_keys(),
+                          [('GC10', 2001.0), ('GC12', 2001.0)])
+        self.assertEquals(chunk.get_value_rows(['a', 'hours_fished', 'value']),
+                          [(1.5, 0.0, 0.0), (2.0, 3.0, 4.0)])
+        self.assertEquals(chunks[1].gear_id, [None])
+
+    def test_limit(self):
+        reader = RawEffortReader(self.csv_path, chunk_size=2, limit=1)
+        self.assertEquals([len(c) for c in reader], [1])
+
+    def test_blank_lines(self):
+        f = open(self.csv_path, 'a')
+        f.write("\n3,otter,1,,,2003,,\n\n")
+        f.close()
+        reader = RawEffortReader(self.csv_path,
+                                 gear_mappings={'otter': 'GC10'})
+        chunks = list(reader)
+        self.assertEquals([len(c) for c in chunks], [4])
+        self.assertTrue((None, None) not in chunks[0].get_effort_keys())
+        reader = RawEffortReader(self.csv_path, limit=4)
+        self.assertEquals(list(reader)[0].stat_area_id[3], 3.0)
+
+    def test_shards(self):
+        shards = get_shards(self.csv_path, 2)
+        self.assertEquals(len(shards), 2)
+        sizes = []
+        for byte_range in shards:
+            reader = RawEffortReader(self.csv_path, byte_range=byte_range)
+            sizes.append(sum([len(c) for c in reader]))
+        self.assertEquals(sum(sizes), 3)
+        self.assertTrue(0 not in sizes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+from sasi_gridder.geometry import (PolygonRings, point_in_ring, INSIDE,
+                                   OUTSIDE, BOUNDARY)
+import sasi_data.util.gis as gis_util
+from array import array
+import unittest
+
+
+def ring(coords):
+    return (array('d', [c[0] for c in coords]),
+            array('d', [c[1] for c in coords]))
+
+def rect_ring(x0, y0, x1, y1):
+    return ring([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)])
+
+class PointInRingTestCase(unittest.TestCase):
+
+    def test_square(self):
+        xs, ys = rect_ring(0, 0, 2, 2)
+        self.assertEquals(point_in_ring(1, 1, xs, ys), INSIDE)
+        self.assertEquals(point_in_ring(3, 1, xs, ys), OUTSIDE)
+        self.assertEquals(point_in_ring(-1, 1, xs, ys), OUTSIDE)
+        self.assertEquals(point_in_ring(1, 3, xs, ys), OUTSIDE)
+
+    def test_boundary(self):
+        xs, ys = rect_ring(0, 0, 2, 2)
+        # Vertices.
+        self.assertEquals(point_in_ring(0, 0, xs, ys), BOUNDARY)
+        self.assertEquals(point_in_ring(2, 2, xs, ys), BOUNDARY)
+        # Vertical edges.
+        self.assertEquals(point_in_ring(0, 1, xs, ys), BOUNDARY)
+        self.assertEquals(point_in_ring(2, 1, xs, ys), BOUNDARY)
+        # Horizontal edges.
+        self.assertEquals(point_in_ring(1, 0, xs, ys), BOUNDARY)
+        self.assertEquals(point_in_ring(1, 2, xs, ys), BOUNDARY)
+        # In line with an edge, but beyond it.
+        self.assertEquals(point_in_ring(3, 0, xs, ys), OUTSIDE)
+
+    def test_concave(self):
+        # A 'U' shape, with its notch open at the top.
+        xs, ys = ring([(0, 0), (3, 0), (3, 3), (2, 3), (2, 1), (1, 1),
+                       (1, 3), (0, 3), (0, 0)])
+        self.assertEquals(point_in_ring(.5, 2, xs, ys), INSIDE)
+        self.assertEquals(point_in_ring(2.5, 2, xs, ys), INSIDE)
+        self.assertEquals(point_in_ring(1.5, 2, xs, ys), OUTSIDE)
+        self.assertEquals(point_in_ring(1.5, 1, xs, ys), BOUNDARY)
+        # Level with the notch's inner vertices.
+        self.assertEquals(point_in_ring(.5, 1, xs, ys), INSIDE)
+        self.assertEquals(point_in_ring(1.5, .5, xs, ys), INSIDE)
+
+class PolygonRingsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # A square with a square hole, and a separate square.
+        self.rings = PolygonRings(None, polygons=[
+            [rect_ring(0, 0, 4, 4), rect_ring(1, 1, 2, 2)],
+            [rect_ring(5, 5, 6, 6)],
+        ])
+
+    def test_mbr(self):
+        self.assertEquals(self.rings.mbr, (0.0, 0.0, 6.0, 6.0))
+        self.assertEquals(self.rings.num_vertices, 15)
+
+    def test_holes(self):
+        self.assertTrue(self.rings.contains_point(3, 3))
+        self.assertFalse(self.rings.contains_point(1.5, 1.5))
+        # The hole's boundary is the shape's boundary.
+        self.assertTrue(self.rings.contains_point(1, 1.5))
+        self.assertTrue(self.rings.contains_point(2, 2))
+
+    def test_multipolygon(self):
+        self.assertTrue(self.rings.contains_point(5.5, 5.5))
+        self.assertTrue(self.rings.contains_point(6, 5.5))
+        self.assertFalse(self.rings.contains_point(4.5, 4.5))
+        self.assertFalse(self.rings.contains_point(7, 7))
+
+    def test_from_shape(self):
+        shape = gis_util.wkt_to_shape(
+            'POLYGON((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 2 1, 2 2, 1 2, 1 1))')
+        rings = PolygonRings(shape)
+        self.assertEquals(len(rings.polygons), 1)
+        self.assertEquals(len(rings.polygons[0]), 2)
+        self.assertEquals(rings.mbr, (0.0, 0.0, 4.0, 4.0))
+        self.assertTrue(rings.contains_point(3, 3))
+        self.assertFalse(rings.contains_point(1.5, 1.5))
+
+if __name__ == '__main__':
+    unittest.main()
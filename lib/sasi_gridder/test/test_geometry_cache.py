@@ -0,0 +1,72 @@
+from sasi_gridder.geometry_cache import GeometryCache, write_geometry_cache
+from array import array
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class GeometryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sgGeomCacheTest.")
+        self.path = os.path.join(self.tmp_dir, 'cells.geom')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def ring(self, x0, y0, x1, y1):
+        return (array('d', [x0, x1, x1, x0, x0]),
+                array('d', [y0, y0, y1, y1, y0]))
+
+    def test_round_trip(self):
+        features = [
+            (1, [[self.ring(0, 0, 1, 1)]], 1.0, (0.0, 0.0, 1.0, 1.0)),
+            ('b', [[self.ring(0, 0, 4, 4), self.ring(1, 1, 2, 2)],
+                   [self.ring(5, 5, 6, 6)]], 16.0, (0.0, 0.0, 6.0, 6.0)),
+        ]
+        f = open(self.path, 'wb')
+        write_geometry_cache(f, features)
+        f.close()
+
+        cache = GeometryCache(self.path)
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.ids, [1, 'b'])
+        self.assertEquals(list(cache.areas), [1.0, 16.0])
+        self.assertEquals(cache.get_mbr(1), (0.0, 0.0, 6.0, 6.0))
+        for i, feature in enumerate(features):
+            self.assertEquals(cache.get_polygons(i), feature[1])
+        cache.close()
+
+    def test_lazy_features(self):
+        features = [
+            (1, [[self.ring(0, 0, 1, 1)]], 1.0, (0.0, 0.0, 1.0, 1.0)),
+        ]
+        f = open(self.path, 'wb')
+        write_geometry_cache(f, features)
+        f.close()
+
+        cache = GeometryCache(self.path)
+        feature_id, prepared, area, mbr = list(cache.iter_features())[0]
+        self.assertEquals((feature_id, area, mbr),
+                          (1, 1.0, (0.0, 0.0, 1.0, 1.0)))
+        self.assertEquals(prepared.mbr, mbr)
+        # Rings and shapes are read when first used.
+        self.assertEquals(prepared._rings, None)
+        self.assertEquals(prepared._shape, None)
+        self.assertTrue(prepared.contains_point(.5, .5))
+        self.assertFalse(prepared.contains_point(1.5, .5))
+        self.assertEquals(prepared._shape, None)
+        self.assertEquals(prepared.get_polygons(), features[0][1])
+        self.assertTrue(prepared.intersects_rect((.5, .5, 2, 2)))
+        self.assertTrue(prepared._shape is not None)
+        cache.close()
+
+    def test_invalid_file(self):
+        f = open(self.path, 'wb')
+        f.write('not a cache')
+        f.close()
+        self.assertRaises(ValueError, GeometryCache, self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from sasi_gridder.geometry import PreparedShape
+from sasi_gridder.lattice import RegularLattice
+import sasi_data.util.gis as gis_util
+import unittest
+
+
+class MockCell(object):
+    def __init__(self, id, coords):
+        self.id = id
+        self.shape = gis_util.wkt_to_shape('POLYGON((%s))' % ', '.join(
+            ["%s %s" % c for c in coords]))
+        self.mbr = gis_util.get_shape_mbr(self.shape)
+        self.prepared = PreparedShape(self.shape)
+
+def rect_coords(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+
+class RegularLatticeTestCase(unittest.TestCase):
+
+    def generate_cells(self, num_cols=3, num_rows=2, size=.5, skip=[]):
+        cells = []
+        for row in range(num_rows):
+            for col in range(num_cols):
+                if (col, row) in skip:
+                    continue
+                x0 = -70 + col * size
+                y0 = 40 + row * size
+                cells.append(MockCell(
+                    id=(col, row),
+                    coords=rect_coords(x0, y0, x0 + size, y0 + size)))
+        return cells
+
+    def test_regular_lattice(self):
+        lattice = RegularLattice.from_cells(self.generate_cells())
+        self.assertTrue(lattice)
+        self.assertEquals(lattice.item_for_point((-69.9, 40.1)).id, (0, 0))
+        self.assertEquals(lattice.item_for_point((-68.6, 40.9)).id, (2, 1))
+        # Points on the lattice's outer edge are in the edge cell.
+        self.assertEquals(lattice.item_for_point((-68.5, 41.0)).id, (2, 1))
+        self.assertEquals(lattice.item_for_point((-71, 40.1)), None)
+        self.assertEquals(
+            sorted([c.id for c in lattice.items_for_rect(
+                (-69.9, 40.1, -69.4, 40.2))]),
+            [(0, 0), (1, 0)])
+
+    def test_lattice_with_holes(self):
+        lattice = RegularLattice.from_cells(
+            self.generate_cells(skip=[(1, 0)]))
+        self.assertTrue(lattice)
+        self.assertEquals(lattice.item_for_point((-69.4, 40.1)), None)
+        # Points on an edge shared with a hole are in the existing cell.
+        self.assertEquals(lattice.item_for_point((-69.5, 40.1)).id, (0, 0))
+
+    def test_irregular_grids(self):
+        # Cells of different sizes.
+        cells = self.generate_cells()
+        cells.append(MockCell(id='big', coords=rect_coords(-70, 41, -69, 42)))
+        self.assertEquals(RegularLattice.from_cells(cells), None)
+
+        # Cells which are not rectangles.
+        cells = self.generate_cells()
+        cells.append(MockCell(id='tri', coords=[
+            (-70, 41), (-69.5, 41), (-69.5, 41.5), (-70, 41)]))
+        self.assertEquals(RegularLattice.from_cells(cells), None)
+
+        # Overlapping cells.
+        cells = self.generate_cells()
+        cells.append(MockCell(id='dup', coords=rect_coords(-70, 40, -69.5,
+                                                           40.5)))
+        self.assertEquals(RegularLattice.from_cells(cells), None)
+
+if __name__ == '__main__':
+    unittest.main()
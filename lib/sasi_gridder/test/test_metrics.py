@@ -0,0 +1,61 @@
+from sasi_gridder.metrics import RunMetrics, format_stage_metrics
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class RunMetricsTestCase(unittest.TestCase):
+
+    def test_measure(self):
+        metrics = RunMetrics()
+        with metrics.measure('first_pass') as stage_metrics:
+            stage_metrics['rows'] = 100
+            time.sleep(.01)
+        stage_metrics = metrics.get_stage('first_pass')
+        self.assertEquals(stage_metrics['rows'], 100)
+        self.assertTrue(stage_metrics['wall_time'] >= .01)
+        self.assertAlmostEquals(stage_metrics['rows_per_sec'],
+                                100 / stage_metrics['wall_time'])
+        self.assertTrue(format_stage_metrics(stage_metrics).startswith(
+            "Stage 'first_pass': "))
+        self.assertEquals(metrics.get_stage('output'), None)
+
+    def test_nested_stages(self):
+        metrics = RunMetrics()
+        with metrics.measure('output'):
+            with metrics.measure('first_pass'):
+                time.sleep(.05)
+        self.assertEquals([stage_metrics['stage']
+                           for stage_metrics in metrics.stages],
+                          ['first_pass', 'output'])
+        self.assertTrue(metrics.get_stage('output')['wall_time'] < .05)
+        self.assertTrue(metrics.get_stage('first_pass')['wall_time'] >= .05)
+
+    def test_failed_stage(self):
+        metrics = RunMetrics()
+        def fail():
+            with metrics.measure('ingest'):
+                raise ValueError()
+        self.assertRaises(ValueError, fail)
+        self.assertEquals(len(metrics.stages), 1)
+
+    def test_write_json(self):
+        metrics = RunMetrics()
+        with metrics.measure('ingest') as stage_metrics:
+            stage_metrics['rows'] = 3
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'metrics.json')
+            metrics.write_json(path)
+            with open(path) as f:
+                saved = json.load(f)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEquals(saved['stages'][0]['stage'], 'ingest')
+        self.assertEquals(saved['stages'][0]['rows'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from sasi_gridder.accumulators import Accumulator
+from sasi_gridder.output import iter_batches, iter_value_rows, write_csv
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class OutputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = ['cell_id', 'gear_id', 'a', 'value']
+        self.values = Accumulator(['a', 'value'])
+        self.values.add(1, ('GC10',), [1.0, 2.0])
+        self.values.add(2, ('GC20',), [3.0, 4.0])
+        self.values.add(2, ('GC10',), [5.0, 6.0])
+
+    def test_iter_value_rows(self):
+        rows = list(iter_value_rows(self.values))
+        self.assertEquals(rows, [
+            (1, 'GC10', 1.0, 2.0),
+            (2, 'GC10', 5.0, 6.0),
+            (2, 'GC20', 3.0, 4.0),
+        ])
+
+    def test_dense_rows(self):
+        self.values.pad()
+        self.assertEquals(len(list(iter_value_rows(self.values))), 3)
+        rows = list(iter_value_rows(self.values, dense=True))
+        self.assertEquals(len(rows), 4)
+        self.assertEquals(rows[1], (1, 'GC20', 0.0, 0.0))
+
+    def test_iter_batches(self):
+        rows = list(iter_value_rows(self.values))
+        batches = list(iter_batches(iter(rows), self.fields, batch_size=2))
+        self.assertEquals([len(batch) for batch in batches], [2, 1])
+        self.assertEquals(batches[0].get_column('cell_id'), [1, 2])
+        self.assertEquals(batches[1].get_column('value'), [4.0])
+        self.assertEquals(list(iter_batches([], self.fields)), [])
+
+    def test_write_csv(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'output.csv')
+            num_rows = write_csv(path, self.fields,
+                                 iter_value_rows(self.values))
+            self.assertEquals(num_rows, 3)
+            with open(path) as f:
+                rows = list(csv.reader(f))
+            self.assertEquals(rows[0], self.fields)
+            self.assertEquals(rows[2], ['2', 'GC10', '5.0', '6.0'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
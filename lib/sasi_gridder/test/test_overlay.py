@@ -0,0 +1,37 @@
+from sasi_gridder.geometry import PreparedShape, INSIDE, BOUNDARY
+from sasi_gridder.overlay import get_overlay_entries
+from sasi_gridder.spatial_index import STRTree
+import sasi_data.util.gis as gis_util
+import unittest
+
+
+class MockShape(object):
+    def __init__(self, id, x0, y0, x1, y1):
+        self.id = id
+        self.shape = gis_util.wkt_to_shape(
+            'POLYGON((%s %s, %s %s, %s %s, %s %s, %s %s))' % (
+                x0, y0, x1, y0, x1, y1, x0, y1, x0, y0))
+        self.mbr = gis_util.get_shape_mbr(self.shape)
+        self.area = gis_util.get_shape_area(self.shape)
+        self.prepared = PreparedShape(self.shape)
+
+class OverlayTestCase(unittest.TestCase):
+
+    def test_overlay_entries(self):
+        stat_area = MockShape(1, 0, 0, 4, 4)
+        cells = [
+            MockShape('inside', 1, 1, 2, 2),
+            MockShape('boundary', 3, 3, 5, 5),
+            MockShape('outside', 6, 6, 7, 7),
+        ]
+        cell_index = STRTree([(cell.mbr, cell) for cell in cells])
+        counts = {}
+        entries = get_overlay_entries(stat_area, cell_index, counts=counts)
+        self.assertEquals(counts, {INSIDE: 1, BOUNDARY: 1})
+        self.assertEquals(entries, [
+            ('inside', 1.0, 1.0),
+            ('boundary', 1.0, .25),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
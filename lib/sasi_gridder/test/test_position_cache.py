@@ -0,0 +1,28 @@
+from sasi_gridder.position_cache import PositionCache
+import unittest
+
+
+class PositionCacheTestCase(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = PositionCache(max_size=2)
+        cache.set(cache.get_key(1, 1), 'a')
+        cache.set(cache.get_key(2, 2), 'b')
+        self.assertEquals(cache.get(cache.get_key(1, 1)), 'a')
+        cache.set(cache.get_key(3, 3), 'c')
+        # (2, 2) was least recently used.
+        self.assertEquals(cache.get(cache.get_key(2, 2)), None)
+        self.assertEquals(cache.get(cache.get_key(1, 1)), 'a')
+        self.assertEquals(cache.get(cache.get_key(3, 3)), 'c')
+        stats = cache.get_stats()
+        self.assertEquals((stats['hits'], stats['misses'], stats['size']),
+                          (3, 1, 2))
+
+    def test_quantized_keys(self):
+        cache = PositionCache(precision=2)
+        cache.set(cache.get_key(41.501, -70.249), 'a')
+        self.assertEquals(cache.get(cache.get_key(41.499, -70.251)), 'a')
+        self.assertEquals(cache.get(cache.get_key(41.52, -70.25)), None)
+
+if __name__ == '__main__':
+    unittest.main()
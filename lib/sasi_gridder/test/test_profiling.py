@@ -0,0 +1,47 @@
+from sasi_gridder.profiling import profile_call
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+
+def busy(n):
+    total = 0
+    end = time.time() + .05
+    while time.time() < end:
+        total += sum(range(n))
+    return total
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_path = os.path.join(self.tmp_dir, 'profile')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cprofile(self):
+        self.assertTrue(profile_call(busy, 'cprofile', self.out_path, 10) > 0)
+        stats = pstats.Stats(self.out_path)
+        self.assertTrue([func for func in stats.stats
+                         if func[2] == 'busy'])
+
+    def test_sample(self):
+        self.assertTrue(profile_call(busy, 'sample', self.out_path, 10) > 0)
+        with open(self.out_path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(int(count) > 0)
+        self.assertTrue([line for line in lines if 'busy (' in line])
+
+    def test_unknown_profiler(self):
+        self.assertRaises(ValueError, profile_call, busy, 'gprof',
+                          self.out_path, 10)
+
+if __name__ == '__main__':
+    unittest.main()
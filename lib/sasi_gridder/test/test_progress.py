@@ -0,0 +1,56 @@
+from sasi_gridder.progress import (ProgressReporter, format_duration,
+                                   format_progress)
+import unittest
+
+
+class ProgressReporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.updates = []
+        self.stages = [('a', 1), ('b', 3)]
+
+    def get_reporter(self, min_interval):
+        return ProgressReporter(stages=self.stages, min_interval=min_interval,
+                                listeners=[self.updates.append])
+
+    def test_overall_progress(self):
+        reporter = self.get_reporter(0)
+        reporter.start_stage('a')
+        reporter.finish_stage()
+        self.assertEquals(self.updates[-1].progress, 25.0)
+        reporter.start_stage('b', total=10, unit='efforts')
+        reporter.update(4)
+        update = self.updates[-1]
+        self.assertEquals((update.stage, update.done, update.total,
+                           update.unit), ('b', 4, 10, 'efforts'))
+        self.assertEquals(update.progress, 55.0)
+        self.assertTrue(update.rate > 0)
+        self.assertTrue(update.eta >= 0)
+        # Progress doesn't go backwards when a stage's total is reset.
+        reporter.set_total(100)
+        reporter.update(1)
+        self.assertEquals(self.updates[-1].progress, 55.0)
+        reporter.finish_stage()
+        self.assertEquals(self.updates[-1].progress, 100.0)
+
+    def test_throttling(self):
+        reporter = self.get_reporter(3600)
+        reporter.start_stage('b', total=1000)
+        for i in range(1000):
+            reporter.add()
+        reporter.finish_stage()
+        # Only the start and finish updates are sent.
+        self.assertEquals([update.done for update in self.updates],
+                          [0, 1000])
+
+    def test_format(self):
+        reporter = self.get_reporter(0)
+        reporter.start_stage('b', total=200, unit='tiles')
+        reporter.update(50)
+        self.assertTrue(format_progress(self.updates[-1]).startswith(
+            "b: 50 of 200 tiles (25.0%)"))
+        self.assertEquals(format_duration(3725), "1h02m")
+        self.assertEquals(format_duration(65), "1m05s")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
-from sasi_gridder.sasi_gridder_task import SASIGridderTask
+from sasi_gridder import sasi_gridder_task
+from sasi_gridder.benchmarks import BenchmarkCase, generate_case_data
+from sasi_gridder.columnar import ColumnarOutput
+from sasi_gridder.effort_reader import get_shards
+from sasi_gridder.sasi_gridder_task import SASIGridderTask, CHECKPOINT_FILE
 from sasi_data.util import data_generators as dg
 import sasi_data.util.shapefile as shapefile_util
 import sys
@@ -8,6 +12,7 @@ import tempfile
 import shutil
 import os
 import csv
+import gc
 import platform
 
 
@@ -168,6 +173,305 @@ class SASIGridderTestCase(unittest.TestCase):
             ]
         )
 
+    def get_task(self, **kwargs):
+        logger = logging.getLogger('test_gridder_task')
+        task_kwargs = {
+            'raw_efforts_path': self.raw_efforts_path,
+            'grid_path': self.grid_path,
+            'stat_areas_path': self.stat_areas_path,
+            'cache_dir': os.path.join(self.tmp_dir, 'cache'),
+        }
+        task_kwargs.update(kwargs)
+        return SASIGridderTask(logger=logger, data={}, **task_kwargs)
+
+    def read_output(self, output_path):
+        output_file = open(output_path, "rb")
+        reader = csv.reader(output_file)
+        reader.next()
+        results = sorted(reader)
+        output_file.close()
+        return results
+
+    def write_raw_efforts(self, name, records):
+        csv_path = os.path.join(self.tmp_dir, name)
+        csv_file = open(csv_path, "w")
+        w = csv.writer(csv_file)
+        fields = ['nemarea', 'trip_type', 'A', 'hours_fished', 'value',
+                  'year', 'lat', 'lon']
+        w.writerow(fields)
+        for r in records:
+            w.writerow([r.get(f) for f in fields])
+        csv_file.close()
+        return csv_path
+
+    def test_unassigned_distribution(self):
+        raw_efforts_path = self.write_raw_efforts('unassigned_efforts.csv', [
+            # Cell 2
+            {'lat': .5, 'lon': .5, 'A': 1, 'hours_fished': 1,
+             'trip_type': 'otter', 'year': 1},
+            # Cell 1
+            {'lat': -.5, 'lon': .5, 'A': 2, 'hours_fished': 1,
+             'trip_type': 'otter', 'year': 1},
+            # Unassigned, with totals which differ from the cells' totals.
+            {'A': 1.5, 'hours_fished': 4, 'trip_type': 'otter', 'year': 1},
+            # Unassigned, with a key which no cell has values for.
+            {'A': 5, 'trip_type': 'trap', 'year': 1},
+        ])
+        output_path = os.path.join(self.tmp_dir, "unassigned_output.csv")
+        self.get_task(raw_efforts_path=raw_efforts_path,
+                      output_path=output_path).call()
+        # Cells get unassigned values in proportion to their shares of
+        # the cells' totals: a * (1 + 1.5/3), hours_fished * (1 + 4/2).
+        self.assertEquals(
+            self.read_output(output_path),
+            [
+                ['1', 'GC10', '1.0', '3.0', '3.0', '0.0'],
+                ['2', 'GC10', '1.0', '1.5', '3.0', '0.0'],
+            ]
+        )
+
+    def test_failed_output_keeps_checkpoints(self):
+        expected_path = os.path.join(self.tmp_dir, "expected.csv")
+        self.get_task(output_path=expected_path).call()
+
+        output_path = os.path.join(self.tmp_dir, "failed_output.csv")
+        task = self.get_task(output_path=output_path)
+        def failing_write_output(rows):
+            rows.next()
+            raise IOError("disk full")
+        task.write_output = failing_write_output
+        self.assertRaises(IOError, task.call)
+        # Closing the half-consumed rows shouldn't remove the build dir.
+        gc.collect()
+        build_dir = task.build_dir
+        self.assertTrue(os.path.exists(
+            os.path.join(build_dir, CHECKPOINT_FILE)))
+
+        task = self.get_task(output_path=output_path, resume_dir=build_dir)
+        task.call()
+        self.assertEquals(self.read_output(output_path),
+                          self.read_output(expected_path))
+        self.assertFalse(os.path.exists(build_dir))
+
+
+    def get_interrupted_build_dir(self, **kwargs):
+        """ Run a task which is killed after the first pass, and return
+        its build dir. """
+        task = self.get_task(**kwargs)
+        def kill():
+            raise KeyboardInterrupt()
+        task.stage_stat_area_distribution = kill
+        self.assertRaises(KeyboardInterrupt, task.call)
+        self.assertTrue(os.path.exists(
+            os.path.join(task.build_dir, CHECKPOINT_FILE)))
+        return task.build_dir
+
+    def test_resume(self):
+        expected_path = os.path.join(self.tmp_dir, "expected.csv")
+        self.get_task(output_path=expected_path).call()
+
+        output_path = os.path.join(self.tmp_dir, "resumed_output.csv")
+        build_dir = self.get_interrupted_build_dir(output_path=output_path)
+        task = self.get_task(output_path=output_path, resume_dir=build_dir)
+        def fail():
+            self.fail("first pass ran again")
+        task.stage_first_pass = fail
+        task.call()
+        self.assertEquals(self.read_output(output_path),
+                          self.read_output(expected_path))
+
+    def test_stale_checkpoint(self):
+        raw_efforts_path = os.path.join(self.tmp_dir, "stale_efforts.csv")
+        shutil.copy(self.raw_efforts_path, raw_efforts_path)
+        build_dir = self.get_interrupted_build_dir(
+            raw_efforts_path=raw_efforts_path)
+
+        task = self.get_task(raw_efforts_path=raw_efforts_path)
+        self.assertEquals(task.load_checkpoint(build_dir), 'first_pass')
+
+        # Changed raw efforts don't match the checkpoint.
+        f = open(raw_efforts_path, 'a')
+        f.write(",otter,1,,,1,-.5,.5\n")
+        f.close()
+        task = self.get_task(raw_efforts_path=raw_efforts_path)
+        self.assertEquals(task.load_checkpoint(build_dir), None)
+
+        # Neither do other settings.
+        task = self.get_task(raw_efforts_path=self.raw_efforts_path,
+                             effort_limit=2)
+        self.assertEquals(task.load_checkpoint(build_dir), None)
+        shutil.rmtree(build_dir)
+
+    def test_cached_geometry_is_lazy(self):
+        cache_dir = os.path.join(self.tmp_dir, 'lazy_cache')
+        self.get_task(output_path=os.path.join(self.tmp_dir, "lazy.csv"),
+                      cache_dir=cache_dir).call()
+        task = self.get_task(cache_dir=cache_dir)
+        task.stage_ingest()
+        # With the overlay cached too, cached features' shapes are never
+        # built.
+        for feature in task.cells.values() + task.stat_areas.values():
+            self.assertEquals(feature.prepared._shape, None)
+        task.release_loggers()
+
+    def test_shapefiles_hashed_once(self):
+        hashed_paths = []
+        get_shapefile_hash = sasi_gridder_task.get_shapefile_hash
+        def counting_get_shapefile_hash(shp_path):
+            hashed_paths.append(shp_path)
+            return get_shapefile_hash(shp_path)
+        sasi_gridder_task.get_shapefile_hash = counting_get_shapefile_hash
+        try:
+            self.get_task(
+                output_path=os.path.join(self.tmp_dir, "hashed.csv"),
+                cache_dir=os.path.join(self.tmp_dir, 'hash_cache')).call()
+        finally:
+            sasi_gridder_task.get_shapefile_hash = get_shapefile_hash
+        self.assertEquals(sorted(hashed_paths),
+                          sorted([self.grid_path, self.stat_areas_path]))
+
+
+class GeneratedCaseTestCase(unittest.TestCase):
+    """ Tests which compare runs over a generated benchmark case. """
+
+    @classmethod
+    def setUpClass(clz):
+        clz.tmp_dir = tempfile.mkdtemp(prefix="sgCaseTest.")
+        case = BenchmarkCase('task_test', num_cells=400, num_efforts=3000,
+                             num_stat_areas=9)
+        clz.paths = generate_case_data(case, clz.tmp_dir)
+
+    @classmethod
+    def tearDownClass(clz):
+        shutil.rmtree(clz.tmp_dir)
+
+    def get_task(self, **kwargs):
+        task_kwargs = dict(self.paths)
+        task_kwargs['use_cache'] = False
+        task_kwargs.update(kwargs)
+        return SASIGridderTask(logger=logging.getLogger('test_gridder_task'),
+                               data={}, **task_kwargs)
+
+    def read_rows(self, task):
+        """ Grid with a task, and get its rows by cell id and key. """
+        rows = {}
+        for row in task.iter_rows():
+            rows[row[:3]] = row[3:]
+        return rows
+
+    def get_rows(self, **kwargs):
+        return self.read_rows(self.get_task(**kwargs))
+
+    def assertRowsEqual(self, rows, expected_rows):
+        self.assertTrue(expected_rows)
+        self.assertEquals(sorted(rows.keys()), sorted(expected_rows.keys()))
+        for key, values in rows.items():
+            for value, expected_value in zip(values, expected_rows[key]):
+                self.assertTrue(abs(value - expected_value) <=
+                                1e-9 * max(1.0, abs(expected_value)))
+
+    def test_workers(self):
+        # Shards are split at byte offsets which fall inside lines, and
+        # moved to the next line start.
+        path = self.paths['raw_efforts_path']
+        f = open(path, 'rb')
+        line_starts = set()
+        f.readline()
+        while f.readline():
+            line_starts.add(f.tell())
+        f.close()
+        shards = get_shards(path, 3)
+        self.assertEquals(len(shards), 3)
+        data_start = shards[0][0]
+        data_size = shards[-1][1] - data_start
+        mid_line_offsets = [data_start + data_size * i / 3 for i in [1, 2]]
+        self.assertFalse(set(mid_line_offsets) & line_starts)
+
+        expected_rows = self.get_rows(workers=1)
+        self.assertRowsEqual(self.get_rows(workers=3), expected_rows)
+        self.assertRowsEqual(
+            self.get_rows(workers=3, worker_mode='thread'), expected_rows)
+        self.assertRowsEqual(
+            self.get_rows(distribution_workers=3, worker_mode='thread'),
+            expected_rows)
+
+
+    def split_raw_efforts(self):
+        """ Split the raw efforts file in two. Returns the two files'
+        paths and numbers of efforts. """
+        f = open(self.paths['raw_efforts_path'], 'rb')
+        lines = f.readlines()
+        f.close()
+        header = lines[0]
+        half = len(lines) / 2
+        parts = []
+        for name, part_lines in [('a.csv', lines[1:half]),
+                                 ('b.csv', lines[half:])]:
+            path = os.path.join(self.tmp_dir, name)
+            f = open(path, 'wb')
+            f.write(header)
+            f.writelines(part_lines)
+            f.close()
+            parts.append((path, len(part_lines)))
+        return parts
+
+    def test_incremental_state(self):
+        (a_path, a_count), (b_path, b_count) = self.split_raw_efforts()
+        state_path = os.path.join(self.tmp_dir, 'state.pickle')
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        self.get_rows(raw_efforts_path=[a_path], state_path=state_path)
+
+        # Only the new file is read.
+        task = self.get_task(raw_efforts_path=[a_path, b_path],
+                             state_path=state_path)
+        rows = self.read_rows(task)
+        self.assertEquals(task.metrics.get_stage('first_pass')['rows'],
+                          b_count)
+        self.assertRowsEqual(
+            rows, self.get_rows(raw_efforts_path=[a_path, b_path]))
+
+        # A changed grid doesn't match the state, so all files are read.
+        other_case = BenchmarkCase('task_test_other_grid', num_cells=100,
+                                   num_efforts=1, num_stat_areas=9)
+        grid_path = generate_case_data(other_case, self.tmp_dir)['grid_path']
+        task = self.get_task(raw_efforts_path=[a_path, b_path],
+                             grid_path=grid_path, state_path=state_path)
+        rows = self.read_rows(task)
+        self.assertEquals(task.metrics.get_stage('first_pass')['rows'],
+                          a_count + b_count)
+        self.assertRowsEqual(
+            rows, self.get_rows(raw_efforts_path=[a_path, b_path],
+                                grid_path=grid_path))
+
+
+    def test_columnar_output(self):
+        csv_path = os.path.join(self.tmp_dir, 'output.csv')
+        self.get_task(output_path=csv_path).call()
+        csv_rows = {}
+        csv_file = open(csv_path, 'rb')
+        reader = csv.reader(csv_file)
+        reader.next()
+        for row in reader:
+            key = (int(row[0]), row[1], float(row[2]))
+            csv_rows[key] = [float(value) for value in row[3:]]
+        csv_file.close()
+
+        columnar_path = os.path.join(self.tmp_dir, 'output.cols')
+        task = self.get_task(output_path=columnar_path,
+                             output_format='columnar')
+        task.call()
+        self.assertEquals(task.data['output_file'], columnar_path)
+        output = ColumnarOutput(columnar_path)
+        try:
+            self.assertEquals(output.fields, task.get_output_fields())
+            columnar_rows = {}
+            for row in output.iter_rows():
+                columnar_rows[row[:3]] = row[3:]
+        finally:
+            output.close()
+        self.assertRowsEqual(columnar_rows, csv_rows)
+
 
 if __name__ == '__main__':
     unittest.main()
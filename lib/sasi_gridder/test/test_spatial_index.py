@@ -0,0 +1,55 @@
+from sasi_gridder.spatial_index import STRTree, build_spatial_index
+import unittest
+import random
+
+
+class MockItem(object):
+    def __init__(self, id, mbr):
+        self.id = id
+        self.mbr = mbr
+
+class STRTreeTestCase(unittest.TestCase):
+
+    def generate_items(self, n=500):
+        rnd = random.Random(0)
+        items = []
+        for i in range(n):
+            x0 = rnd.uniform(-75, -65)
+            y0 = rnd.uniform(35, 45)
+            size = rnd.choice([.01, .1, 2.0])
+            items.append(MockItem(id=i, mbr=(x0, y0, x0 + size, y0 + size)))
+        return items
+
+    def brute_force(self, items, rect):
+        return [i for i in items if not (
+            i.mbr[0] > rect[2] or i.mbr[2] < rect[0] or
+            i.mbr[1] > rect[3] or i.mbr[3] < rect[1])]
+
+    def test_items_for_rect(self):
+        items = self.generate_items()
+        tree = build_spatial_index(items, backend='strtree', node_capacity=4)
+        rnd = random.Random(1)
+        for i in range(100):
+            x0 = rnd.uniform(-76, -64)
+            y0 = rnd.uniform(34, 46)
+            rect = (x0, y0, x0 + rnd.uniform(0, 3), y0 + rnd.uniform(0, 3))
+            self.assertEquals(tree.items_for_rect(rect),
+                              self.brute_force(items, rect))
+
+    def test_items_for_point(self):
+        items = self.generate_items()
+        tree = STRTree([(i.mbr, i) for i in items])
+        for item in items[:50]:
+            pnt = (item.mbr[0], item.mbr[1])
+            self.assertEquals(tree.items_for_point(pnt),
+                              self.brute_force(items, pnt + pnt))
+
+    def test_empty_tree(self):
+        tree = STRTree([])
+        self.assertEquals(tree.items_for_point((0, 0)), [])
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, build_spatial_index, [], 'quadtree')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+from sasi_gridder.accumulators import Accumulator, KeyIndex
+from sasi_gridder.state import GridderState, load_state, save_state
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class GridderStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sgStateTest.")
+        self.path = os.path.join(self.tmp_dir, 'state.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_state(self):
+        effort_keys = KeyIndex()
+        c_values = Accumulator(['a'], effort_keys)
+        sa_values = Accumulator(['a'], effort_keys)
+        unassigned = Accumulator(['a'], effort_keys)
+        c_values.add(1, ('GC10', 2001.0), [1.0])
+        return GridderState('fp', {'h1': 'e1.csv'}, c_values, sa_values,
+                            unassigned)
+
+    def test_save_and_load(self):
+        save_state(self.path, self.get_state())
+        state = load_state(self.path)
+        self.assertEquals(state.effort_files, {'h1': 'e1.csv'})
+        self.assertEquals(state.c_values.get_keyed_values(1),
+                          {('GC10', 2001.0): {'a': 1.0}})
+        # Accumulators still share their effort keys.
+        self.assertTrue(state.sa_values.effort_keys is
+                        state.c_values.effort_keys)
+
+    def test_load_missing(self):
+        self.assertEquals(load_state(self.path), None)
+
+    def test_can_extend(self):
+        state = self.get_state()
+        self.assertTrue(state.can_extend('fp', ['h1', 'h2']))
+        self.assertFalse(state.can_extend('other_fp', ['h1', 'h2']))
+        # A file which was read has changed or been removed.
+        self.assertFalse(state.can_extend('fp', ['h2']))
+
+if __name__ == '__main__':
+    unittest.main()
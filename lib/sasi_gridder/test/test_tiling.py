@@ -0,0 +1,83 @@
+from sasi_gridder.accumulators import Accumulator
+from sasi_gridder.benchmarks import BenchmarkCase, generate_case_data
+from sasi_gridder.sasi_gridder_task import SASIGridderTask
+from sasi_gridder.tiling import TileGrid, TileSpill, split_values
+import logging
+import unittest
+import tempfile
+import shutil
+
+
+class TilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sgTilingTest.")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_tile_grid(self):
+        grid = TileGrid(.5)
+        self.assertEquals(grid.get_tile(.25, -.25), (0, -1))
+        self.assertEquals(grid.get_tile(float('nan'), 1), None)
+        self.assertEquals(grid.get_rect((1, -1)), (.5, -.5, 1.0, 0.0))
+        self.assertEquals(len(grid.get_neighbours((0, 0), 1)), 9)
+
+    def test_spill(self):
+        spill = TileSpill(self.tmp_dir, 'test')
+        spill.append((0, 1), 'a')
+        spill.append(None, 'b')
+        spill.append((0, 1), 'c')
+        self.assertEquals(spill.get_sorted_tiles(), [None, (0, 1)])
+        self.assertEquals(list(spill.iter_values((0, 1))), ['a', 'c'])
+        spill.remove((0, 1))
+        self.assertEquals(list(spill.iter_values((0, 1))), [])
+
+    def test_split_values(self):
+        values = Accumulator(['a'])
+        values.add('x', 'k1', [1.0])
+        values.add('y', 'k1', [2.0])
+        parts = split_values(values, {'x': (0, 0), 'y': (1, 0)})
+        self.assertEquals(parts[(0, 0)].get_keyed_values('x'),
+                          {'k1': {'a': 1.0}})
+        self.assertEquals(parts[(1, 0)].get_keyed_values('y'),
+                          {'k1': {'a': 2.0}})
+
+    def get_rows(self, paths, **kwargs):
+        kwargs.update(paths)
+        task = SASIGridderTask(logger=logging.getLogger('test_tiling'),
+                               data={}, use_cache=False, **kwargs)
+        rows = {}
+        for row in task.iter_rows():
+            rows[row[:3]] = row[3:]
+        return rows
+
+    def test_untiled_options(self):
+        paths = {'grid_path': 'grid.shp', 'stat_areas_path': 'sa.shp',
+                 'raw_efforts_path': 'efforts.csv'}
+        for kwargs in [{'state_path': 'state.pickle'},
+                       {'resume_dir': self.tmp_dir}]:
+            kwargs.update(paths)
+            self.assertRaises(ValueError, SASIGridderTask,
+                              logger=logging.getLogger('test_tiling'),
+                              data={}, tile_size=1.0, **kwargs)
+
+    def test_tiled_rows_match_untiled_rows(self):
+        # 20x20 cells of .5 degrees. Stat area edges crack cells, and
+        # tiles which aren't multiples of the cell size split cells and
+        # stat areas along their edges.
+        case = BenchmarkCase('tiling', num_cells=400, num_efforts=2000,
+                             num_stat_areas=9)
+        paths = generate_case_data(case, self.tmp_dir)
+        expected_rows = self.get_rows(paths)
+        self.assertTrue(expected_rows)
+        for tile_size in [1.7, 2.5, 4.0, 20.0]:
+            rows = self.get_rows(paths, tile_size=tile_size)
+            self.assertEquals(sorted(rows.keys()),
+                              sorted(expected_rows.keys()))
+            for key, values in rows.items():
+                for value, expected_value in zip(values, expected_rows[key]):
+                    self.assertAlmostEqual(value, expected_value, places=6)
+
+if __name__ == '__main__':
+    unittest.main()
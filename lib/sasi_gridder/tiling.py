@@ -0,0 +1,395 @@
+"""
+Tiled gridding, for grids too large to hold in memory at once.
+
+The grid is split into square tiles. Cells and raw efforts are first
+bucketed into per-tile spill files, and then tiles are gridded one at a
+time, with only the cells around the tile loaded. Values which depend on
+more than one tile are reconciled between passes over the tiles:
+
+    - efforts in one tile can land in cells owned by a neighbouring tile,
+    - stat areas' cracked cell totals sum over all the tiles they cover,
+    - unassigned values are distributed by all-cell totals.
+
+Stat areas, and the stat area and unassigned values, are small and are
+kept in memory throughout.
+"""
+
+from sasi_gridder import models as models
+from sasi_gridder.accumulators import Accumulator, KeyIndex
+from sasi_gridder.distribution import get_ccell_totals, get_stat_area_deltas
+from sasi_gridder.geometry import PolygonRings, PreparedShape
+from sasi_gridder.output import iter_value_rows
+from sasi_gridder.overlay import OverlapMatrix, get_overlay_entries
+from sasi_gridder.spatial_index import build_spatial_index
+import sasi_data.util.gis as gis_util
+
+from array import array
+from itertools import izip
+import cPickle as pickle
+import math
+import os
+
+
+class TileGrid(object):
+    """ Square tiles of a given size in CRS units, aligned on the origin. """
+
+    def __init__(self, tile_size):
+        self.tile_size = float(tile_size)
+
+    def get_tile(self, x, y):
+        """ Get the (col, row) of the tile containing a point, or None for
+        missing (None or NaN) positions. """
+        if x is None or y is None or x != x or y != y:
+            return None
+        return (int(math.floor(x / self.tile_size)),
+                int(math.floor(y / self.tile_size)))
+
+    def get_rect(self, tile):
+        col, row = tile
+        size = self.tile_size
+        return (col * size, row * size, (col + 1) * size, (row + 1) * size)
+
+    def get_neighbours(self, tile, radius):
+        """ Get the tiles within radius tiles of a tile, including it. """
+        col, row = tile
+        return [(col + i, row + j)
+                for i in range(-radius, radius + 1)
+                for j in range(-radius, radius + 1)]
+
+class TileSpill(object):
+    """
+    Values appended to one spill file per tile, and read back a tile at
+    a time. Tile None holds values which are not in any tile.
+    """
+
+    def __init__(self, spill_dir, name):
+        self.spill_dir = spill_dir
+        self.name = name
+        self.tiles = set()
+        if not os.path.exists(spill_dir):
+            os.makedirs(spill_dir)
+
+    def get_path(self, tile):
+        if tile is None:
+            tile_name = 'none'
+        else:
+            tile_name = "%s_%s" % tile
+        return os.path.join(self.spill_dir,
+                            "%s.%s.pickle" % (self.name, tile_name))
+
+    def append(self, tile, value):
+        f = open(self.get_path(tile), 'ab')
+        try:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        self.tiles.add(tile)
+
+    def iter_values(self, tile):
+        if tile not in self.tiles:
+            return
+        f = open(self.get_path(tile), 'rb')
+        try:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+        finally:
+            f.close()
+
+    def remove(self, tile):
+        if tile in self.tiles:
+            os.remove(self.get_path(tile))
+            self.tiles.remove(tile)
+
+    def get_sorted_tiles(self):
+        tiles = sorted([tile for tile in self.tiles if tile is not None])
+        if None in self.tiles:
+            tiles.insert(0, None)
+        return tiles
+
+class CellSpillWriter(object):
+    """
+    Mapping which ingested cells can be written to, as to a dict. Cells
+    are appended to the spill of the tile containing the center of their
+    mbr, which is the tile that owns them, rather than kept in memory.
+    """
+
+    def __init__(self, tile_grid, spill):
+        self.tile_grid = tile_grid
+        self.spill = spill
+        self.count = 0
+        # Largest cell width or height, which sets how far from its own
+        # tile a cell can reach.
+        self.max_extent = 0.0
+
+    def __setitem__(self, cell_id, cell):
+        area = gis_util.get_shape_area(cell.shape)
+        mbr = gis_util.get_shape_mbr(cell.shape)
+        polygons = PolygonRings(cell.shape).polygons
+        tile = self.tile_grid.get_tile((mbr[0] + mbr[2])/2.0,
+                                       (mbr[1] + mbr[3])/2.0)
+        self.spill.append(tile, (cell_id, polygons, area, mbr))
+        self.max_extent = max(self.max_extent, mbr[2] - mbr[0],
+                              mbr[3] - mbr[1])
+        self.count += 1
+
+def split_values(values, owners):
+    """
+    Split an accumulator's values into one accumulator per owner of
+    its items. owners maps item ids to owners.
+    """
+    parts = {}
+    for item_id, block in izip(values.items.keys, values.blocks):
+        if block is None:
+            continue
+        owner = owners[item_id]
+        part = parts.get(owner)
+        if part is None:
+            part = parts[owner] = Accumulator(values.value_attrs,
+                                              values.effort_keys)
+        part.blocks[part.get_item_idx(item_id)] = block
+    return parts
+
+def add_block(totals, block):
+    for j in xrange(len(block)):
+        totals[j] += block[j]
+
+class TiledGridder(object):
+    """
+    Runs a SASIGridderTask's gridding one tile at a time.
+
+    Uses the task's stat areas, effort keys, stat area and unassigned
+    values, and its first pass. The task's cells and cell values are
+    swapped for each tile's during the first pass.
+    """
+
+    def __init__(self, task, spill_dir, logger):
+        self.task = task
+        self.logger = logger
+        self.tile_grid = TileGrid(task.tile_size)
+        self.cell_spill = TileSpill(spill_dir, 'cells')
+        self.effort_spill = TileSpill(spill_dir, 'efforts')
+        self.value_spill = TileSpill(spill_dir, 'values')
+        self.merged_spill = TileSpill(spill_dir, 'merged')
+        self.distributed_spill = TileSpill(spill_dir, 'distributed')
+
+    def run(self):
+        """
+        Grid up to the unassigned value distribution, which is done as
+        rows are read from iter_rows(). Cells must have been spilled with
+        spill_cells().
+        """
+        metrics = self.task.metrics
+        progress = self.task.progress_reporter
+        progress.start_stage('first_pass')
+        with metrics.measure('first_pass') as stage_metrics:
+            stage_metrics['rows'] = self.spill_efforts()
+            self.first_pass()
+        progress.finish_stage()
+        progress.start_stage('stat_area_distribution')
+        with metrics.measure('stat_area_distribution') as stage_metrics:
+            ccell_totals = self.merge_values()
+            self.totals = self.distribute_stat_area_values(ccell_totals)
+            stage_metrics['rows'] = len(ccell_totals)
+        progress.finish_stage()
+
+    def spill_cells(self):
+        """ Bucket cells by the tiles which own them. """
+        task = self.task
+        writer = CellSpillWriter(self.tile_grid, self.cell_spill)
+        task.read_features(writer, task.grid_path, models.Cell, 'ID',
+                           self.logger)
+        # Number of tiles around a tile which can hold cells reaching
+        # into it.
+        self.cell_radius = int(math.ceil(
+            writer.max_extent / self.tile_grid.tile_size))
+        self.logger.info("%s cells in %s tiles" % (
+            writer.count, len(self.cell_spill.tiles)))
+        return writer.count
+
+    def spill_efforts(self):
+        """ Bucket raw efforts by the tiles containing their positions. """
+        task = self.task
+        get_tile = self.tile_grid.get_tile
+        progress = task.progress_reporter
+        file_sizes = [os.path.getsize(path)
+                      for path in task.raw_efforts_paths]
+        progress.set_total(sum(file_sizes), unit='bytes')
+        effort_counter = 0
+        bytes_done = 0
+        for path, file_size in izip(task.raw_efforts_paths, file_sizes):
+            limit = None
+            if task.effort_limit:
+                limit = task.effort_limit - effort_counter
+                if limit <= 0:
+                    break
+            reader = task.get_effort_reader(path, limit=limit)
+            for chunk in reader:
+                tile_idxs = {}
+                for i, (lat, lon) in enumerate(izip(chunk.lat, chunk.lon)):
+                    tile_idxs.setdefault(get_tile(lon, lat), []).append(i)
+                for tile, idxs in tile_idxs.items():
+                    self.effort_spill.append(tile, chunk.take(idxs))
+                effort_counter += len(chunk)
+                progress.update(bytes_done + reader.position)
+            bytes_done += file_size
+        self.logger.info("%s efforts in %s tiles" % (
+            effort_counter, len(self.effort_spill.tiles)))
+        return effort_counter
+
+    def load_cells(self, tiles, rect=None):
+        """
+        Load cells owned by tiles, optionally only those intersecting
+        rect. Returns a dict of cells by id, and a dict of their owners.
+        """
+        cells = {}
+        owners = {}
+        for tile in tiles:
+            for cell_id, polygons, area, mbr in \
+                    self.cell_spill.iter_values(tile):
+                if rect and (mbr[0] > rect[2] or mbr[2] < rect[0]
+                             or mbr[1] > rect[3] or mbr[3] < rect[1]):
+                    continue
+                cells[cell_id] = models.Cell(
+                    id=cell_id, area=area, mbr=mbr,
+                    prepared=PreparedShape(polygons=polygons))
+                owners[cell_id] = tile
+        return cells, owners
+
+    def first_pass(self):
+        """
+        Run the task's first pass on each tile's efforts, with the cells
+        which reach into the tile. Cell values are spilled to the tiles
+        which own the cells.
+        """
+        task = self.task
+        cache_hits = 0
+        cache_misses = 0
+        tiles = self.effort_spill.get_sorted_tiles()
+        task.progress_reporter.set_total(len(tiles), unit='tiles')
+        for tile in tiles:
+            if tile is None:
+                cells, owners = {}, {}
+            else:
+                cells, owners = self.load_cells(
+                    self.tile_grid.get_neighbours(tile, self.cell_radius),
+                    rect=self.tile_grid.get_rect(tile))
+            task.cells = cells
+            task.index_cells()
+            task.c_values = Accumulator(task.value_attrs, task.effort_keys,
+                                        items=KeyIndex(cells.keys()))
+            task.init_position_cache()
+            for chunk in self.effort_spill.iter_values(tile):
+                task.first_pass(chunk)
+            self.effort_spill.remove(tile)
+            for owner, values in split_values(task.c_values, owners).items():
+                self.value_spill.append(owner, values)
+            if task.position_cache:
+                cache_hits += task.position_cache.hits
+                cache_misses += task.position_cache.misses
+            task.progress_reporter.add()
+
+        task.cells = {}
+        task.c_values = None
+        if task.position_cache:
+            task.position_cache.hits = cache_hits
+            task.position_cache.misses = cache_misses
+
+    def merge_values(self):
+        """
+        Merge each tile's cell values, overlay its cells with the stat
+        areas, and total the stat areas' cracked cell values over all
+        tiles. Returns a dict of stat area id -> totals block.
+        """
+        task = self.task
+        block_size = len(task.effort_keys) * len(task.value_attrs)
+        ccell_totals = {}
+        tiles = self.value_spill.get_sorted_tiles()
+        task.progress_reporter.set_total(len(tiles), unit='tiles')
+        for tile in tiles:
+            cells, owners = self.load_cells([tile])
+            values = Accumulator(task.value_attrs, task.effort_keys,
+                                 items=KeyIndex(cells.keys()))
+            for part in self.value_spill.iter_values(tile):
+                values.merge(part)
+            self.value_spill.remove(tile)
+            values.pad()
+
+            overlay = {}
+            cell_index = build_spatial_index(cells.values(),
+                                             backend=task.spatial_index)
+            cells_rect = (
+                min([cell.mbr[0] for cell in cells.values()]),
+                min([cell.mbr[1] for cell in cells.values()]),
+                max([cell.mbr[2] for cell in cells.values()]),
+                max([cell.mbr[3] for cell in cells.values()]),
+            )
+            for stat_area in task.sa_index.items_for_rect(cells_rect):
+                entries = get_overlay_entries(stat_area, cell_index)
+                if entries:
+                    overlay[stat_area.id] = entries
+
+            matrix = OverlapMatrix(overlay, sorted(overlay.keys()),
+                                   values.items.idxs)
+            for sa_id, row_totals in izip(
+                matrix.sa_ids,
+                get_ccell_totals(matrix, values.blocks, block_size)):
+                if sa_id not in ccell_totals:
+                    ccell_totals[sa_id] = row_totals
+                else:
+                    add_block(ccell_totals[sa_id], row_totals)
+            self.merged_spill.append(tile, (values, overlay))
+            task.progress_reporter.add()
+        return ccell_totals
+
+    def distribute_stat_area_values(self, ccell_totals):
+        """
+        Distribute stat area values to each tile's cells. Returns the
+        all-cell totals block.
+        """
+        task = self.task
+        sa_values = task.sa_values
+        sa_values.pad()
+        totals = array('d', [0.0]) * sa_values.block_size
+        tiles = self.merged_spill.get_sorted_tiles()
+        task.progress_reporter.set_total(len(tiles), unit='tiles')
+        for tile in tiles:
+            for values, overlay in self.merged_spill.iter_values(tile):
+                matrix = OverlapMatrix(overlay, sorted(overlay.keys()),
+                                       values.items.idxs)
+                sa_blocks = [
+                    sa_values.get_block(sa_values.get_item_idx(sa_id),
+                                        create=False)
+                    for sa_id in matrix.sa_ids]
+                deltas = get_stat_area_deltas(
+                    matrix, sa_blocks, values.blocks, values.block_size,
+                    ccell_totals=[ccell_totals[sa_id]
+                                  for sa_id in matrix.sa_ids])
+                for c, delta in deltas.items():
+                    values.add_block(c, delta)
+                add_block(totals, values.get_totals())
+                self.distributed_spill.append(tile, values)
+            self.merged_spill.remove(tile)
+            task.progress_reporter.add()
+        return totals
+
+    def iter_rows(self):
+        """
+        Distribute unassigned values to each tile's cells, and yield the
+        tile's gridded rows.
+        """
+        factors = self.task.get_unassigned_factors(self.totals,
+                                                   logger=self.logger)
+        progress = self.task.progress_reporter
+        tiles = self.distributed_spill.get_sorted_tiles()
+        progress.set_total(len(tiles), unit='tiles')
+        for tile in tiles:
+            for values in self.distributed_spill.iter_values(tile):
+                values.scale(factors)
+                for row in iter_value_rows(values,
+                                           dense=self.task.dense_output):
+                    yield row
+            self.distributed_spill.remove(tile)
+            progress.add()